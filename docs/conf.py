@@ -25,6 +25,7 @@
 from __future__ import print_function
 
 import os
+import sys
 
 import sphinx.environment
 
@@ -333,3 +334,20 @@ intersphinx_mapping = {'https://docs.python.org/': None}
 
 # Autodoc configuraton.
 autoclass_content = 'both'
+
+
+# The asyncio engine can only be imported on Python 3.6 and later.
+AIO_MODULE = '.. automodule:: invenio_oaiharvester.aio\n   :members:\n'
+
+
+def skip_aio_module(app, docname, source):
+    """Do not document the asyncio engine where it cannot be imported."""
+    if docname == 'api' and sys.version_info < (3, 6):
+        source[0] = source[0].replace(
+            AIO_MODULE, 'The asyncio engine requires Python 3.6 or later.\n'
+        )
+
+
+def setup(app):
+    """Register the documentation hooks."""
+    app.connect('source-read', skip_aio_module)
@@ -0,0 +1,315 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Asyncio engine to harvest many OAI-PMH requests in one event loop.
+
+The coroutines of this module are the ``asyncio`` equivalents of
+:func:`invenio_oaiharvester.api.list_records` and
+:func:`invenio_oaiharvester.api.get_records`, and return the same Sickle
+record objects. They require Python 3.6+ and ``aiohttp``, installed with
+``pip install invenio-oaiharvester[aio]``, and an application context.
+
+The requests go through the same limits as the ones of the API: they are
+sent within the :class:`~invenio_oaiharvester.governor.EndpointGovernor` of
+the endpoint host, retried with the policy of ``OAIHARVESTER_RETRY_*``, and
+the number of requests in flight is capped by
+``OAIHARVESTER_MAX_CONCURRENCY_PER_HOST``. They are counted in the ``stats``
+of the :class:`~invenio_oaiharvester.client.OAIHarvesterClient` of the
+endpoint, which can be passed as ``client``.
+
+Share a session to harvest several endpoints concurrently:
+
+.. code-block:: python
+
+    import asyncio
+
+    import aiohttp
+    from invenio_oaiharvester import aio
+
+    async def harvest():
+        async with aiohttp.ClientSession() as session:
+            return await asyncio.gather(
+                aio.list_records(url='http://export.arxiv.org/oai2',
+                                 metadata_prefix='arXiv',
+                                 setspecs='cs physics', session=session),
+                aio.get_records(['oai:inspirehep.net:1'],
+                                url='https://inspirehep.net/oai2d',
+                                session=session),
+            )
+
+    with app.app_context():
+        arxiv_records, inspire_records = asyncio.get_event_loop() \
+            .run_until_complete(harvest())
+"""
+
+import asyncio
+from functools import partial
+
+import aiohttp
+from flask import current_app
+from lxml import etree
+from sickle.oaiexceptions import NoRecordsMatch
+from sickle.response import XMLParser
+
+from .client import create_client, parse_retry_after
+from .utils import parse_response
+
+
+async def fetch(session, client, params, semaphore):
+    """Issue an OAI-PMH request and return the parsed response.
+
+    :param session: The :class:`aiohttp.ClientSession` to use.
+    :param client: The :class:`~invenio_oaiharvester.client.OAIHarvesterClient`
+                   of the endpoint, whose governor and retry policy are used.
+    :param params: The OAI-PMH arguments, including the ``verb``.
+    :param semaphore: Semaphore limiting the number of requests in flight.
+    """
+    params = {k: v for k, v in params.items() if v is not None}
+    attempt = 1
+    async with semaphore:
+        while True:
+            try:
+                response, content = await _governed_get(
+                    session, client, params
+                )
+            except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                if attempt >= client.retry_attempts:
+                    client.stats.incr('failures')
+                    raise
+                delay = client._backoff(attempt)
+            else:
+                if response.status not in client.retry_status_codes:
+                    break
+                if attempt >= client.retry_attempts:
+                    client.stats.incr('failures')
+                    break
+                delay = parse_retry_after(
+                    response.headers.get('Retry-After')
+                )
+                if delay is None:
+                    delay = client._backoff(attempt)
+            delay = min(delay, client.retry_max_delay)
+            client.stats.incr('retries')
+            client.stats.incr('sleep_time', delay)
+            await asyncio.sleep(delay)
+            attempt += 1
+
+    response.raise_for_status()
+    return etree.XML(content, parser=XMLParser)
+
+
+async def _governed_get(session, client, params):
+    """Send a request within the limits of the governor of a client."""
+    governor = client.governor
+    if governor is None:
+        return await _get(session, client, params)
+
+    # Waiting for the governor blocks, so it is done in a thread
+    slot = governor.slot()
+    entered = asyncio.get_event_loop().run_in_executor(None, slot.__enter__)
+    try:
+        waited = await asyncio.shield(entered)
+    except asyncio.CancelledError:
+        entered.add_done_callback(partial(_release_slot, slot))
+        raise
+    client.stats.incr('governor_wait', waited)
+    try:
+        return await _get(session, client, params)
+    finally:
+        slot.__exit__(None, None, None)
+
+
+def _release_slot(slot, entered):
+    """Release a slot taken after its request was cancelled."""
+    if not entered.cancelled() and entered.exception() is None:
+        slot.__exit__(None, None, None)
+
+
+async def _get(session, client, params):
+    """Send a request and return the response with its content."""
+    async with session.get(client.endpoint, params=params) as response:
+        content = await response.read()
+    client.stats.incr('requests')
+    return response, content
+
+
+async def iter_pages(session, client, params, semaphore):
+    """Yield the items of each page of an OAI-PMH list request.
+
+    :param session: The :class:`aiohttp.ClientSession` to use.
+    :param client: The :class:`~invenio_oaiharvester.client.OAIHarvesterClient`
+                   of the endpoint.
+    :param params: The OAI-PMH arguments, including the ``verb``.
+    :param semaphore: Semaphore limiting the number of requests in flight.
+    """
+    verb = params['verb']
+    while True:
+        items, token = parse_response(
+            await fetch(session, client, params, semaphore), verb
+        )
+        yield items
+        if token is None:
+            return
+        params = {'verb': verb, 'resumptionToken': token}
+
+
+async def iter_records(url, metadata_prefix=None, from_date=None,
+                       until_date=None, setspecs=None, session=None,
+                       concurrency=4, maxsize=10, client=None):
+    """Yield the records of every set, harvested concurrently.
+
+    Records that are part of several sets are only returned once.
+
+    :param url: The url of the endpoint.
+    :param metadata_prefix: The prefix for the metadata return
+                            (defaults to 'oai_dc').
+    :param from_date: The lower bound date for the harvesting (optional).
+    :param until_date: The upper bound date for the harvesting (optional).
+    :param setspecs: The 'set' criteria for the harvesting (optional).
+    :param session: The :class:`aiohttp.ClientSession` to use (optional).
+    :param concurrency: The maximum number of requests in flight.
+    :param maxsize: The maximum number of pages waiting to be consumed.
+    :param client: The :class:`~invenio_oaiharvester.client.OAIHarvesterClient`
+                   of the endpoint (defaults to a new one).
+    """
+    client = client or create_client(url)
+    async with _SessionScope(session) as session:
+        semaphore = _semaphore(concurrency)
+        pages = asyncio.Queue(maxsize=maxsize)
+
+        async def harvest_set(spec):
+            params = {
+                'verb': 'ListRecords',
+                'metadataPrefix': metadata_prefix or 'oai_dc',
+                'from': from_date,
+                'until': until_date,
+                'set': spec,
+            }
+            try:
+                async for items in iter_pages(session, client, params,
+                                              semaphore):
+                    await pages.put(items)
+            except NoRecordsMatch:
+                pass
+            except Exception as exc:
+                await pages.put(exc)
+            await pages.put(None)
+
+        tasks = [
+            asyncio.ensure_future(harvest_set(spec))
+            for spec in (setspecs or '').split() or [None]
+        ]
+        running = len(tasks)
+        seen = set()
+        try:
+            while running:
+                items = await pages.get()
+                if items is None:
+                    running -= 1
+                    continue
+                if isinstance(items, Exception):
+                    raise items
+                for record in items:
+                    identifier = record.header.identifier
+                    if identifier not in seen:
+                        seen.add(identifier)
+                        yield record
+        finally:
+            for task in tasks:
+                task.cancel()
+
+
+async def list_records(url, metadata_prefix=None, from_date=None,
+                       until_date=None, setspecs=None, session=None,
+                       concurrency=4, client=None):
+    """Harvest multiple records from an OAI repo.
+
+    See :func:`iter_records` for the parameters.
+
+    :return: list of harvested records
+    """
+    return [
+        record async for record in iter_records(
+            url, metadata_prefix=metadata_prefix, from_date=from_date,
+            until_date=until_date, setspecs=setspecs, session=session,
+            concurrency=concurrency, client=client,
+        )
+    ]
+
+
+async def get_records(identifiers, url, metadata_prefix=None, session=None,
+                      concurrency=10, client=None):
+    """Harvest specific records from an OAI repo via OAI-PMH identifiers.
+
+    The ``GetRecord`` requests are issued concurrently.
+
+    :param identifiers: list of unique identifiers for records to be harvested.
+    :param url: The url of the endpoint.
+    :param metadata_prefix: The prefix for the metadata return
+                            (defaults to 'oai_dc').
+    :param session: The :class:`aiohttp.ClientSession` to use (optional).
+    :param concurrency: The maximum number of requests in flight.
+    :param client: The :class:`~invenio_oaiharvester.client.OAIHarvesterClient`
+                   of the endpoint (defaults to a new one).
+    :return: list of harvested records, in the order of the identifiers
+    """
+    client = client or create_client(url)
+    async with _SessionScope(session) as session:
+        semaphore = _semaphore(concurrency)
+
+        async def get_record(identifier):
+            params = {
+                'verb': 'GetRecord',
+                'identifier': identifier,
+                'metadataPrefix': metadata_prefix or 'oai_dc',
+            }
+            items, _ = parse_response(
+                await fetch(session, client, params, semaphore), 'GetRecord'
+            )
+            return items[0]
+
+        return list(await asyncio.gather(
+            *[get_record(identifier) for identifier in identifiers]
+        ))
+
+
+def _semaphore(concurrency):
+    """Return the semaphore capping the number of requests in flight."""
+    return asyncio.Semaphore(min(
+        concurrency or 1,
+        current_app.config['OAIHARVESTER_MAX_CONCURRENCY_PER_HOST']
+    ))
+
+
+class _SessionScope(object):
+    """Use the given session, or a new one closed on exit."""
+
+    def __init__(self, session):
+        self.session = session
+        self.owned = session is None
+
+    async def __aenter__(self):
+        if self.owned:
+            self.session = aiohttp.ClientSession()
+        return self.session
+
+    async def __aexit__(self, *args):
+        if self.owned:
+            await self.session.close()
@@ -35,19 +35,41 @@ API:
 from __future__ import absolute_import, print_function
 
 import datetime
+import itertools
+import uuid
+from functools import partial
 
+from flask import current_app
 from invenio_db import db
-from sickle import Sickle
-from sickle.oaiexceptions import NoRecordsMatch
+from lxml import etree
+from sickle.models import Identify
+from sickle.oaiexceptions import BadResumptionToken, IdDoesNotExist, \
+    NoRecordsMatch
+from sickle.response import XMLParser
 
+from .client import create_client
+from .concurrency import iter_ordered, iter_parallel
+from .dedup import create_dedup_store
 from .errors import NameOrUrlMissing, WrongDateCombination
-from .utils import get_oaiharvest_object
+from .models import OAIHarvestCheckpoint, OAIHarvestRecord
+from .utils import DAY_GRANULARITY, SECONDS_GRANULARITY, format_datestamp, \
+    get_oaiharvest_object, parse_datestamp, parse_response, \
+    plan_date_windows, record_fingerprint
 
 
 def list_records(metadata_prefix=None, from_date=None, until_date=None,
-                 url=None, name=None, setspecs=None, encoding=None):
+                 url=None, name=None, setspecs=None, encoding=None,
+                 stream=False, dedup_store=None, concurrency=1,
+                 partitions=1, resume=False, prefetch=0, headers_first=False,
+                 skip_unchanged=False):
     """Harvest multiple records from an OAI repo.
 
+    When harvesting a configuration without dates, the records are harvested
+    from its ``lastrun``, with the granularity of the repository (to the
+    second if supported). The ``lastrun`` is then updated to the latest
+    datestamp of the harvested records (or the start of the harvest if it is
+    earlier), so that records stamped during the harvest are not missed.
+
     :param metadata_prefix: The prefix for the metadata return
                             (defaults to 'oai_dc').
     :param from_date: The lower bound date for the harvesting (optional).
@@ -58,11 +80,60 @@ def list_records(metadata_prefix=None, from_date=None, until_date=None,
     :param setspecs: The 'set' criteria for the harvesting (optional).
     :param encoding: Override the encoding returned by the server. ISO-8859-1
                      if it is not provided by the server.
-    :return: request object, list of harvested records
+    :param stream: If ``True``, return the :class:`HarvestedRecords` to
+                   iterate over as they are harvested instead of a list. The
+                   ``lastrun`` of the configuration is only updated once all
+                   records have been consumed (or delivered, see
+                   :meth:`HarvestedRecords.batches`).
+
+    :param dedup_store: The identifier store used to skip records harvested
+                        from several sets (defaults to a new instance of
+                        ``OAIHARVESTER_DEDUP_STORE``, closed after harvesting).
+    :param concurrency: The number of sets (or date windows) harvested in
+                        parallel threads, capped by
+                        ``OAIHARVESTER_MAX_CONCURRENCY_PER_HOST``.
+                        The ``lastrun`` is only updated if every set was
+                        harvested successfully.
+    :param partitions: Split the harvested date interval into this number of
+                       date windows, harvested as separate jobs (optional).
+                       Use it with ``concurrency`` to harvest the windows in
+                       parallel. The lower bound defaults to the
+                       ``earliestDatestamp`` of the repository and the upper
+                       bound to today.
+    :param resume: Resume the last interrupted harvest of the configuration
+                   given by ``name`` from its last processed pages, instead
+                   of starting a new one. The progress of harvests of a named
+                   configuration is saved after each page of records, and
+                   kept until they are finished or resumed, or for
+                   ``OAIHARVESTER_CHECKPOINT_TIMEOUT`` seconds without
+                   progress.
+    :param prefetch: The number of pages fetched in a background thread ahead
+                     of the page being consumed (per harvesting thread).
+                     Pages are fetched one at a time if ``0``.
+    :param headers_first: Walk ``ListIdentifiers`` instead of ``ListRecords``
+                          and only fetch the records which are new or whose
+                          datestamp changed since they were last harvested,
+                          with ``GetRecord`` requests (``concurrency`` of them
+                          in parallel). The datestamps of the records are
+                          indexed by url and metadata prefix once they have
+                          been consumed (or delivered, see
+                          :meth:`HarvestedRecords.batches`); ``ListRecords``
+                          is used as long as the index of the source is
+                          empty, or a harvest of the configuration is
+                          unfinished. Resumed harvests keep their verb.
+    :param skip_unchanged: Skip the records whose content did not change since
+                           they were last harvested, even if their datestamp
+                           did. A fingerprint of the metadata of the records is
+                           indexed with their datestamp. The number of skipped
+                           records is counted as ``suppressed`` in
+                           ``request.stats``.
+    :return: request object, list (or :class:`HarvestedRecords`) of
+             harvested records
     """
     lastrun = None
     if name:
-        url, _metadata_prefix, lastrun, _setspecs = get_info_by_oai_name(name)
+        url, _metadata_prefix, _, _setspecs = get_info_by_oai_name(name)
+        lastrun = get_oaiharvest_object(name).lastrun
 
         # In case we provide a prefix, we don't want it to be
         # overwritten by the one we get from the name variable.
@@ -75,7 +146,12 @@ def list_records(metadata_prefix=None, from_date=None, until_date=None,
             "Retry using the parameters -n <name> or -u <url>."
         )
 
-    request = Sickle(url, encoding=encoding)
+    request = create_client(
+        url, encoding=encoding,
+        config=get_oaiharvest_object(name) if name else None
+    )
+    if lastrun is not None and from_date is None:
+        lastrun = format_datestamp(lastrun, _get_granularity(request))
 
     # By convention, when we have a url we have no lastrun, and when we use
     # the name we can either have from_date (if provided) or lastrun.
@@ -85,39 +161,547 @@ def list_records(metadata_prefix=None, from_date=None, until_date=None,
     }
 
     # Sanity check
-    if (dates['until'] is not None) and (dates['from'] > dates['until']):
+    if (dates['until'] is not None) and \
+            ((dates['from'] or '') > dates['until']):
         raise WrongDateCombination("'Until' date larger than 'from' date.")
 
-    lastrun_date = datetime.datetime.now()
-
-    # Use a dict to only return the same record once
-    # (e.g. if it is part of several sets)
-    records = {}
-    setspecs = setspecs.split() or [None]
-    for spec in setspecs:
-        params = {
-            'metadataPrefix': metadata_prefix or "oai_dc"
-        }
-        params.update(dates)
-        if spec:
-            params['set'] = spec
-        try:
-            for record in request.ListRecords(**params):
-                records[record.header.identifier] = record
-        except NoRecordsMatch:
-            continue
+    lastrun_date = datetime.datetime.utcnow()
+
+    checkpoints = None
+    if name is not None:
+        checkpoints, lastrun_date = _get_checkpoints(
+            name, resume, lastrun_date
+        )
+
+    record_index = (url, metadata_prefix or "oai_dc")
+    verb = 'ListRecords'
+    if checkpoints is not None:
+        # The resumption tokens are only valid for the verb which issued them
+        verb = checkpoints[0].verb
+    elif headers_first and OAIHarvestRecord.exists(*record_index) and (
+            name is None or not _has_unfinished_checkpoints(name)):
+        verb = 'ListIdentifiers'
+    if not (headers_first or skip_unchanged or verb == 'ListIdentifiers'):
+        record_index = None
+
+    if checkpoints is not None:
+        jobs = [
+            (index, c.params, c.resumption_token, c.last_datestamp)
+            for index, c in enumerate(checkpoints) if not c.finished
+        ]
+    else:
+        params_list = _plan_params(request, dates, setspecs,
+                                   metadata_prefix, partitions)
+        jobs = [
+            (index, params, None, None)
+            for index, params in enumerate(params_list)
+        ]
+        if name is not None:
+            checkpoints = _create_checkpoints(name, params_list, verb)
+
+    max_concurrency = current_app.config[
+        'OAIHARVESTER_MAX_CONCURRENCY_PER_HOST'
+    ]
+    workers = min(concurrency or 1, max_concurrency, len(jobs))
+
+    close_store = dedup_store is None
+    if close_store:
+        dedup_store = create_dedup_store()
+
+    if workers > 1:
+        harvested = iter_parallel(
+            [partial(_harvest_job, request, *job, verb=verb) for job in jobs],
+            workers,
+            maxsize=prefetch * workers or 1000
+        )
+    elif prefetch > 0:
+        # A single thread fetches the pages of the jobs one after the other
+        harvested = iter_parallel(
+            [partial(_harvest_job, request, *job, verb=verb) for job in jobs],
+            1,
+            maxsize=prefetch
+        )
+    else:
+        harvested = itertools.chain.from_iterable(
+            _harvest_job(request, *job, verb=verb) for job in jobs
+        )
+
+    if verb == 'ListIdentifiers':
+        harvested = _fetch_changed(harvested, request, record_index[1],
+                                   concurrency or 1)
 
     # Update lastrun?
     if from_date is None and until_date is None and name is not None:
-        oai_source = get_oaiharvest_object(name)
-        oai_source.update_lastrun(lastrun_date)
-        oai_source.save()
-        db.session.commit()
-    return request, records.values()
+        records = HarvestedRecords(harvested, dedup_store, close_store,
+                                   checkpoints, name, lastrun_date,
+                                   record_index, skip_unchanged,
+                                   request.stats)
+    else:
+        records = HarvestedRecords(harvested, dedup_store, close_store,
+                                   checkpoints, record_index=record_index,
+                                   skip_unchanged=skip_unchanged,
+                                   stats=request.stats)
+
+    if stream:
+        return request, records
+    return request, list(records)
+
+
+def _get_granularity(request):
+    """Return the (cached) datestamp granularity of a repository.
+
+    The compression schemes accepted by the client are restricted to the ones
+    of the repository, see :func:`get_identify`.
+
+    :param request: The Sickle client to use.
+    :return: ``YYYY-MM-DDThh:mm:ssZ`` if the repository supports it,
+             ``YYYY-MM-DD`` otherwise (or if its ``Identify`` response cannot
+             be read).
+    """
+    try:
+        granularity = get_identify(request=request).xml.findtext(
+            './/' + request.oai_namespace + 'granularity'
+        )
+    except Exception as exc:
+        current_app.logger.warning(
+            'Could not get the granularity of %s: %s', request.endpoint, exc
+        )
+        return DAY_GRANULARITY
+    if (granularity or '').strip() == SECONDS_GRANULARITY:
+        return SECONDS_GRANULARITY
+    return DAY_GRANULARITY
+
+
+def _plan_params(request, dates, setspecs, metadata_prefix, partitions):
+    """Return the arguments of every ``ListRecords`` request to issue.
+
+    :param request: The Sickle client to use.
+    :param dates: dict with the ``from`` and ``until`` harvesting dates.
+    :param setspecs: The 'set' criteria for the harvesting.
+    :param metadata_prefix: The prefix for the metadata return.
+    :param partitions: The number of date windows.
+    :return: list of ``ListRecords`` arguments.
+    """
+    if partitions > 1:
+        windows = _plan_windows(request, dates, partitions)
+    else:
+        windows = [dates]
+
+    params_list = []
+    for spec in (setspecs or '').split() or [None]:
+        for window in windows:
+            params = {
+                'metadataPrefix': metadata_prefix or "oai_dc"
+            }
+            params.update(window)
+            if spec:
+                params['set'] = spec
+            params_list.append(params)
+    return params_list
+
+
+def _plan_windows(request, dates, partitions):
+    """Split the harvested dates into windows.
+
+    :param request: The Sickle client to use.
+    :param dates: dict with the ``from`` and ``until`` harvesting dates.
+    :param partitions: The maximum number of windows.
+    :return: list of dicts with the ``from`` and ``until`` of each window.
+    """
+    earliest = get_identify(request=request).earliestDatestamp[:10]
+    from_date = dates['from'] if (dates['from'] or '') > earliest else earliest
+    until_date = dates['until'] or datetime.date.today().strftime('%Y-%m-%d')
+
+    # Every bound is sent with the same granularity
+    seconds = len(from_date) > 10 or len(dates['until'] or '') > 10
+    windows = []
+    for start, end in plan_date_windows(from_date, until_date, partitions):
+        if seconds:
+            start, end = start + 'T00:00:00Z', end + 'T23:59:59Z'
+        windows.append({'from': start, 'until': end})
+    if windows:
+        # Keep the exact bounds which were asked for.
+        windows[0]['from'] = _as_granularity(from_date, windows[0]['from'])
+        if dates['until']:
+            until = dates['until']
+            if seconds and len(until) == 10:
+                until += 'T23:59:59Z'
+            windows[-1]['until'] = until
+    return windows
+
+
+def _get_checkpoints(name, resume, lastrun_date):
+    """Return the checkpoints of an interrupted harvest to resume.
+
+    The latest harvest with unfinished checkpoints is resumed. The checkpoints
+    of the other harvests are removed once they are abandoned (see
+    ``OAIHARVESTER_CHECKPOINT_TIMEOUT``): the ones of harvests which may still
+    be running are kept.
+
+    :param name: The name of the OAIHarvestConfig.
+    :param resume: If the previous harvest should be resumed.
+    :param lastrun_date: The start date of the harvest.
+    :return: list of checkpoints (or ``None``), ``lastrun`` date of the
+             resumed harvest.
+    """
+    config = get_oaiharvest_object(name)
+    runs = {}
+    for checkpoint in OAIHarvestCheckpoint.query.filter_by(
+            config_id=config.id).order_by(OAIHarvestCheckpoint.id):
+        runs.setdefault(checkpoint.run_id, []).append(checkpoint)
+
+    resumed = None
+    if resume:
+        unfinished = [
+            checkpoints for checkpoints in runs.values()
+            if not all(c.finished for c in checkpoints)
+        ]
+        if unfinished:
+            resumed = max(unfinished, key=lambda run: run[0].id)
+
+    expired = datetime.datetime.utcnow() - datetime.timedelta(
+        seconds=current_app.config['OAIHARVESTER_CHECKPOINT_TIMEOUT']
+    )
+    for checkpoints in runs.values():
+        if checkpoints is not resumed and \
+                max(c.updated for c in checkpoints) < expired:
+            for checkpoint in checkpoints:
+                db.session.delete(checkpoint)
+    db.session.commit()
+
+    if resumed is None:
+        return None, lastrun_date
+    return resumed, min(c.created for c in resumed)
+
+
+def _has_unfinished_checkpoints(name):
+    """Check if a harvest of a configuration is unfinished.
+
+    :param name: The name of the OAIHarvestConfig.
+    """
+    config = get_oaiharvest_object(name)
+    return db.session.query(OAIHarvestCheckpoint.query.filter_by(
+        config_id=config.id, finished=False
+    ).exists()).scalar()
+
+
+def _create_checkpoints(name, params_list, verb='ListRecords'):
+    """Create the checkpoints of a harvest.
+
+    :param name: The name of the OAIHarvestConfig.
+    :param params_list: The ``ListRecords`` arguments of every request.
+    :param verb: The verb issued, ``ListRecords`` or ``ListIdentifiers``.
+    :return: list of checkpoints.
+    """
+    config = get_oaiharvest_object(name)
+    run_id = uuid.uuid4().hex
+    checkpoints = [
+        OAIHarvestCheckpoint.create(config, params, run_id, verb)
+        for params in params_list
+    ]
+    db.session.add_all(checkpoints)
+    db.session.commit()
+    return checkpoints
+
+
+def _iter_pages(request, params):
+    """Yield the items and the resumption token of each page of a request.
+
+    :param request: The Sickle client to use.
+    :param params: The OAI-PMH arguments, including the ``verb``.
+    """
+    while True:
+        xml = request.harvest(**params).xml
+        items, token = parse_response(
+            xml, params['verb'], request.oai_namespace, request.class_mapping
+        )
+        yield items, token
+        if token is None:
+            return
+        params = {'verb': params['verb'], 'resumptionToken': token}
+
+
+def _harvest_job(request, index, params, token=None, last_datestamp=None,
+                 verb='ListRecords'):
+    """Yield the pages of a ``ListRecords`` request.
+
+    If a resumption token is not accepted anymore, the request is issued again
+    from the latest datestamp seen so far.
+
+    :param request: The Sickle client to use.
+    :param index: The index of the job, returned with each page.
+    :param params: The ``ListRecords`` arguments.
+    :param token: The resumption token to start from (optional).
+    :param last_datestamp: The latest datestamp already seen (optional).
+    :param verb: The verb to issue, ``ListRecords`` or ``ListIdentifiers``.
+    :return: iterator over ``(index, records, resumption token)`` tuples.
+    """
+    if token:
+        request_params = {'verb': verb, 'resumptionToken': token}
+    else:
+        request_params = dict(params, verb=verb)
+    pages = 0
+    try:
+        for records, token in _iter_pages(request, request_params):
+            last_datestamp = max(
+                last_datestamp or '', _last_datestamp(records) or ''
+            ) or None
+            pages += 1
+            yield index, records, token
+    except NoRecordsMatch:
+        return
+    except BadResumptionToken:
+        if not pages and 'resumptionToken' not in request_params:
+            raise
+        params = dict(params)
+        if last_datestamp:
+            params['from'] = _as_granularity(
+                last_datestamp, params.get('from') or params.get('until')
+            )
+        for page in _harvest_job(request, index, params, verb=verb):
+            yield page
+
+
+def _last_datestamp(records):
+    """Return the latest header datestamp of a list of records (or headers)."""
+    return max(
+        [getattr(r, 'header', r).datestamp for r in records] or [None]
+    )
+
+
+def _get_record(request, identifier, metadata_prefix):
+    """Return a record, or ``None`` if it does not exist anymore."""
+    try:
+        return request.GetRecord(identifier=identifier,
+                                 metadataPrefix=metadata_prefix)
+    except IdDoesNotExist:
+        return None
+
+
+def _fetch_changed(harvested, request, metadata_prefix, workers):
+    """Fetch the new or changed records of pages of headers.
+
+    :param harvested: iterator over pages of headers, as
+                      ``(index, headers, resumption token)`` tuples.
+    :param request: The Sickle client to use.
+    :param metadata_prefix: The prefix for the metadata return.
+    :param workers: The number of concurrent ``GetRecord`` requests.
+    :return: iterator over ``(index, records, resumption token)`` tuples.
+    """
+    fetch = partial(_get_record, request, metadata_prefix=metadata_prefix)
+    for index, headers, token in harvested:
+        indexed = OAIHarvestRecord.get_datestamps(
+            request.endpoint, metadata_prefix,
+            [h.identifier for h in headers]
+        )
+        changed = [
+            h.identifier for h in headers
+            if indexed.get(h.identifier) != h.datestamp
+        ]
+        request.stats.incr('unchanged', len(headers) - len(changed))
+        records = iter_ordered(fetch, changed, workers)
+        yield index, [r for r in records if r is not None], token
+
+
+def _as_granularity(datestamp, reference):
+    """Format a datestamp with the granularity of a reference date."""
+    if reference and len(reference) == 10:
+        return datestamp[:10]
+    if reference and len(datestamp) == 10:
+        return datestamp + 'T00:00:00Z'
+    return datestamp
+
+
+class HarvestedRecords(object):
+    """Records returned by :func:`list_records`, harvested while iterated.
+
+    Records that are part of several sets are only returned once. The state
+    of the harvest (the ``lastrun`` of the configuration, its checkpoints and
+    the index of the harvested records) is saved by :meth:`commit`. When
+    iterating over the records, it is committed as soon as they have been
+    consumed. :meth:`batches` commits it only when the next batch is
+    requested instead, i.e. once the previous one has been delivered:
+
+    .. code-block:: python
+
+        request, records = list_records(name='arXiv', stream=True)
+        for batch in records.batches(1000):
+            oaiharvest_finished.send(request, records=batch)
+
+    If the receivers fail, the harvest can then be resumed from the last
+    delivered batch.
+    """
+
+    def __init__(self, harvested, dedup_store, close_store=False,
+                 checkpoints=None, name=None, lastrun_date=None,
+                 record_index=None, skip_unchanged=False, stats=None):
+        """Initialize the records.
+
+        :param harvested: iterator over the pages of every request, as
+                          ``(index, records, resumption token)`` tuples.
+        :param dedup_store: The store of already harvested identifiers.
+        :param close_store: If the store should be closed after harvesting.
+        :param checkpoints: The checkpoints of every request to update after
+                            each page (optional). They are removed once all
+                            records have been harvested.
+        :param name: The name of the OAIHarvestConfig whose ``lastrun`` should
+                     be updated once all records have been harvested
+                     (optional).
+        :param lastrun_date: The start date of the harvest (UTC), used as
+                             ``lastrun`` if no later datestamp was harvested.
+        :param record_index: The url and metadata prefix under which the
+                             records are indexed (optional).
+        :param skip_unchanged: If the records whose fingerprint is already
+                               indexed should be skipped.
+        :param stats: The :class:`~invenio_oaiharvester.client.HarvestStats`
+                      in which skipped records are counted.
+        """
+        self.dedup_store = dedup_store
+        self.close_store = close_store
+        self.checkpoints = checkpoints
+        self.name = name
+        self.lastrun_date = lastrun_date
+        self.record_index = record_index
+        self.skip_unchanged = skip_unchanged
+        self.stats = stats
+        self.autocommit = True
+        self._pending = []
+        self._observed = None
+        self._exhausted = False
+        self._finalized = False
+        self._records = self._iter_records(harvested)
+
+    def __iter__(self):
+        """Return the records."""
+        return self
+
+    def __next__(self):
+        """Return the next record."""
+        return next(self._records)
+
+    next = __next__
+
+    def close(self):
+        """Stop harvesting."""
+        self._records.close()
+
+    def batches(self, size=None):
+        """Yield the records in batches, committing each delivered batch.
+
+        The state of the harvest is committed when the next batch is
+        requested, and after the last one.
+
+        :param size: The maximum number of records per batch. All records are
+                     returned in a single batch (even if empty) if ``None``.
+        :return: generator of lists of records.
+        """
+        self.autocommit = False
+        if size is None:
+            yield list(self)
+            self.commit()
+            return
+        while True:
+            batch = list(itertools.islice(self, size))
+            if not batch:
+                self.commit()
+                return
+            yield batch
+            self.commit()
+
+    def commit(self):
+        """Save the state of the harvest up to the records consumed so far.
+
+        The records of the pages which have all been consumed are indexed,
+        and the checkpoints are advanced past these pages. The checkpoints are
+        removed and the ``lastrun`` is updated once every record has been
+        consumed.
+        """
+        pending, self._pending = self._pending, []
+        for index, token, headers, fingerprints in pending:
+            if self.record_index:
+                OAIHarvestRecord.index(
+                    self.record_index[0], self.record_index[1], headers,
+                    fingerprints
+                )
+            if self.checkpoints:
+                self.checkpoints[index].update_progress(
+                    token, len(headers), _last_datestamp(headers)
+                )
+        if pending:
+            db.session.commit()
+        if self._exhausted and not self._finalized:
+            self._finalized = True
+            self._finalize()
+
+    def _iter_records(self, harvested):
+        """Yield the harvested records which were not already returned."""
+        record_index = self.record_index
+        try:
+            for index, records, token in harvested:
+                self._observed = max(
+                    self._observed or '', _last_datestamp(records) or ''
+                ) or None
+                fingerprints = None
+                unchanged = set()
+                if self.skip_unchanged:
+                    fingerprints = dict(
+                        (r.header.identifier, record_fingerprint(r))
+                        for r in records
+                    )
+                    indexed = OAIHarvestRecord.get_fingerprints(
+                        record_index[0], record_index[1], fingerprints
+                    )
+                    unchanged = set(
+                        identifier
+                        for identifier, fingerprint in fingerprints.items()
+                        if indexed.get(identifier) == fingerprint
+                    )
+                    if self.stats is not None:
+                        self.stats.incr('suppressed', len(unchanged))
+                for record in records:
+                    identifier = record.header.identifier
+                    if identifier not in unchanged and \
+                            self.dedup_store.add(identifier):
+                        yield record
+                if record_index or self.checkpoints:
+                    self._pending.append((
+                        index, token, [record.header for record in records],
+                        fingerprints
+                    ))
+                    if self.autocommit:
+                        self.commit()
+        finally:
+            if self.close_store:
+                self.dedup_store.close()
+
+        self._exhausted = True
+        if self.autocommit:
+            self.commit()
+
+    def _finalize(self):
+        """Remove the checkpoints and update the ``lastrun``."""
+        observed = self._observed
+        if self.checkpoints:
+            for checkpoint in self.checkpoints:
+                # Pages harvested before the harvest was resumed
+                observed = max(
+                    observed or '', checkpoint.last_datestamp or ''
+                ) or None
+                db.session.delete(checkpoint)
+            db.session.commit()
+
+        if self.name is not None and observed is not None:
+            oai_source = get_oaiharvest_object(self.name)
+            oai_source.update_lastrun(
+                min(self.lastrun_date, parse_datestamp(observed))
+            )
+            oai_source.save()
+            db.session.commit()
 
 
 def get_records(identifiers, metadata_prefix=None, url=None, name=None,
-                encoding=None):
+                encoding=None, concurrency=1, stream=False,
+                raise_on_error=True):
     """Harvest specific records from an OAI repo via OAI-PMH identifiers.
 
     :param metadata_prefix: The prefix for the metadata return
@@ -128,7 +712,15 @@ def get_records(identifiers, metadata_prefix=None, url=None, name=None,
                  specific parameters.
     :param encoding: Override the encoding returned by the server. ISO-8859-1
                      if it is not provided by the server.
-    :return: request object, list of harvested records
+    :param concurrency: The number of records fetched in parallel threads,
+                        capped by ``OAIHARVESTER_MAX_CONCURRENCY_PER_HOST``.
+                        Records are returned in the order of the identifiers.
+    :param stream: If ``True``, return a generator yielding the records as
+                   they are harvested instead of a list.
+    :param raise_on_error: If ``False``, the records which cannot be harvested
+                           are skipped, and the exception raised for each of
+                           them is kept in ``request.errors`` by identifier.
+    :return: request object, list (or generator) of harvested records
     """
     if name:
         url, _metadata_prefix, _, __ = get_info_by_oai_name(name)
@@ -142,15 +734,44 @@ def get_records(identifiers, metadata_prefix=None, url=None, name=None,
             "Retry using the parameters -n <name> or -u <url>."
         )
 
-    request = Sickle(url, encoding=encoding)
-    records = []
-    for identifier in identifiers:
-        arguments = {
-            'identifier': identifier,
-            'metadataPrefix': metadata_prefix or "oai_dc"
-        }
-        records.append(request.GetRecord(**arguments))
-    return request, records
+    request = create_client(
+        url, encoding=encoding,
+        config=get_oaiharvest_object(name) if name else None
+    )
+    workers = min(
+        concurrency or 1,
+        current_app.config['OAIHARVESTER_MAX_CONCURRENCY_PER_HOST']
+    )
+    fetch = partial(_get_record_or_error, request,
+                    metadata_prefix=metadata_prefix or "oai_dc",
+                    raise_on_error=raise_on_error)
+    records = (
+        record for record in iter_ordered(fetch, identifiers, workers)
+        if record is not None
+    )
+    if stream:
+        return request, records
+    return request, list(records)
+
+
+def _get_record_or_error(request, identifier, metadata_prefix,
+                         raise_on_error=True):
+    """Return a record, or ``None`` if it cannot be harvested.
+
+    :param request: The Sickle client to use.
+    :param identifier: The OAI identifier of the record.
+    :param metadata_prefix: The prefix for the metadata return.
+    :param raise_on_error: If exceptions should be raised instead of being
+                           kept in ``request.errors``.
+    """
+    try:
+        return request.GetRecord(identifier=identifier,
+                                 metadataPrefix=metadata_prefix)
+    except Exception as exc:
+        if raise_on_error:
+            raise
+        request.errors[identifier] = exc
+        request.stats.incr('errors')
 
 
 def get_info_by_oai_name(name):
@@ -163,3 +784,106 @@ def get_info_by_oai_name(name):
     obj = get_oaiharvest_object(name)
     lastrun = obj.lastrun.strftime("%Y-%m-%d")
     return obj.baseurl, obj.metadataprefix, lastrun, obj.setspecs
+
+
+class _CachedResponse(object):
+    """OAI-PMH response read from the description cache."""
+
+    def __init__(self, content):
+        self.xml = etree.XML(content, parser=XMLParser)
+
+
+def _get_description(url, verb, request=None, refresh=False):
+    """Return the pages of the response to a description verb.
+
+    :param url: The url of the endpoint.
+    :param verb: ``Identify``, ``ListSets`` or ``ListMetadataFormats``.
+    :param request: The Sickle client to use (optional).
+    :param refresh: If the cached response should be ignored.
+    :return: list of response contents.
+    """
+    cache = current_app.extensions['invenio-oaiharvester'].description_cache
+    key = '{0} {1}'.format(verb, url)
+    pages = None if refresh else cache.get(key)
+    if pages is None:
+        request = request or create_client(url)
+        pages = []
+        params = {'verb': verb}
+        while True:
+            response = request.harvest(**params)
+            if verb == 'Identify':
+                token = None
+            else:
+                _, token = parse_response(
+                    response.xml, verb, request.oai_namespace,
+                    request.class_mapping
+                )
+            pages.append(response.http_response.content)
+            if token is None:
+                break
+            params = {'verb': verb, 'resumptionToken': token}
+        cache.set(key, pages)
+    return pages
+
+
+def _get_description_items(url, name, verb, refresh):
+    """Return the items of the response to a description verb."""
+    if name:
+        url = get_oaiharvest_object(name).baseurl
+    elif not url:
+        raise NameOrUrlMissing(
+            "Retry using the parameters -n <name> or -u <url>."
+        )
+    items = []
+    for content in _get_description(url, verb, refresh=refresh):
+        page, _ = parse_response(_CachedResponse(content).xml, verb)
+        items.extend(page)
+    return items
+
+
+def get_identify(url=None, name=None, request=None, refresh=False):
+    """Return the (cached) ``Identify`` response of an OAI-PMH endpoint.
+
+    :param url: The url of the endpoint.
+    :param name: The name of the OAIHarvestConfig to use instead of the url.
+    :param request: The Sickle client to use, whose accepted compression
+                    schemes are restricted to the ones of the repository
+                    (optional, instead of the url).
+    :param refresh: If the response should be fetched again.
+    :rtype: :class:`sickle.models.Identify`
+    """
+    if name:
+        url = get_oaiharvest_object(name).baseurl
+    elif request is not None:
+        url = request.endpoint
+    elif not url:
+        raise NameOrUrlMissing(
+            "Retry using the parameters -n <name> or -u <url>."
+        )
+    content = _get_description(url, 'Identify', request, refresh)[0]
+    identify = Identify(_CachedResponse(content))
+    if request is not None:
+        request.negotiate_compression(identify)
+    return identify
+
+
+def list_sets(url=None, name=None, refresh=False):
+    """Return the (cached) sets of an OAI-PMH endpoint.
+
+    :param url: The url of the endpoint.
+    :param name: The name of the OAIHarvestConfig to use instead of the url.
+    :param refresh: If the sets should be fetched again.
+    :return: list of :class:`sickle.models.Set`
+    """
+    return _get_description_items(url, name, 'ListSets', refresh)
+
+
+def list_metadata_formats(url=None, name=None, refresh=False):
+    """Return the (cached) metadata formats of an OAI-PMH endpoint.
+
+    :param url: The url of the endpoint.
+    :param name: The name of the OAIHarvestConfig to use instead of the url.
+    :param refresh: If the metadata formats should be fetched again.
+    :return: list of :class:`sickle.models.MetadataFormat`
+    """
+    return _get_description_items(url, name, 'ListMetadataFormats', refresh)
@@ -0,0 +1,185 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+r"""Caches of the description of OAI-PMH endpoints.
+
+The responses to the ``Identify``, ``ListSets`` and ``ListMetadataFormats``
+verbs are kept for ``OAIHARVESTER_DESCRIPTION_CACHE_TTL`` seconds, and the
+least recently used ones are evicted beyond
+``OAIHARVESTER_DESCRIPTION_CACHE_SIZE`` entries. The cache is configured with
+``OAIHARVESTER_DESCRIPTION_CACHE``; use the SQLite cache to keep the
+descriptions across processes and runs:
+
+.. code-block:: python
+
+    OAIHARVESTER_DESCRIPTION_CACHE = \
+        'invenio_oaiharvester.cache:SQLiteDescriptionCache'
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import pickle
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+from .utils import check_or_create_dir
+
+
+class MemoryDescriptionCache(object):
+    """Keep the descriptions in memory."""
+
+    def __init__(self, size=128, ttl=86400):
+        """Initialize the cache.
+
+        :param size: The maximum number of entries.
+        :param ttl: The number of seconds an entry is valid.
+        """
+        self.size = size
+        self.ttl = ttl
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        """Return a cached value.
+
+        :param key: The key of the entry.
+        :return: The value, or ``None`` if it is missing or has expired.
+        """
+        with self._lock:
+            entry = self._entries.pop(key, None)
+            if entry is None or entry[0] < time.time():
+                return None
+            self._entries[key] = entry
+            return entry[1]
+
+    def set(self, key, value):
+        """Store a value.
+
+        :param key: The key of the entry.
+        :param value: The value to store.
+        """
+        with self._lock:
+            self._entries.pop(key, None)
+            self._entries[key] = (time.time() + self.ttl, value)
+            while len(self._entries) > self.size:
+                self._entries.popitem(last=False)
+
+    def delete(self, key):
+        """Remove an entry."""
+        with self._lock:
+            self._entries.pop(key, None)
+
+    def __len__(self):
+        """Return the number of entries."""
+        return len(self._entries)
+
+
+class SQLiteDescriptionCache(MemoryDescriptionCache):
+    """Keep the descriptions in an on-disk SQLite table."""
+
+    def __init__(self, size=128, ttl=86400, path=None):
+        """Initialize the cache.
+
+        :param size: The maximum number of entries.
+        :param ttl: The number of seconds an entry is valid.
+        :param path: Path of the database file (defaults to
+                     ``descriptions.sqlite3`` in the ``cache`` directory of
+                     ``OAIHARVESTER_WORKDIR``).
+        """
+        super(SQLiteDescriptionCache, self).__init__(size, ttl)
+        self.path = path or os.path.join(
+            check_or_create_dir('cache'), 'descriptions.sqlite3'
+        )
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS descriptions '
+                '(key TEXT PRIMARY KEY, value BLOB, expires REAL, '
+                'accessed REAL)'
+            )
+
+    def get(self, key):
+        """Return a cached value.
+
+        :param key: The key of the entry.
+        :return: The value, or ``None`` if it is missing or has expired.
+        """
+        now = time.time()
+        with self._lock, self._connection:
+            row = self._connection.execute(
+                'SELECT value FROM descriptions '
+                'WHERE key = ? AND expires >= ?', (key, now)
+            ).fetchone()
+            if row is None:
+                return None
+            self._connection.execute(
+                'UPDATE descriptions SET accessed = ? WHERE key = ?',
+                (now, key)
+            )
+        return pickle.loads(bytes(row[0]))
+
+    def set(self, key, value):
+        """Store a value.
+
+        :param key: The key of the entry.
+        :param value: The value to store.
+        """
+        now = time.time()
+        data = sqlite3.Binary(pickle.dumps(value, 2))
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO descriptions VALUES (?, ?, ?, ?)',
+                (key, data, now + self.ttl, now)
+            )
+            self._connection.execute(
+                'DELETE FROM descriptions WHERE expires < ? OR key NOT IN '
+                '(SELECT key FROM descriptions ORDER BY accessed DESC '
+                'LIMIT ?)', (now, self.size)
+            )
+
+    def delete(self, key):
+        """Remove an entry."""
+        with self._lock, self._connection:
+            self._connection.execute(
+                'DELETE FROM descriptions WHERE key = ?', (key, )
+            )
+
+    def __len__(self):
+        """Return the number of entries."""
+        with self._lock:
+            return self._connection.execute(
+                'SELECT COUNT(*) FROM descriptions'
+            ).fetchone()[0]
+
+
+def create_description_cache():
+    """Create the description cache configured in the application."""
+    factory = current_app.config['OAIHARVESTER_DESCRIPTION_CACHE']
+    if not callable(factory):
+        factory = import_string(factory)
+    return factory(
+        size=current_app.config['OAIHARVESTER_DESCRIPTION_CACHE_SIZE'],
+        ttl=current_app.config['OAIHARVESTER_DESCRIPTION_CACHE_TTL']
+    )
@@ -21,14 +21,20 @@
 
 from __future__ import absolute_import, print_function
 
+import os
+import sys
+
 import click
+from flask import current_app
 from flask.cli import with_appcontext
 
 from .api import get_records, list_records
 from .errors import IdentifiersOrDates
+from .index import INDEX_FILE_NAME, RecordIndex
 from .signals import oaiharvest_finished
 from .tasks import get_specific_records, list_records_from_dates
-from .utils import get_identifier_names, write_to_dir
+from .utils import chunks, get_identifier_names, record_extraction_from_dir
+from .writer import COMPRESSION_SUFFIXES, RecordWriter
 
 
 @click.group()
@@ -64,13 +70,52 @@ def oaiharvester():
 @click.option('-e', '--encoding', default=None,
               help="Override the encoding returned by the server. ISO-8859-1 "
                    "if it is not provided by the server.")
+@click.option('--stream', is_flag=True, default=False,
+              help="Process harvested records in chunks while harvesting.")
+@click.option('-c', '--concurrency', default=1, type=int,
+              help="Number of sets, date windows or identifiers harvested in "
+                   "parallel.")
+@click.option('-p', '--partitions', default=1, type=int,
+              help="Number of date windows to split the harvest into.")
+@click.option('--resume', is_flag=True, default=False,
+              help="Resume the last interrupted harvest of the configuration.")
+@click.option('--prefetch', default=0, type=int,
+              help="Number of pages fetched ahead of the page being "
+                   "processed.")
+@click.option('--headers-first', is_flag=True, default=False,
+              help="List the record headers and only fetch new or changed "
+                   "records.")
+@click.option('--skip-unchanged', is_flag=True, default=False,
+              help="Skip the records whose content did not change since the "
+                   "previous harvest.")
+@click.option('--skip-errors', is_flag=True, default=False,
+              help="Report the identifiers which cannot be harvested instead "
+                   "of aborting.")
+@click.option('--stats', is_flag=True, default=False,
+              help="Print the transfer statistics of the harvest to stderr.")
+@click.option('--max-records', default=1000, type=int,
+              help="Maximum number of records per file in the directory.")
+@click.option('--max-bytes', default=None, type=int,
+              help="Size of the records after which a new file is started "
+                   "in the directory.")
+@click.option('--compression', default=None,
+              type=click.Choice(sorted(c for c in COMPRESSION_SUFFIXES if c)),
+              help="Compression of the files in the directory.")
+@click.option('--run-id', default=None,
+              help="Identifier of the run in the names of the files in the "
+                   "directory (random by default).")
+@click.option('--index', is_flag=True, default=False,
+              help="Index the position of the records in the directory.")
 @with_appcontext
 def harvest(metadata_prefix, name, setspecs, identifiers, from_date,
             until_date, url, directory, arguments, quiet, enqueue, signals,
-            encoding):
+            encoding, stream, concurrency, partitions, resume, prefetch,
+            headers_first, skip_unchanged, skip_errors, stats, max_records,
+            max_bytes, compression, run_id, index):
     """Harvest records from an OAI repository."""
     arguments = dict(x.split('=', 1) for x in arguments)
-    records = None
+    size = current_app.config['OAIHARVESTER_STREAM_CHUNK_SIZE']
+    batches = None
     if identifiers is None:
         # If no identifiers are provided, a harvest is scheduled:
         # - url / name is used for the endpoint
@@ -79,7 +124,12 @@ def harvest(metadata_prefix, name, setspecs, identifiers, from_date,
         params = (metadata_prefix, from_date, until_date, url,
                   name, setspecs, signals)
         if enqueue:
-            job = list_records_from_dates.delay(*params, **arguments)
+            job = list_records_from_dates.delay(
+                *params, stream=stream, concurrency=concurrency,
+                partitions=partitions, resume=resume, prefetch=prefetch,
+                headers_first=headers_first, skip_unchanged=skip_unchanged,
+                **arguments
+            )
             print("Scheduled job {0}".format(job.id))
         else:
             request, records = list_records(
@@ -89,8 +139,17 @@ def harvest(metadata_prefix, name, setspecs, identifiers, from_date,
                 url,
                 name,
                 setspecs,
-                encoding
+                encoding,
+                stream=True,
+                concurrency=concurrency,
+                partitions=partitions,
+                resume=resume,
+                prefetch=prefetch,
+                headers_first=headers_first,
+                skip_unchanged=skip_unchanged
             )
+            # The harvest is committed once each batch has been processed
+            batches = records.batches(size if stream else None)
     else:
         if (from_date is not None) or (until_date is not None):
             raise IdentifiersOrDates(
@@ -101,7 +160,10 @@ def harvest(metadata_prefix, name, setspecs, identifiers, from_date,
         params = (identifiers, metadata_prefix, url,
                   name, signals)
         if enqueue:
-            job = get_specific_records.delay(*params, **arguments)
+            job = get_specific_records.delay(
+                *params, concurrency=concurrency,
+                raise_on_error=not skip_errors, **arguments
+            )
             print("Scheduled job {0}".format(job.id))
         else:
             identifiers = get_identifier_names(identifiers)
@@ -110,25 +172,112 @@ def harvest(metadata_prefix, name, setspecs, identifiers, from_date,
                 metadata_prefix,
                 url,
                 name,
-                encoding
+                encoding,
+                concurrency=concurrency,
+                stream=stream,
+                raise_on_error=not skip_errors
             )
+            if stream:
+                batches = chunks(records, size)
+            elif records:
+                batches = [records]
 
-    if records:
-        if signals:
-            oaiharvest_finished.send(
-                request,
-                records=records,
-                name=name,
-                **arguments
-            )
+    if batches is not None:
+        writer = None
         if directory:
-            files_created, total = write_to_dir(records, directory)
-            print_files_created(files_created)
-            print_total_records(total)
-        elif not quiet:
-            total = print_to_stdout(records)
+            writer = RecordWriter(directory, max_records=max_records,
+                                  max_bytes=max_bytes, compression=compression,
+                                  run_id=run_id, index=index)
+        total = 0
+        harvested = False
+        try:
+            for batch in batches:
+                if not batch:
+                    continue
+                harvested = True
+                if signals:
+                    oaiharvest_finished.send(
+                        request,
+                        records=batch,
+                        name=name,
+                        **arguments
+                    )
+                if writer is not None:
+                    for record in batch:
+                        writer.write(record)
+                elif not quiet:
+                    total += print_to_stdout(batch)
+        finally:
+            if writer is not None:
+                writer.close()
+
+        if harvested and directory:
+            print_files_created(writer.files)
+            print_total_records(writer.total)
+        elif harvested and not quiet:
             print_total_records(total)
 
+    if not enqueue:
+        print_errors(request)
+    if stats and not enqueue:
+        print_stats(request)
+
+
+@oaiharvester.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.option('-w', '--workers', default=1, type=int,
+              help="Number of processes extracting files in parallel.")
+@click.option('--unordered', is_flag=True, default=False,
+              help="Output the records of the files as soon as they are "
+                   "extracted instead of in the order of the file names.")
+@click.option('-p', '--pattern', default='*.xml*',
+              help="Pattern of the names of the files to extract.")
+@click.option('--split', is_flag=True, default=False,
+              help="Split uncompressed files at the record boundaries "
+                   "instead of parsing them.")
+@click.option('-q', '--quiet', is_flag=True, default=False,
+              help="Surpress output.")
+@with_appcontext
+def extract(directory, workers, unordered, pattern, split, quiet):
+    """Extract the records of previously harvested files."""
+    total = 0
+    for extracted in record_extraction_from_dir(
+            directory, workers=workers, ordered=not unordered,
+            pattern=pattern, split=split):
+        if extracted.error is not None:
+            click.echo('Could not extract {0}'.format(extracted.error),
+                       err=True)
+            continue
+        total += len(extracted.records)
+        if not quiet:
+            for record in extracted.records:
+                click.echo(record)
+    click.echo('Number of records extracted {0}'.format(total))
+
+
+@oaiharvester.command()
+@click.argument('directory', type=click.Path(exists=True, file_okay=False))
+@click.argument('identifier')
+@click.option('--position', is_flag=True, default=False,
+              help="Print the file, offset, length and datestamp of the "
+                   "record instead of the record.")
+def lookup(directory, identifier, position):
+    """Print a record of previously harvested and indexed files."""
+    path = os.path.join(directory, INDEX_FILE_NAME)
+    if not os.path.exists(path):
+        click.echo('No index in {0}'.format(directory), err=True)
+        sys.exit(1)
+    with RecordIndex(path) as index:
+        entry = index.lookup(identifier)
+        if entry is None:
+            click.echo('Record {0} not found'.format(identifier), err=True)
+            sys.exit(1)
+        if position:
+            click.echo('{0.file} {0.offset} {0.length} {0.datestamp}'
+                       .format(entry))
+        else:
+            click.echo(index.read(identifier))
+
 
 def print_to_stdout(records):
     """Print the raw information of the records to the stdout.
@@ -158,3 +307,22 @@ def print_total_records(total):
     :param total: The total number of harvested records.
     """
     click.echo('Number of records harvested {0}'.format(total))
+
+
+def print_stats(request):
+    """Print the statistics of a harvest to the stderr.
+
+    :param request: The client used for the harvest.
+    """
+    for key, value in sorted(request.stats.to_dict().items()):
+        click.echo('{0}: {1}'.format(key, value), err=True)
+
+
+def print_errors(request):
+    """Print the identifiers which could not be harvested to the stderr.
+
+    :param request: The client used for the harvest.
+    """
+    for identifier, error in sorted(request.errors.items()):
+        click.echo('Could not harvest {0}: {1}'.format(identifier, error),
+                   err=True)
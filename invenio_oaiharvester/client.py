@@ -0,0 +1,459 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""HTTP client used to issue OAI-PMH requests.
+
+Every Sickle client created by the API uses a :class:`requests.Session`
+shared per process and per endpoint host, so TCP and TLS connections are kept
+alive and reused across harvests, tasks and identifier batches.
+
+Responses are requested compressed (see ``OAIHARVESTER_HTTP_COMPRESSION``) and
+decompressed while they are read. Each client counts the transferred bytes in
+its :attr:`OAIHarvesterClient.stats`:
+
+.. code-block:: python
+
+    request, records = list_records(name='arXiv')
+    request.stats['bytes_received']  # compressed bytes on the wire
+    request.stats['bytes_decoded']  # size of the decompressed responses
+
+Responses can also be cached on disk (see
+:mod:`invenio_oaiharvester.httpcache`), in which case the ``cache_hits``,
+``cache_revalidations`` and ``cache_misses`` are counted in the stats.
+
+Requests throttled by the server (e.g. ``503`` with a ``Retry-After`` header)
+or failing with a connection error are retried with a jittered exponential
+backoff, see ``OAIHARVESTER_RETRY_*``. Only the failed page is requested
+again, so the resumption token chain is not restarted. The ``retries``, the
+``sleep_time`` and the ``failures`` (requests given up) are counted in the
+stats.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import random
+import threading
+import time
+import zlib
+from collections import Counter
+from email.utils import mktime_tz, parsedate_tz
+from timeit import default_timer
+
+import requests
+from flask import current_app
+from requests.adapters import HTTPAdapter
+from requests.utils import get_encoding_from_headers
+from sickle import Sickle
+from sickle.response import OAIResponse
+
+from .concurrency import get_host
+from .governor import get_governor
+from .httpcache import cache_key, get_response_cache
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_session_stats = {'hits': 0, 'misses': 0}
+
+
+def get_session(url):
+    """Return the pooled session of an endpoint host.
+
+    Sessions are created per process, so that forked workers do not share
+    connections, with a connection pool of ``OAIHARVESTER_HTTP_POOL_SIZE``.
+
+    :param url: The url of the endpoint.
+    """
+    key = (os.getpid(), get_host(url))
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is not None:
+            _session_stats['hits'] += 1
+            return session
+
+        _session_stats['misses'] += 1
+        pool_size = current_app.config['OAIHARVESTER_HTTP_POOL_SIZE']
+        session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size)
+        session.mount('http://', adapter)
+        session.mount('https://', adapter)
+        _sessions[key] = session
+        return session
+
+
+def get_pool_stats():
+    """Return the usage statistics of the pooled sessions of this process.
+
+    :return: dict with the number of session lookups which reused a session
+             (``session_hits``) or created one (``session_misses``), and the
+             number of HTTP requests (``requests``) and of new connections
+             (``connections``) of the connection pools. Requests which did not
+             need a new connection reused a kept-alive one.
+    """
+    stats = {
+        'session_hits': _session_stats['hits'],
+        'session_misses': _session_stats['misses'],
+        'requests': 0,
+        'connections': 0,
+    }
+    pid = os.getpid()
+    with _sessions_lock:
+        sessions = [s for (p, _), s in _sessions.items() if p == pid]
+    for session in sessions:
+        for adapter in set(session.adapters.values()):
+            for key in list(adapter.poolmanager.pools.keys()):
+                pool = adapter.poolmanager.pools.get(key)
+                if pool is not None:
+                    stats['requests'] += pool.num_requests
+                    stats['connections'] += pool.num_connections
+    return stats
+
+
+class HarvestStats(object):
+    """Thread-safe counters of a harvest."""
+
+    def __init__(self):
+        """Initialize the counters."""
+        self._lock = threading.Lock()
+        self._counters = Counter()
+
+    def incr(self, key, value=1):
+        """Increment a counter.
+
+        :param key: The name of the counter.
+        :param value: The increment.
+        """
+        with self._lock:
+            self._counters[key] += value
+
+    def __getitem__(self, key):
+        """Return the value of a counter."""
+        with self._lock:
+            return self._counters[key]
+
+    def to_dict(self):
+        """Return the counters as a dict."""
+        with self._lock:
+            return dict(self._counters)
+
+
+def parse_retry_after(value):
+    """Return the delay in seconds of a ``Retry-After`` header.
+
+    :param value: The header value, either a number of seconds or a HTTP
+                  date.
+    :return: The delay, or ``None`` if the value is not valid.
+    """
+    if not value:
+        return None
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    date = parsedate_tz(value)
+    if date is None:
+        return None
+    return max(0.0, mktime_tz(date) - time.time())
+
+
+def _decompressor(content_encoding):
+    """Return a decompression function for a ``Content-Encoding``."""
+    content_encoding = (content_encoding or '').strip().lower()
+    if content_encoding in ('gzip', 'x-gzip'):
+        return zlib.decompressobj(16 + zlib.MAX_WBITS)
+    if content_encoding == 'deflate':
+        return _DeflateDecompressor()
+
+
+class _DeflateDecompressor(object):
+    """Decompress zlib-wrapped or raw deflate streams."""
+
+    def __init__(self):
+        self._first = True
+        self._data = b''
+        self._obj = zlib.decompressobj()
+
+    def decompress(self, data):
+        if not self._first:
+            return self._obj.decompress(data)
+        self._data += data
+        try:
+            decompressed = self._obj.decompress(self._data)
+        except zlib.error:
+            # Some servers send raw deflate streams without zlib header
+            self._obj = zlib.decompressobj(-zlib.MAX_WBITS)
+            decompressed = self._obj.decompress(self._data)
+        self._first = False
+        self._data = b''
+        return decompressed
+
+    def flush(self):
+        return self._obj.flush()
+
+
+class OAIHarvesterClient(Sickle):
+    """Sickle client issuing its requests through a pooled session.
+
+    :ivar stats: :class:`HarvestStats` of the requests issued by the client.
+    :ivar errors: dict of the exceptions raised for the records which could
+                  not be harvested, by identifier.
+    """
+
+    def __init__(self, endpoint, session=None, compression=None,
+                 retry_attempts=1, retry_status_codes=None, retry_backoff=1.0,
+                 retry_max_delay=120, governor=None, cache=None,
+                 cache_max_age=None, **kwargs):
+        """Initialize the client.
+
+        :param endpoint: The url of the OAI-PMH endpoint.
+        :param session: The :class:`requests.Session` to use (defaults to the
+                        pooled session of the endpoint host).
+        :param compression: The list of accepted content encodings, in order
+                            of preference (defaults to none).
+        :param retry_attempts: The maximum number of attempts of a request.
+        :param retry_status_codes: The HTTP status codes to retry.
+        :param retry_backoff: The base delay of the exponential backoff.
+        :param retry_max_delay: The maximum delay between two attempts.
+        :param governor: The
+                         :class:`~invenio_oaiharvester.governor.EndpointGovernor`
+                         limiting the requests to the host (optional).
+        :param cache: The
+                      :class:`~invenio_oaiharvester.httpcache.ResponseCache`
+                      of the responses (optional).
+        :param cache_max_age: The number of seconds cached responses are used
+                              without revalidation (always revalidated if
+                              ``None``).
+        """
+        super(OAIHarvesterClient, self).__init__(endpoint, **kwargs)
+        self.session = session or get_session(endpoint)
+        self.compression = list(compression or [])
+        self.retry_attempts = max(1, retry_attempts)
+        self.retry_status_codes = set(retry_status_codes or [])
+        self.retry_backoff = retry_backoff
+        self.retry_max_delay = retry_max_delay
+        self.governor = governor
+        self.cache = cache
+        self.cache_max_age = cache_max_age
+        self.stats = HarvestStats()
+        self.errors = {}
+
+    def Identify(self):
+        """Issue an Identify request.
+
+        Only the compression schemes supported by the repository are accepted
+        afterwards, if it advertises any.
+
+        :rtype: :class:`sickle.models.Identify`
+        """
+        identify = super(OAIHarvesterClient, self).Identify()
+        self.negotiate_compression(identify)
+        return identify
+
+    def negotiate_compression(self, identify):
+        """Only accept the compression schemes supported by the repository.
+
+        :param identify: The :class:`sickle.models.Identify` of the repository.
+        """
+        supported = [
+            c.text.strip().lower() for c in identify.xml.iterfind(
+                './/' + self.oai_namespace + 'compression'
+            ) if c.text
+        ]
+        if supported:
+            self.compression = [
+                c for c in self.compression if c in supported
+            ]
+
+    def harvest(self, **kwargs):
+        """Make an HTTP request to the OAI-PMH server.
+
+        :param kwargs: OAI-PMH arguments.
+        :rtype: :class:`sickle.OAIResponse`
+        """
+        attempt = 1
+        while True:
+            try:
+                http_response = self._request(kwargs)
+            except (requests.ConnectionError, requests.Timeout):
+                if attempt >= self.retry_attempts:
+                    self.stats.incr('failures')
+                    raise
+                delay = self._backoff(attempt)
+            else:
+                if http_response.status_code not in self.retry_status_codes:
+                    break
+                if attempt >= self.retry_attempts:
+                    self.stats.incr('failures')
+                    break
+                delay = parse_retry_after(
+                    http_response.headers.get('Retry-After')
+                )
+                if delay is None:
+                    delay = self._backoff(attempt)
+            delay = min(delay, self.retry_max_delay)
+            self.stats.incr('retries')
+            self.stats.incr('sleep_time', delay)
+            time.sleep(delay)
+            attempt += 1
+
+        http_response.raise_for_status()
+        if self.encoding:
+            http_response.encoding = self.encoding
+        return OAIResponse(http_response, params=kwargs)
+
+    def _backoff(self, attempt):
+        """Return a jittered exponential delay before a new attempt."""
+        return random.uniform(
+            0, min(self.retry_max_delay, self.retry_backoff * 2 ** attempt)
+        )
+
+    def _request(self, kwargs):
+        """Issue the HTTP request and read its (compressed) content."""
+        request_args = dict(self.request_args)
+        headers = dict(request_args.pop('headers', None) or {})
+        headers.setdefault(
+            'Accept-Encoding', ', '.join(self.compression) or 'identity'
+        )
+        if self.cache is None:
+            return self._governed_send(kwargs, headers, request_args)
+
+        key = cache_key(self.endpoint, kwargs)
+        entry = self.cache.get(key)
+        if entry is not None:
+            if self.cache_max_age is not None and \
+                    time.time() - entry.stored <= self.cache_max_age:
+                content = self.cache.read(key, entry)
+                if content is not None:
+                    self.stats.incr('cache_hits')
+                    return self._cached_response(content, entry)
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+
+        http_response = self._governed_send(kwargs, headers, request_args)
+        if http_response.status_code == 304 and entry is not None:
+            content = self.cache.read(key, entry, revalidated=True)
+            if content is not None:
+                self.stats.incr('cache_revalidations')
+                return self._cached_response(content, entry)
+            # The content was evicted in the meantime
+            headers.pop('If-None-Match', None)
+            headers.pop('If-Modified-Since', None)
+            http_response = self._governed_send(kwargs, headers, request_args)
+
+        self.cache.miss()
+        self.stats.incr('cache_misses')
+        if http_response.status_code == 200:
+            self.cache.put(
+                key, http_response.content,
+                content_type=http_response.headers.get('Content-Type'),
+                etag=http_response.headers.get('ETag'),
+                last_modified=http_response.headers.get('Last-Modified')
+            )
+        return http_response
+
+    def _cached_response(self, content, entry):
+        """Return an HTTP response with a cached content."""
+        http_response = requests.Response()
+        http_response.status_code = 200
+        http_response.url = self.endpoint
+        if entry.content_type:
+            http_response.headers['Content-Type'] = entry.content_type
+        http_response.encoding = get_encoding_from_headers(
+            http_response.headers
+        )
+        http_response._content = content
+        http_response._content_consumed = True
+        return http_response
+
+    def _governed_send(self, kwargs, headers, request_args):
+        """Send the HTTP request within the limits of the governor."""
+        if self.governor is None:
+            return self._send(kwargs, headers, request_args)
+        with self.governor.slot() as waited:
+            self.stats.incr('governor_wait', waited)
+            return self._send(kwargs, headers, request_args)
+
+    def _send(self, kwargs, headers, request_args):
+        """Send the HTTP request."""
+        if self.http_method == 'GET':
+            http_response = self.session.get(
+                self.endpoint, params=kwargs, headers=headers, stream=True,
+                **request_args
+            )
+        else:
+            http_response = self.session.post(
+                self.endpoint, data=kwargs, headers=headers, stream=True,
+                **request_args
+            )
+        self._read_content(http_response)
+        self.stats.incr('requests')
+        return http_response
+
+    def _read_content(self, http_response):
+        """Read and decompress the content of a streamed response."""
+        decompressor = _decompressor(
+            http_response.headers.get('Content-Encoding')
+        )
+        chunks = []
+        received = 0
+        elapsed = 0.0
+        for chunk in http_response.raw.stream(65536, decode_content=False):
+            received += len(chunk)
+            if decompressor is not None:
+                start = default_timer()
+                chunk = decompressor.decompress(chunk)
+                elapsed += default_timer() - start
+            chunks.append(chunk)
+        if decompressor is not None:
+            start = default_timer()
+            chunks.append(decompressor.flush())
+            elapsed += default_timer() - start
+
+        http_response._content = b''.join(chunks)
+        http_response._content_consumed = True
+        self.stats.incr('bytes_received', received)
+        self.stats.incr('bytes_decoded', len(http_response._content))
+        if decompressor is not None:
+            self.stats.incr('compressed_responses')
+            self.stats.incr('decompression_time', elapsed)
+
+
+def create_client(url, encoding=None, config=None):
+    """Create the client used to harvest an OAI-PMH endpoint.
+
+    :param url: The url of the endpoint.
+    :param encoding: Override the encoding returned by the server.
+    :param config: The OAIHarvestConfig being harvested, whose request limits
+                   override the default ones (optional).
+    """
+    governor = get_governor(url, config)
+    config = current_app.config
+    return OAIHarvesterClient(
+        url, encoding=encoding,
+        compression=config['OAIHARVESTER_HTTP_COMPRESSION'],
+        retry_attempts=config['OAIHARVESTER_RETRY_MAX_ATTEMPTS'],
+        retry_status_codes=config['OAIHARVESTER_RETRY_STATUS_CODES'],
+        retry_backoff=config['OAIHARVESTER_RETRY_BACKOFF'],
+        retry_max_delay=config['OAIHARVESTER_RETRY_MAX_DELAY'],
+        governor=governor,
+        cache=get_response_cache(),
+        cache_max_age=config['OAIHARVESTER_HTTP_CACHE_MAX_AGE']
+    )
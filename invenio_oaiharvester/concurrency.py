@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Helpers to run harvesting jobs on a thread pool."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import queue
+except ImportError:  # pragma: no cover
+    import Queue as queue
+
+try:
+    from urllib.parse import urlparse
+except ImportError:  # pragma: no cover
+    from urlparse import urlparse
+
+_DONE = object()
+_ERROR = object()
+
+
+def get_host(url):
+    """Return the host (incl. port) of an OAI-PMH endpoint."""
+    return urlparse(url).netloc.lower()
+
+
+def iter_parallel(jobs, workers, maxsize=1000):
+    """Run jobs on a thread pool and yield the items they produce.
+
+    Items are yielded in the order they are produced. If a job raises an
+    exception, the remaining jobs are stopped and the exception is raised to
+    the consumer.
+
+    :param jobs: list of callables returning an iterable of items.
+    :param workers: The number of threads.
+    :param maxsize: The maximum number of items waiting to be consumed.
+    """
+    results = queue.Queue(maxsize=maxsize)
+    stop = threading.Event()
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                results.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def run(job):
+        if stop.is_set():
+            return  # the consumer is gone, do not send more requests
+        try:
+            for item in job():
+                if not put((None, item)):
+                    return
+        except Exception as exc:
+            put((_ERROR, exc))
+        finally:
+            put((_DONE, None))
+
+    executor = ThreadPoolExecutor(max_workers=max(1, workers))
+    try:
+        for job in jobs:
+            executor.submit(run, job)
+        done = 0
+        while done < len(jobs):
+            kind, value = results.get()
+            if kind is _DONE:
+                done += 1
+            elif kind is _ERROR:
+                raise value
+            else:
+                yield value
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+def iter_ordered(func, items, workers, window=None):
+    """Apply a function to items on a thread pool and yield the results.
+
+    Results are yielded in the order of the items, and at most ``window``
+    calls are submitted ahead of the result being consumed. If a call raises
+    an exception, the pending calls are cancelled and the exception is raised
+    to the consumer.
+
+    :param func: The function to call with each item.
+    :param items: An iterable of items.
+    :param workers: The number of threads (calls are made in the consumer
+                    thread if it is ``1``).
+    :param window: The maximum number of pending calls (defaults to twice the
+                   number of threads).
+    """
+    if workers <= 1:
+        for item in items:
+            yield func(item)
+        return
+
+    window = window or 2 * workers
+    pending = deque()
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for item in items:
+            pending.append(executor.submit(func, item))
+            if len(pending) >= window:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+    finally:
+        for future in pending:
+            future.cancel()
+        executor.shutdown(wait=False)
@@ -28,3 +28,78 @@ OAIHARVESTER_DEFAULT_NAMESPACE_MAP = {
 
 OAIHARVESTER_WORKDIR = None
 """Path to directory for oaiharvester related files, default: instance_path."""
+
+OAIHARVESTER_STREAM_CHUNK_SIZE = 1000
+"""Number of records sent per signal when harvesting in streaming mode."""
+
+OAIHARVESTER_CHECKPOINT_TIMEOUT = 86400
+"""Number of seconds after which the checkpoints of a harvest which made no
+progress are considered abandoned. They are removed when another harvest of the
+configuration starts, unless it resumes them."""
+
+OAIHARVESTER_DEDUP_STORE = 'invenio_oaiharvester.dedup:MemoryIdentifierStore'
+"""Factory (or import path) of the store used to skip records harvested from
+several sets. See :mod:`invenio_oaiharvester.dedup` for available stores."""
+
+OAIHARVESTER_DESCRIPTION_CACHE = \
+    'invenio_oaiharvester.cache:MemoryDescriptionCache'
+"""Factory (or import path) of the cache of the ``Identify``, ``ListSets`` and
+``ListMetadataFormats`` responses. See :mod:`invenio_oaiharvester.cache` for
+available caches."""
+
+OAIHARVESTER_DESCRIPTION_CACHE_TTL = 86400
+"""Number of seconds the description of an endpoint is cached."""
+
+OAIHARVESTER_DESCRIPTION_CACHE_SIZE = 128
+"""Maximum number of cached endpoint descriptions."""
+
+OAIHARVESTER_MAX_CONCURRENCY_PER_HOST = 4
+"""Maximum number of sets (or records) harvested in parallel from the same
+host by a harvest."""
+
+OAIHARVESTER_MAX_IN_FLIGHT_PER_HOST = None
+"""Maximum number of requests in flight to the same host across all processes
+of the machine (unlimited if ``None``)."""
+
+OAIHARVESTER_RATE_LIMIT = None
+"""Maximum number of requests per second to the same host across all processes
+of the machine (unlimited if ``None``)."""
+
+OAIHARVESTER_RATE_LIMIT_BURST = 1
+"""Number of requests which can be sent at once to an idle host."""
+
+OAIHARVESTER_HTTP_POOL_SIZE = 10
+"""Maximum number of kept-alive connections per endpoint host and process."""
+
+OAIHARVESTER_HTTP_COMPRESSION = ['gzip', 'deflate']
+"""Content encodings accepted from OAI-PMH servers, in order of preference.
+
+They are restricted to the ``compression`` schemes of the repository when its
+``Identify`` response is fetched."""
+
+OAIHARVESTER_HTTP_CACHE = False
+"""Cache the responses of OAI-PMH servers on disk.
+
+See :mod:`invenio_oaiharvester.httpcache`."""
+
+OAIHARVESTER_HTTP_CACHE_SIZE = 1024 * 1024 * 1024
+"""Maximum size in bytes of the cached responses."""
+
+OAIHARVESTER_HTTP_CACHE_MAX_AGE = None
+"""Number of seconds cached responses are used without asking the server
+whether they changed (``None`` to always revalidate them)."""
+
+OAIHARVESTER_RETRY_MAX_ATTEMPTS = 5
+"""Maximum number of attempts of each OAI-PMH request (1 disables retries)."""
+
+OAIHARVESTER_RETRY_STATUS_CODES = [429, 502, 503, 504]
+"""HTTP status codes of the responses whose request is retried."""
+
+OAIHARVESTER_RETRY_BACKOFF = 1.0
+"""Base delay in seconds of the jittered exponential backoff between attempts.
+
+The delay before the n-th retry is drawn between 0 and ``backoff * 2 ** n``,
+unless the server sends a ``Retry-After`` header."""
+
+OAIHARVESTER_RETRY_MAX_DELAY = 120
+"""Maximum delay in seconds between attempts, including ``Retry-After``."""
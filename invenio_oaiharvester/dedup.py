@@ -0,0 +1,247 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+r"""Identifier stores used to skip records harvested from several sets.
+
+Only a digest of each OAI identifier is retained, so records can be emitted
+as soon as they are harvested. The store used by
+:func:`invenio_oaiharvester.api.list_records` is configured with
+``OAIHARVESTER_DEDUP_STORE``:
+
+.. code-block:: python
+
+    OAIHARVESTER_DEDUP_STORE = \
+        'invenio_oaiharvester.dedup:SQLiteIdentifierStore'
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import math
+import os
+import sqlite3
+import struct
+import tempfile
+
+from flask import current_app
+from werkzeug.utils import import_string
+
+from .utils import check_or_create_dir
+
+
+def identifier_digest(identifier):
+    """Return the 16 bytes digest of an OAI identifier."""
+    return hashlib.md5(identifier.encode('utf-8')).digest()
+
+
+class MemoryIdentifierStore(object):
+    """Keep the digests of the seen identifiers in a set."""
+
+    def __init__(self):
+        """Initialize the store."""
+        self._digests = set()
+
+    def add(self, identifier):
+        """Add an identifier to the store.
+
+        :param identifier: The OAI identifier.
+        :return: ``True`` if the identifier was not seen before.
+        """
+        digest = identifier_digest(identifier)
+        if digest in self._digests:
+            return False
+        self._digests.add(digest)
+        return True
+
+    def update(self, identifiers):
+        """Add several identifiers which are known to be new."""
+        for identifier in identifiers:
+            self.add(identifier)
+
+    def __len__(self):
+        """Return the number of identifiers in the store."""
+        return len(self._digests)
+
+    def close(self):
+        """Release the memory used by the store."""
+        self._digests = set()
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the store."""
+        self.close()
+
+
+class SQLiteIdentifierStore(MemoryIdentifierStore):
+    """Keep the digests of the seen identifiers in an on-disk SQLite table."""
+
+    def __init__(self, path=None):
+        """Initialize the store.
+
+        :param path: Path of the database file. A temporary file in the
+                     ``dedup`` directory of ``OAIHARVESTER_WORKDIR`` is created
+                     (and removed on close) if not provided.
+        """
+        self._temporary = path is None
+        if path is None:
+            fd, path = tempfile.mkstemp(
+                prefix='dedup_', suffix='.sqlite3',
+                dir=check_or_create_dir('dedup')
+            )
+            os.close(fd)
+        self.path = path
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=OFF')
+        self._connection.execute('PRAGMA synchronous=OFF')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS identifiers '
+            '(digest BLOB PRIMARY KEY) WITHOUT ROWID'
+        )
+
+    def add(self, identifier):
+        """Add an identifier to the store.
+
+        :param identifier: The OAI identifier.
+        :return: ``True`` if the identifier was not seen before.
+        """
+        cursor = self._connection.execute(
+            'INSERT OR IGNORE INTO identifiers VALUES (?)',
+            (sqlite3.Binary(identifier_digest(identifier)), )
+        )
+        return cursor.rowcount == 1
+
+    def update(self, identifiers):
+        """Add several identifiers which are known to be new."""
+        self._connection.executemany(
+            'INSERT OR IGNORE INTO identifiers VALUES (?)',
+            ((sqlite3.Binary(identifier_digest(i)), ) for i in identifiers)
+        )
+
+    def __contains__(self, identifier):
+        """Check if an identifier is in the store."""
+        cursor = self._connection.execute(
+            'SELECT 1 FROM identifiers WHERE digest = ?',
+            (sqlite3.Binary(identifier_digest(identifier)), )
+        )
+        return cursor.fetchone() is not None
+
+    def __len__(self):
+        """Return the number of identifiers in the store."""
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM identifiers'
+        ).fetchone()[0]
+
+    def close(self):
+        """Close the database and remove it if it is temporary."""
+        if self._connection is None:
+            return
+        self._connection.close()
+        self._connection = None
+        if self._temporary and os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class BloomIdentifierStore(MemoryIdentifierStore):
+    """Bloom filter in front of an exact identifier store.
+
+    Identifiers which are definitely new are detected in memory and written to
+    the exact ``fallback`` store in batches, which defaults to
+    :class:`SQLiteIdentifierStore`. Only possible duplicates are looked up in
+    the fallback store.
+    """
+
+    def __init__(self, capacity=10000000, error_rate=0.001, fallback=None,
+                 batch_size=10000):
+        """Initialize the store.
+
+        :param capacity: The expected number of identifiers.
+        :param error_rate: The false positive rate of the filter at capacity.
+        :param fallback: The exact store used to confirm duplicates.
+        :param batch_size: The number of new identifiers to buffer before
+                           writing them to the fallback store.
+        """
+        self.size = int(
+            -capacity * math.log(error_rate) / (math.log(2) ** 2)
+        ) or 1
+        self.hashes = max(
+            1, int(round(float(self.size) / capacity * math.log(2)))
+        )
+        self.batch_size = batch_size
+        self._bits = bytearray((self.size + 7) // 8)
+        self._fallback = fallback or SQLiteIdentifierStore()
+        self._pending = []
+        self._count = 0
+
+    def _positions(self, identifier):
+        """Return the bit positions of an identifier (double hashing)."""
+        first, second = struct.unpack('>QQ', identifier_digest(identifier))
+        second |= 1
+        size = self.size
+        return [(first + i * second) % size for i in range(self.hashes)]
+
+    def _flush(self):
+        """Write the buffered identifiers to the fallback store."""
+        if self._pending:
+            self._fallback.update(self._pending)
+            self._pending = []
+
+    def add(self, identifier):
+        """Add an identifier to the store.
+
+        :param identifier: The OAI identifier.
+        :return: ``True`` if the identifier was not seen before.
+        """
+        new = False
+        bits = self._bits
+        for position in self._positions(identifier):
+            mask = 1 << (position & 7)
+            if not bits[position >> 3] & mask:
+                bits[position >> 3] |= mask
+                new = True
+        if new:
+            self._pending.append(identifier)
+            if len(self._pending) >= self.batch_size:
+                self._flush()
+        else:
+            self._flush()
+            if not self._fallback.add(identifier):
+                return False
+        self._count += 1
+        return True
+
+    def __len__(self):
+        """Return the number of identifiers in the store."""
+        return self._count
+
+    def close(self):
+        """Close the fallback store."""
+        self._bits = bytearray()
+        self._pending = []
+        self._fallback.close()
+
+
+def create_dedup_store():
+    """Create the identifier store configured in the application."""
+    factory = current_app.config['OAIHARVESTER_DEDUP_STORE']
+    if not callable(factory):
+        factory = import_string(factory)
+    return factory()
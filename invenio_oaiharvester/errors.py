@@ -44,3 +44,7 @@ class IdentifiersOrDates(InvenioOAIHarvesterError):
 
 class InvenioOAIHarvesterConfigNotFound(InvenioOAIHarvesterError):
     """No InvenioOAIHarvesterConfig was found."""
+
+
+class InvenioOAIExtractionError(InvenioOAIHarvesterError):
+    """A harvested file could not be extracted."""
@@ -26,7 +26,10 @@
 
 from __future__ import absolute_import, print_function
 
+from werkzeug.utils import cached_property
+
 from . import config
+from .cache import create_description_cache
 from .cli import oaiharvester as oaiharvester_cmd
 
 
@@ -49,3 +52,8 @@ class InvenioOAIHarvester(object):
         for k in dir(config):
             if k.startswith('OAIHARVESTER_'):
                 app.config.setdefault(k, getattr(config, k))
+
+    @cached_property
+    def description_cache(self):
+        """Cache of the description of the harvested endpoints."""
+        return create_description_cache()
@@ -0,0 +1,211 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Rate limiting and concurrency control of the requests sent to a host.
+
+Every OAI-PMH request goes through the :class:`EndpointGovernor` of its
+endpoint host, which enforces:
+
+* a token bucket of ``rate`` requests per second, allowing bursts of ``burst``
+  requests;
+* a maximum number of requests in flight.
+
+The state of the governors is kept in lock files in the ``governor``
+directory of ``OAIHARVESTER_WORKDIR``, so the limits are shared by the threads
+and processes (e.g. Celery workers) of the same machine. The defaults are set
+with ``OAIHARVESTER_RATE_LIMIT``, ``OAIHARVESTER_RATE_LIMIT_BURST`` and
+``OAIHARVESTER_MAX_IN_FLIGHT_PER_HOST``, and can be overridden for each
+:class:`~invenio_oaiharvester.models.OAIHarvestConfig`. Both limits are off
+by default, in which case no lock file is used.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import random
+import re
+import threading
+import time
+from contextlib import contextmanager
+from timeit import default_timer
+
+from flask import current_app
+
+from .concurrency import get_host
+from .utils import check_or_create_dir
+
+try:
+    import fcntl
+except ImportError:  # pragma: no cover
+    fcntl = None
+
+_memory_locks = {}
+_memory_locks_lock = threading.Lock()
+
+_directories = {}
+
+
+def _memory_lock(path):
+    """Return the process-wide lock replacing a lock file without fcntl."""
+    with _memory_locks_lock:
+        if path not in _memory_locks:
+            _memory_locks[path] = threading.Lock()
+        return _memory_locks[path]
+
+
+class EndpointGovernor(object):
+    """Rate limiter and max-in-flight governor of an endpoint host."""
+
+    def __init__(self, url, directory, rate=None, burst=1,
+                 max_in_flight=None):
+        """Initialize the governor.
+
+        :param url: The url of the endpoint.
+        :param directory: The directory of the lock files.
+        :param rate: The maximum number of requests per second (unlimited if
+                     ``None``).
+        :param burst: The number of requests which can be sent at once after
+                      an idle period.
+        :param max_in_flight: The maximum number of concurrent requests
+                              (unlimited if ``None``).
+        """
+        self.host = get_host(url)
+        self.rate = rate
+        self.burst = max(1, burst or 1)
+        self.max_in_flight = max_in_flight
+        self.path = os.path.join(
+            directory, re.sub(r'[^\w.-]', '_', self.host) or 'default'
+        )
+
+    @contextmanager
+    def _locked(self, path, blocking=True):
+        """Hold the lock of a file, yielding it or ``None`` if it is busy."""
+        if fcntl is None:
+            lock = _memory_lock(path)
+            if not lock.acquire(blocking):
+                yield None
+                return
+            try:
+                with open(path, 'a+') as f:
+                    yield f
+                    f.flush()
+            finally:
+                lock.release()
+            return
+
+        with open(path, 'a+') as f:
+            flags = fcntl.LOCK_EX if blocking else \
+                fcntl.LOCK_EX | fcntl.LOCK_NB
+            try:
+                fcntl.flock(f.fileno(), flags)
+            except (IOError, OSError):
+                yield None
+                return
+            try:
+                yield f
+            finally:
+                f.flush()
+                fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+    def reserve(self):
+        """Take a token from the bucket.
+
+        The token is reserved even if the bucket is empty, so the caller only
+        has to wait until it becomes available.
+
+        :return: The delay in seconds before the request can be sent.
+        """
+        if not self.rate:
+            return 0.0
+        with self._locked(self.path + '.bucket') as f:
+            f.seek(0)
+            try:
+                tokens, updated = [float(v) for v in f.read().split()]
+            except ValueError:
+                tokens, updated = float(self.burst), None
+            now = time.time()
+            if updated is not None:
+                tokens = min(
+                    self.burst, tokens + max(0.0, now - updated) * self.rate
+                )
+            tokens -= 1
+            f.seek(0)
+            f.truncate()
+            f.write('{0!r} {1!r}'.format(tokens, now))
+        return -tokens / self.rate if tokens < 0 else 0.0
+
+    @contextmanager
+    def slot(self):
+        """Wait for the limits of the host and hold a request slot.
+
+        :return: context manager yielding the time spent waiting in seconds.
+        """
+        start = default_timer()
+        delay = self.reserve()
+        if delay:
+            time.sleep(delay)
+        if not self.max_in_flight:
+            yield default_timer() - start
+            return
+
+        paths = [
+            '{0}.slot{1}'.format(self.path, index)
+            for index in range(self.max_in_flight)
+        ]
+        for path in paths:
+            with self._locked(path, blocking=False) as f:
+                if f is not None:
+                    yield default_timer() - start
+                    return
+        # Every slot is taken: wait until one of them is released
+        with self._locked(random.choice(paths)):
+            yield default_timer() - start
+
+
+def _get_directory():
+    """Return the (cached) directory of the lock files."""
+    workdir = current_app.config['OAIHARVESTER_WORKDIR']
+    if workdir not in _directories:
+        _directories[workdir] = check_or_create_dir('governor')
+    return _directories[workdir]
+
+
+def get_governor(url, config=None):
+    """Return the governor of an endpoint.
+
+    :param url: The url of the endpoint.
+    :param config: The :class:`~invenio_oaiharvester.models.OAIHarvestConfig`
+                   whose limits override the default ones (optional).
+    :return: :class:`EndpointGovernor`, or ``None`` if the requests to the
+             host are not limited.
+    """
+    defaults = current_app.config
+    limits = {
+        'rate': defaults['OAIHARVESTER_RATE_LIMIT'],
+        'burst': defaults['OAIHARVESTER_RATE_LIMIT_BURST'],
+        'max_in_flight': defaults['OAIHARVESTER_MAX_IN_FLIGHT_PER_HOST'],
+    }
+    if config is not None:
+        if config.rate_limit is not None:
+            limits['rate'] = config.rate_limit
+        if config.max_in_flight is not None:
+            limits['max_in_flight'] = config.max_in_flight
+    if not limits['rate'] and not limits['max_in_flight']:
+        return None
+    return EndpointGovernor(url, _get_directory(), **limits)
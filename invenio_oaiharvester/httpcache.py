@@ -0,0 +1,237 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""On-disk cache of the responses of OAI-PMH servers.
+
+The cache is enabled with ``OAIHARVESTER_HTTP_CACHE``. Responses are indexed
+by endpoint, verb and arguments, and their (decompressed) content is stored
+once per SHA-256 digest in the ``http-cache`` directory of
+``OAIHARVESTER_WORKDIR``.
+
+Cached responses are revalidated with ``If-None-Match`` and
+``If-Modified-Since`` when the server sent an ``ETag`` or a ``Last-Modified``
+header, and served without any request while they are younger than
+``OAIHARVESTER_HTTP_CACHE_MAX_AGE``. The least recently used responses are
+evicted once the contents exceed ``OAIHARVESTER_HTTP_CACHE_SIZE`` bytes.
+"""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import namedtuple
+
+from flask import current_app
+
+from .utils import check_or_create_dir
+
+CacheEntry = namedtuple(
+    'CacheEntry', 'digest content_type etag last_modified stored'
+)
+"""Cached response of a request."""
+
+_caches = {}
+_caches_lock = threading.Lock()
+
+
+def cache_key(endpoint, params):
+    """Return the cache key of an OAI-PMH request.
+
+    :param endpoint: The url of the endpoint.
+    :param params: The OAI-PMH arguments.
+    """
+    return hashlib.sha256(json.dumps(
+        [endpoint, sorted(params.items())], sort_keys=True
+    ).encode('utf-8')).hexdigest()
+
+
+class ResponseCache(object):
+    """Content-addressed cache of response contents."""
+
+    def __init__(self, directory, max_size=1024 * 1024 * 1024):
+        """Initialize the cache.
+
+        :param directory: The directory of the cache.
+        :param max_size: The maximum size in bytes of the cached contents.
+        """
+        self.directory = directory
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._stats = {'hits': 0, 'revalidations': 0, 'misses': 0}
+        self._connection = sqlite3.connect(
+            os.path.join(directory, 'index.sqlite3'), check_same_thread=False
+        )
+        with self._connection:
+            self._connection.execute(
+                'CREATE TABLE IF NOT EXISTS responses '
+                '(key TEXT PRIMARY KEY, digest TEXT, size INTEGER, '
+                'content_type TEXT, etag TEXT, last_modified TEXT, '
+                'stored REAL, accessed REAL)'
+            )
+            self._connection.execute(
+                'CREATE INDEX IF NOT EXISTS ix_responses_accessed '
+                'ON responses (accessed)'
+            )
+
+    def _path(self, digest):
+        """Return the path of a stored content."""
+        return os.path.join(self.directory, digest[:2], digest)
+
+    def get(self, key):
+        """Return the cached response of a request.
+
+        :param key: The key of the request.
+        :rtype: :class:`CacheEntry` or ``None``
+        """
+        with self._lock:
+            row = self._connection.execute(
+                'SELECT digest, content_type, etag, last_modified, stored '
+                'FROM responses WHERE key = ?', (key, )
+            ).fetchone()
+        if row is None or not os.path.exists(self._path(row[0])):
+            return None
+        return CacheEntry(*row)
+
+    def read(self, key, entry, revalidated=False):
+        """Return the content of a cached response and mark it as used.
+
+        :param key: The key of the request.
+        :param entry: The :class:`CacheEntry` of the request.
+        :param revalidated: If the server confirmed that it is up to date.
+        :return: The content, or ``None`` if it has been evicted.
+        """
+        try:
+            with open(self._path(entry.digest), 'rb') as f:
+                content = f.read()
+        except (IOError, OSError):
+            return None
+        now = time.time()
+        with self._lock, self._connection:
+            self._stats['revalidations' if revalidated else 'hits'] += 1
+            if revalidated:
+                self._connection.execute(
+                    'UPDATE responses SET accessed = ?, stored = ? '
+                    'WHERE key = ?', (now, now, key)
+                )
+            else:
+                self._connection.execute(
+                    'UPDATE responses SET accessed = ? WHERE key = ?',
+                    (now, key)
+                )
+        return content
+
+    def miss(self):
+        """Count a request which could not be served from the cache."""
+        with self._lock:
+            self._stats['misses'] += 1
+
+    def put(self, key, content, content_type=None, etag=None,
+            last_modified=None):
+        """Store the response of a request.
+
+        :param key: The key of the request.
+        :param content: The (decompressed) content of the response.
+        :param content_type: The ``Content-Type`` header of the response.
+        :param etag: The ``ETag`` header of the response.
+        :param last_modified: The ``Last-Modified`` header of the response.
+        """
+        digest = hashlib.sha256(content).hexdigest()
+        path = self._path(digest)
+        if not os.path.exists(path):
+            if not os.path.exists(os.path.dirname(path)):
+                try:
+                    os.makedirs(os.path.dirname(path))
+                except OSError:  # pragma: no cover
+                    pass
+            fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path))
+            with os.fdopen(fd, 'wb') as f:
+                f.write(content)
+            os.rename(tmp, path)
+
+        now = time.time()
+        with self._lock, self._connection:
+            self._connection.execute(
+                'INSERT OR REPLACE INTO responses '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (key, digest, len(content), content_type, etag,
+                 last_modified, now, now)
+            )
+            self._evict()
+
+    def _evict(self):
+        """Remove the least recently used responses beyond the maximum size."""
+        size = self._connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM '
+            '(SELECT DISTINCT digest, size FROM responses)'
+        ).fetchone()[0]
+        if size <= self.max_size:
+            return
+        rows = self._connection.execute(
+            'SELECT key, digest, size FROM responses ORDER BY accessed'
+        ).fetchall()
+        for key, digest, entry_size in rows:
+            if size <= self.max_size:
+                break
+            self._connection.execute(
+                'DELETE FROM responses WHERE key = ?', (key, )
+            )
+            shared = self._connection.execute(
+                'SELECT 1 FROM responses WHERE digest = ?', (digest, )
+            ).fetchone()
+            if shared is None:
+                size -= entry_size
+                try:
+                    os.remove(self._path(digest))
+                except OSError:  # pragma: no cover
+                    pass
+
+    def get_stats(self):
+        """Return the usage statistics of the cache in this process.
+
+        :return: dict with the number of ``hits`` (served without request),
+                 ``revalidations`` (served after a ``304 Not Modified``
+                 response) and ``misses``, and the ``hit_ratio``.
+        """
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = sum(stats.values())
+        stats['hit_ratio'] = (
+            float(stats['hits'] + stats['revalidations']) / lookups
+            if lookups else 0.0
+        )
+        return stats
+
+
+def get_response_cache():
+    """Return the response cache of the application, if it is enabled."""
+    if not current_app.config['OAIHARVESTER_HTTP_CACHE']:
+        return None
+    directory = check_or_create_dir('http-cache')
+    key = (os.getpid(), directory)
+    with _caches_lock:
+        if key not in _caches:
+            _caches[key] = ResponseCache(
+                directory, current_app.config['OAIHARVESTER_HTTP_CACHE_SIZE']
+            )
+        return _caches[key]
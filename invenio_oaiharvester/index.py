@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Offset index of the records of harvested files.
+
+When :class:`~invenio_oaiharvester.writer.RecordWriter` is created with
+``index=True``, the position of each record in the files it writes is stored
+in a SQLite database next to them (``INDEX_FILE_NAME``), so a record can be
+read back by its OAI identifier without parsing the files:
+
+.. code-block:: python
+
+    with RecordIndex.open('arxiv') as index:
+        index.lookup('oai:arXiv.org:1501.00001')  # IndexEntry
+        index.read('oai:arXiv.org:1501.00001')  # XML of the record
+
+The offsets are positions in the uncompressed content of the files: records
+of uncompressed files are read with a single seek, while compressed files are
+decompressed up to the record.
+"""
+
+from __future__ import absolute_import, print_function
+
+import os
+import re
+import sqlite3
+from collections import namedtuple
+
+from .utils import IDENTIFIER_SCAN_SIZE, identifier_extraction_from_string, \
+    open_harvested_file
+
+INDEX_FILE_NAME = 'oaiharvest_index.sqlite3'
+"""Name of the index in the directory of the harvested files."""
+
+IndexEntry = namedtuple(
+    'IndexEntry', 'identifier file offset length datestamp'
+)
+"""Position of a record in a harvested file."""
+
+_DATESTAMP = re.compile(br'<(?:[\w.-]+:)?datestamp\s*>([^<]*)<')
+
+
+def record_header(record, encoding='utf-8'):
+    """Return the identifier and datestamp of a harvested record.
+
+    :param record: A harvested record, or its XML as a (byte) string.
+    :param encoding: The encoding of the XML.
+    :return: tuple of the OAI identifier and datestamp (``None`` if unknown).
+    """
+    header = getattr(record, 'header', None)
+    if header is not None:
+        return header.identifier, header.datestamp
+    raw = getattr(record, 'raw', record)
+    if not isinstance(raw, bytes):
+        raw = raw.encode(encoding)
+    datestamp = _DATESTAMP.search(raw, 0, IDENTIFIER_SCAN_SIZE)
+    return (
+        identifier_extraction_from_string(raw),
+        datestamp.group(1).strip().decode(encoding) if datestamp else None
+    )
+
+
+class RecordIndex(object):
+    """Map OAI identifiers to the position of the records in their files."""
+
+    def __init__(self, path):
+        """Initialize the index.
+
+        :param path: Path of the database file, which is created if needed.
+                     File names are relative to its directory.
+        """
+        self.path = path
+        self.directory = os.path.dirname(os.path.abspath(path))
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute('PRAGMA journal_mode=WAL')
+        self._connection.execute('PRAGMA synchronous=NORMAL')
+        self._connection.execute(
+            'CREATE TABLE IF NOT EXISTS records '
+            '(identifier TEXT PRIMARY KEY, file TEXT, offset INTEGER, '
+            'length INTEGER, datestamp TEXT) WITHOUT ROWID'
+        )
+        self._connection.commit()
+
+    @classmethod
+    def open(cls, directory):
+        """Open the index of a directory of harvested files."""
+        return cls(os.path.join(directory, INDEX_FILE_NAME))
+
+    def update(self, entries):
+        """Add the records of a file, replacing previous harvests.
+
+        :param entries: iterable of :class:`IndexEntry`.
+        """
+        with self._connection:
+            self._connection.executemany(
+                'INSERT OR REPLACE INTO records VALUES (?, ?, ?, ?, ?)',
+                entries
+            )
+
+    def lookup(self, identifier):
+        """Return the position of a record.
+
+        :param identifier: The OAI identifier.
+        :return: :class:`IndexEntry` or ``None`` if the record is not indexed.
+        """
+        row = self._connection.execute(
+            'SELECT * FROM records WHERE identifier = ?', (identifier, )
+        ).fetchone()
+        return IndexEntry(*row) if row is not None else None
+
+    def read(self, identifier):
+        """Return the XML of a record.
+
+        :param identifier: The OAI identifier.
+        :return: the record as bytes, or ``None`` if it is not indexed.
+        """
+        entry = self.lookup(identifier)
+        if entry is None:
+            return None
+        with open_harvested_file(
+                os.path.join(self.directory, entry.file)) as f:
+            f.seek(entry.offset)
+            return f.read(entry.length)
+
+    def __len__(self):
+        """Return the number of records in the index."""
+        return self._connection.execute(
+            'SELECT COUNT(*) FROM records'
+        ).fetchone()[0]
+
+    def close(self):
+        """Close the database."""
+        if self._connection is not None:
+            self._connection.close()
+            self._connection = None
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Close the index."""
+        self.close()
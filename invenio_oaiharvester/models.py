@@ -25,6 +25,8 @@ import datetime
 
 from invenio_db import db
 
+from .utils import chunks
+
 
 class OAIHarvestConfig(db.Model):
     """Represents a OAIHarvestConfig record."""
@@ -41,6 +43,8 @@ class OAIHarvestConfig(db.Model):
         year=1900, month=1, day=1
     ), nullable=True)
     setspecs = db.Column(db.Text, nullable=False)
+    rate_limit = db.Column(db.Float, nullable=True)
+    max_in_flight = db.Column(db.Integer, nullable=True)
 
     def save(self):
         """Save object to persistent storage."""
@@ -52,4 +56,196 @@ class OAIHarvestConfig(db.Model):
         self.lastrun = new_date or datetime.datetime.now()
 
 
-__all__ = ('OAIHarvestConfig',)
+class OAIHarvestCheckpoint(db.Model):
+    """Represents the progress of a harvest of a OAIHarvestConfig.
+
+    One checkpoint is kept for every set (and date window) being harvested,
+    and updated after each page of records. The checkpoints of a harvest share
+    its ``run_id``, so that overlapping harvests of a configuration do not
+    touch each other's checkpoints.
+    """
+
+    __tablename__ = 'oaiharvester_checkpoints'
+
+    id = db.Column(db.Integer, primary_key=True)
+    config_id = db.Column(
+        db.Integer,
+        db.ForeignKey(OAIHarvestConfig.id, ondelete='CASCADE'),
+        nullable=False
+    )
+    run_id = db.Column(db.String(32), nullable=False, index=True)
+    verb = db.Column(db.String(32), nullable=False, default='ListRecords')
+    metadataprefix = db.Column(db.String(255), nullable=False)
+    setspec = db.Column(db.String(255), nullable=True)
+    from_date = db.Column(db.String(32), nullable=True)
+    until_date = db.Column(db.String(32), nullable=True)
+    resumption_token = db.Column(db.Text, nullable=True)
+    records_seen = db.Column(db.Integer, nullable=False, default=0)
+    last_datestamp = db.Column(db.String(32), nullable=True)
+    finished = db.Column(db.Boolean(name='finished'), nullable=False,
+                         default=False)
+    created = db.Column(db.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow)
+    updated = db.Column(db.DateTime, nullable=False,
+                        default=datetime.datetime.utcnow,
+                        onupdate=datetime.datetime.utcnow)
+
+    config = db.relationship(
+        OAIHarvestConfig,
+        backref=db.backref('checkpoints', cascade='all, delete-orphan')
+    )
+
+    @classmethod
+    def create(cls, config, params, run_id, verb='ListRecords'):
+        """Create the checkpoint of a ``ListRecords`` request.
+
+        :param config: The OAIHarvestConfig being harvested.
+        :param params: The ``ListRecords`` arguments.
+        :param run_id: The identifier of the harvest.
+        :param verb: The verb issued, ``ListRecords`` or ``ListIdentifiers``
+                     (whose resumption tokens cannot be used with the other).
+        """
+        return cls(
+            config=config,
+            run_id=run_id,
+            verb=verb,
+            metadataprefix=params['metadataPrefix'],
+            setspec=params.get('set'),
+            from_date=params.get('from'),
+            until_date=params.get('until'),
+            records_seen=0,
+            finished=False,
+        )
+
+    @property
+    def params(self):
+        """The ``ListRecords`` arguments of the checkpoint."""
+        params = {
+            'metadataPrefix': self.metadataprefix,
+            'from': self.from_date,
+            'until': self.until_date,
+        }
+        if self.setspec:
+            params['set'] = self.setspec
+        return params
+
+    def update_progress(self, token, records, last_datestamp=None):
+        """Record that a page of records has been processed.
+
+        :param token: The resumption token of the page, ``None`` if it was
+                      the last one.
+        :param records: The number of records in the page.
+        :param last_datestamp: The latest datestamp of the page records.
+        """
+        self.resumption_token = token
+        self.records_seen += records
+        if last_datestamp and last_datestamp > (self.last_datestamp or ''):
+            self.last_datestamp = last_datestamp
+        self.finished = not token
+
+
+class OAIHarvestRecord(db.Model):
+    """Represents the latest harvested version of a record of a source.
+
+    The index is used to only fetch new or changed records when harvesting
+    headers first, and to skip the records whose content did not change.
+    """
+
+    __tablename__ = 'oaiharvester_records'
+    __table_args__ = (
+        db.UniqueConstraint('baseurl', 'metadataprefix', 'identifier',
+                            name='uq_oaiharvester_records_identifier'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    baseurl = db.Column(db.String(255), nullable=False)
+    metadataprefix = db.Column(db.String(255), nullable=False)
+    identifier = db.Column(db.String(255), nullable=False)
+    datestamp = db.Column(db.String(32), nullable=False)
+    fingerprint = db.Column(db.String(64), nullable=True)
+
+    @classmethod
+    def exists(cls, baseurl, metadataprefix):
+        """Check if records of a source are indexed."""
+        return db.session.query(cls.query.filter_by(
+            baseurl=baseurl, metadataprefix=metadataprefix
+        ).exists()).scalar()
+
+    @classmethod
+    def _lookup(cls, baseurl, metadataprefix, identifiers, *columns):
+        """Yield the given columns of the indexed records."""
+        for chunk in chunks(set(identifiers), 500):
+            for row in db.session.query(cls.identifier, *columns).filter(
+                cls.baseurl == baseurl,
+                cls.metadataprefix == metadataprefix,
+                cls.identifier.in_(chunk)
+            ):
+                yield row
+
+    @classmethod
+    def get_datestamps(cls, baseurl, metadataprefix, identifiers):
+        """Return the indexed datestamps of records.
+
+        :param baseurl: The url of the source.
+        :param metadataprefix: The metadata prefix of the records.
+        :param identifiers: The OAI identifiers of the records.
+        :return: dict mapping the indexed identifiers to their datestamp.
+        """
+        return dict(cls._lookup(baseurl, metadataprefix, identifiers,
+                                cls.datestamp))
+
+    @classmethod
+    def get_fingerprints(cls, baseurl, metadataprefix, identifiers):
+        """Return the indexed fingerprints of records.
+
+        :param baseurl: The url of the source.
+        :param metadataprefix: The metadata prefix of the records.
+        :param identifiers: The OAI identifiers of the records.
+        :return: dict mapping the indexed identifiers to their fingerprint.
+        """
+        return dict(cls._lookup(baseurl, metadataprefix, identifiers,
+                                cls.fingerprint))
+
+    @classmethod
+    def index(cls, baseurl, metadataprefix, headers, fingerprints=None):
+        """Index harvested records.
+
+        :param baseurl: The url of the source.
+        :param metadataprefix: The metadata prefix of the records.
+        :param headers: The :class:`sickle.models.Header` of the records.
+        :param fingerprints: dict mapping identifiers to the fingerprint of
+                             the record content (optional).
+        """
+        fingerprints = fingerprints or {}
+        headers = dict((h.identifier, h.datestamp) for h in headers)
+        indexed = dict(
+            (identifier, (id_, datestamp, fingerprint))
+            for identifier, id_, datestamp, fingerprint in cls._lookup(
+                baseurl, metadataprefix, headers,
+                cls.id, cls.datestamp, cls.fingerprint
+            )
+        )
+        inserts = []
+        updates = []
+        for identifier, datestamp in headers.items():
+            fingerprint = fingerprints.get(identifier)
+            if identifier not in indexed:
+                inserts.append(dict(
+                    baseurl=baseurl, metadataprefix=metadataprefix,
+                    identifier=identifier, datestamp=datestamp,
+                    fingerprint=fingerprint
+                ))
+                continue
+            id_, old_datestamp, old_fingerprint = indexed[identifier]
+            fingerprint = fingerprint or old_fingerprint
+            if (datestamp, fingerprint) != (old_datestamp, old_fingerprint):
+                updates.append(dict(
+                    id=id_, datestamp=datestamp, fingerprint=fingerprint
+                ))
+        if inserts:
+            db.session.bulk_insert_mappings(cls, inserts)
+        if updates:
+            db.session.bulk_update_mappings(cls, updates)
+
+
+__all__ = ('OAIHarvestCheckpoint', 'OAIHarvestConfig', 'OAIHarvestRecord')
@@ -25,7 +25,8 @@ _signals = Namespace()
 
 oaiharvest_finished = _signals.signal('oaiharvest-finished')
 """
-This signal is sent when a harvest has completed.
+This signal is sent when a harvest has completed. When harvesting in streaming
+mode, it is sent once for each chunk of harvested records instead.
 
 Example subscriber
 
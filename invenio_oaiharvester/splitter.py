@@ -0,0 +1,249 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Split OAI-PMH documents into records without parsing them.
+
+:class:`RecordSplitter` finds the boundaries of the records in the original
+bytes of a response (e.g. a ``bytes`` object or an :class:`mmap.mmap` of a
+harvested file) and returns them as offsets or :class:`memoryview` slices
+(plain slices on Python 2).
+Only the part of the document before the first record is parsed, to build the
+``OAI-PMH`` wrapper of :func:`~invenio_oaiharvester.utils.\
+record_extraction_from_string`:
+
+.. code-block:: python
+
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        for record in RecordSplitter(data).records():
+            ...
+
+The wrapped records are equivalent to the ones of
+:func:`~invenio_oaiharvester.utils.record_extraction_from_string` once
+parsed, but are not re-serialized: the prefixes and namespace declarations of
+the original document are kept (the declarations in scope are added to the
+start tag of each record).
+
+Only UTF-8 encoded documents can be split, and ``record`` tags are found in
+the text of the document, outside comments and CDATA sections.
+"""
+
+from __future__ import absolute_import, print_function
+
+import copy
+import re
+import sys
+
+from flask import current_app
+from lxml import etree
+
+from .errors import InvenioOAIHarvesterError
+
+_RECORD_TAG = re.compile(
+    br'<!--.*?-->|<!\[CDATA\[.*?\]\]>|<(/?)(?:[\w.-]+:)?record(?=[\s/>])',
+    re.DOTALL
+)
+
+_XML_DECLARATION = re.compile(
+    br'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([\w.-]+)["\']'
+)
+
+_TAG_NAME = re.compile(br'<[^\s/>]+')
+
+_NAMESPACE_DECLARATION = re.compile(br'xmlns(?::([\w.-]+))?\s*=')
+
+# On Python 2, memoryview does not support mmap objects and its slices cannot
+# be joined, so the records are sliced from the data itself.
+_MEMORYVIEW = sys.version_info[0] >= 3
+
+
+class RecordSplitter(object):
+    """Find the records of an OAI-PMH document in its bytes."""
+
+    def __init__(self, data,
+                 oai_namespace="http://www.openarchives.org/OAI/2.0/",
+                 nsmap=None):
+        """Initialize the splitter.
+
+        :param data: The document, as an object supporting the buffer
+                     protocol and ``find`` (``bytes``, ``bytearray`` or
+                     :class:`mmap.mmap`).
+        :param oai_namespace: The OAI-PMH namespace (records without
+                              namespace if empty).
+        :param nsmap: The namespaces declared by the wrapper (defaults to
+                      the OAI-PMH namespace, or to
+                      ``OAIHARVESTER_DEFAULT_NAMESPACE_MAP`` if it is empty).
+        """
+        match = _XML_DECLARATION.match(data[:256])
+        if match and match.group(1).lower() not in (
+                b'utf-8', b'utf8', b'ascii', b'us-ascii'):
+            raise InvenioOAIHarvesterError(
+                'Cannot split a {0} encoded document.'.format(
+                    match.group(1).decode('ascii'))
+            )
+        self.data = data
+        self.view = memoryview(data) if _MEMORYVIEW else data
+        self.oai_namespace = oai_namespace
+        self.nsmap = nsmap
+        self._wrapper = None
+
+    def offsets(self):
+        """Return the boundaries of the records.
+
+        The end of a record includes the text following it, like the tail of
+        the elements serialized by
+        :func:`~invenio_oaiharvester.utils.record_extraction_from_string`.
+
+        :return: generator of ``(start, end)`` offsets.
+        """
+        data = self.data
+        depth = 0
+        start = None
+        for match in _RECORD_TAG.finditer(data):
+            if match.group(1) is None:
+                continue  # comment or CDATA section
+            tag_end = data.find(b'>', match.end())
+            if match.group(1):
+                depth -= 1
+                if not depth:
+                    end = data.find(b'<', tag_end)
+                    yield start, end if end != -1 else len(data)
+                continue
+            if data[tag_end - 1:tag_end] == b'/':
+                continue  # empty element
+            if not depth:
+                if self._wrapper is None:
+                    self._wrapper = self._build_wrapper(tag_end + 1)
+                if not self._wrapper:
+                    return  # the records are not in the OAI-PMH namespace
+                start = match.start()
+            depth += 1
+
+    def __iter__(self):
+        """Return the records as :class:`memoryview` (or plain) slices."""
+        view = self.view
+        for start, end in self.offsets():
+            yield view[start:end]
+
+    def records(self):
+        """Return the records wrapped with the headers of the response.
+
+        :return: generator of XML records as bytes.
+        """
+        for start, end in self.offsets():
+            yield self.wrap(start, end)
+
+    def wrap(self, start, end):
+        """Return a record wrapped with the headers of the response.
+
+        :param start: The offset of a record returned by :meth:`offsets`.
+        :param end: The end offset of the record.
+        """
+        prefix, namespaces, suffix = self._wrapper
+        data = self.data
+        name_end = _TAG_NAME.match(data, start).end()
+        declared = set(_NAMESPACE_DECLARATION.findall(
+            data[name_end:data.find(b'>', name_end)]
+        ))
+        view = self.view
+        return b''.join((
+            prefix,
+            view[start:name_end],
+            b''.join(declaration for name, declaration in namespaces
+                     if name not in declared),
+            view[name_end:end],
+            suffix
+        ))
+
+    def close(self):
+        """Release the view of the data, e.g. before closing a mapped file."""
+        if _MEMORYVIEW:
+            self.view.release()
+
+    def _build_wrapper(self, end):
+        """Parse the headers preceding the first record.
+
+        :param end: The end offset of the start tag of the first record.
+        :return: tuple of the wrapper prefix, the namespace declarations in
+                 scope of the records and the wrapper suffix, or ``False`` if
+                 the record is not in the OAI-PMH namespace.
+        """
+        nsmap = self.nsmap
+        if self.oai_namespace:
+            namespace_prefix = '{{{0}}}'.format(self.oai_namespace)
+            if nsmap is None:
+                nsmap = {'OAI-PMH': self.oai_namespace}
+        else:
+            namespace_prefix = ''
+            if nsmap is None:
+                nsmap = current_app.config.get(
+                    'OAIHARVESTER_DEFAULT_NAMESPACE_MAP'
+                )
+        header_tags = ('{0}responseDate'.format(namespace_prefix),
+                       '{0}request'.format(namespace_prefix))
+
+        parser = etree.XMLPullParser(events=('start', 'end'))
+        parser.feed(bytes(self.view[:end]))
+        headers = []
+        record = None
+        for event, element in parser.read_events():
+            if event == 'start':
+                record = element
+            elif element.tag in header_tags:
+                headers.append(element)
+        if record is None or \
+                record.tag != '{0}record'.format(namespace_prefix):
+            return False
+
+        wrapper = etree.Element('OAI-PMH', nsmap=nsmap)
+        for header in headers:
+            wrapper.append(copy.deepcopy(header))
+        prefix = etree.tostring(wrapper)
+        if prefix.endswith(b'/>'):
+            prefix = prefix[:-2] + b'>'
+        else:
+            prefix = prefix[:-len(b'</OAI-PMH>')]
+
+        namespaces = []
+        parent = record.getparent()
+        in_scope = parent.nsmap if parent is not None else {}
+        for name in sorted(in_scope, key=lambda name: name or ''):
+            declaration = ' xmlns{0}="{1}"'.format(
+                ':' + name if name else '', in_scope[name]
+            )
+            namespaces.append((
+                name.encode('utf-8') if name else b'',
+                declaration.encode('utf-8')
+            ))
+        return prefix, namespaces, b'</OAI-PMH>'
+
+
+def split_records(data,
+                  oai_namespace="http://www.openarchives.org/OAI/2.0/"):
+    """Given a OAI-PMH document return every record incl. headers.
+
+    This is a faster alternative to
+    :func:`~invenio_oaiharvester.utils.record_extraction_from_string` for
+    UTF-8 encoded documents, see :class:`RecordSplitter`.
+
+    :param data: The document, e.g. ``bytes`` or an :class:`mmap.mmap`.
+    :param oai_namespace: optionally provide the OAI-PMH namespace
+    :return: generator of XML records as bytes.
+    """
+    return RecordSplitter(data, oai_namespace).records()
@@ -22,6 +22,7 @@
 from __future__ import absolute_import, print_function
 
 from celery import shared_task
+from flask import current_app
 
 from .api import get_records, list_records
 from .signals import oaiharvest_finished
@@ -31,7 +32,7 @@ from .utils import get_identifier_names
 @shared_task
 def get_specific_records(identifiers, metadata_prefix=None, url=None,
                          name=None, signals=True, encoding=None,
-                         **kwargs):
+                         concurrency=1, raise_on_error=True, **kwargs):
     """Harvest specific records from an OAI repo via OAI-PMH identifiers.
 
     :param metadata_prefix: The prefix for the metadata return (e.g. 'oai_dc')
@@ -42,19 +43,32 @@ def get_specific_records(identifiers, metadata_prefix=None, url=None,
     :param signals: If signals should be emitted about results.
     :param encoding: Override the encoding returned by the server. ISO-8859-1
                      if it is not provided by the server.
+    :param concurrency: The number of records fetched in parallel.
+    :param raise_on_error: If ``False``, the records which cannot be harvested
+                           are logged and skipped instead of failing the task.
     """
     identifiers = get_identifier_names(identifiers)
     request, records = get_records(identifiers, metadata_prefix, url, name,
-                                   encoding)
+                                   encoding, concurrency=concurrency,
+                                   raise_on_error=raise_on_error)
+    for identifier, error in request.errors.items():
+        current_app.logger.warning(
+            'Could not harvest %s from %s: %s', identifier, request.endpoint,
+            error
+        )
     if signals:
         oaiharvest_finished.send(request, records=records, name=name, **kwargs)
+    log_stats(request)
 
 
 @shared_task
 def list_records_from_dates(metadata_prefix=None, from_date=None,
                             until_date=None, url=None,
                             name=None, setspecs=None, signals=True,
-                            encoding=None, **kwargs):
+                            encoding=None, stream=False, concurrency=1,
+                            partitions=1, resume=False, prefetch=0,
+                            headers_first=False, skip_unchanged=False,
+                            **kwargs):
     """Harvest multiple records from an OAI repo.
 
     :param metadata_prefix: The prefix for the metadata return (e.g. 'oai_dc')
@@ -67,6 +81,19 @@ def list_records_from_dates(metadata_prefix=None, from_date=None,
     :param signals: If signals should be emitted about results.
     :param encoding: Override the encoding returned by the server. ISO-8859-1
                      if it is not provided by the server.
+    :param stream: If records should be harvested in streaming mode, in which
+                   case signals are emitted for each chunk of records.
+    :param concurrency: The number of sets or date windows harvested in
+                        parallel.
+    :param partitions: The number of date windows to split the harvest into.
+    :param resume: If the last interrupted harvest of the configuration should
+                   be resumed.
+    :param prefetch: The number of pages fetched ahead of the page being
+                     processed.
+    :param headers_first: If only new or changed records should be fetched,
+                          after listing their headers.
+    :param skip_unchanged: If the records whose content did not change since
+                           the previous harvest should not be sent.
     """
     request, records = list_records(
         metadata_prefix,
@@ -75,7 +102,33 @@ def list_records_from_dates(metadata_prefix=None, from_date=None,
         url,
         name,
         setspecs,
-        encoding
+        encoding,
+        stream=True,
+        concurrency=concurrency,
+        partitions=partitions,
+        resume=resume,
+        prefetch=prefetch,
+        headers_first=headers_first,
+        skip_unchanged=skip_unchanged
+    )
+    size = None
+    if stream:
+        size = current_app.config['OAIHARVESTER_STREAM_CHUNK_SIZE']
+    # The harvest is committed once each batch has been sent
+    for batch in records.batches(size):
+        if signals:
+            oaiharvest_finished.send(
+                request, records=batch, name=name, **kwargs
+            )
+    log_stats(request)
+
+
+def log_stats(request):
+    """Log the statistics of a harvest.
+
+    :param request: The client used for the harvest.
+    """
+    current_app.logger.info(
+        'Harvest statistics of %s: %s', request.endpoint,
+        request.stats.to_dict()
     )
-    if signals:
-        oaiharvest_finished.send(request, records=records, name=name, **kwargs)
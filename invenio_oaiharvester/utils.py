@@ -21,27 +21,83 @@
 
 from __future__ import absolute_import, print_function, unicode_literals
 
-import codecs
+import copy
+import fnmatch
+import gzip
+import hashlib
 import itertools
+import mmap
 import os
 import re
 import tempfile
+from collections import deque, namedtuple
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, \
+    as_completed, wait
 from contextlib import closing
-from datetime import datetime
+from datetime import datetime, timedelta
 
 from flask import current_app
 from lxml import etree
+from sickle import oaiexceptions
+from sickle.app import DEFAULT_CLASS_MAP
+from sickle.iterator import VERBS_ELEMENTS
 
-from .errors import InvenioOAIHarvesterConfigNotFound
+from .errors import InvenioOAIExtractionError, \
+    InvenioOAIHarvesterConfigNotFound, InvenioOAIHarvesterError
+from .splitter import RecordSplitter
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
 
 REGEXP_OAI_ID = re.compile(r"<identifier.*?>(.*?)</identifier>", re.DOTALL)
 
 
+def get_compression(path):
+    """Return the compression of a file, detected by its magic number.
+
+    :param path: the path of the file
+    :return: ``'gzip'``, ``'zstd'`` or ``None`` if it is not compressed
+    """
+    with open(path, 'rb') as f:
+        magic = f.read(4)
+    if magic.startswith(b'\x1f\x8b'):
+        return 'gzip'
+    if magic == b'\x28\xb5\x2f\xfd':
+        return 'zstd'
+
+
+def open_harvested_file(path):
+    """Open a harvested file, decompressing it on the fly.
+
+    Gzip and Zstandard (which requires the ``zstandard`` package) compressed
+    files are supported.
+
+    :param path: the path of the file
+    :return: binary file object
+    """
+    compression = get_compression(path)
+    if compression == 'gzip':
+        return gzip.open(path, 'rb')
+    if compression == 'zstd':
+        if zstandard is None:
+            raise InvenioOAIHarvesterError(
+                'The zstandard package is required to read {0}.'.format(path)
+            )
+        return zstandard.ZstdDecompressor().stream_reader(
+            open(path, 'rb'), closefd=True
+        )
+    return open(path, 'rb')
+
+
 def record_extraction_from_file(
         path,
         oai_namespace="http://www.openarchives.org/OAI/2.0/"):
     """Given a harvested file return a list of every record incl. headers.
 
+    See :func:`iter_record_extraction_from_file` to process large files.
+
     :param path: is the path of the file harvested
     :type path: str
 
@@ -51,12 +107,208 @@ def record_extraction_from_file(
     :return: return a list of XML records as string
     :rtype: str
     """
-    list_of_records = []
-    with open(path) as xml_file:
-        list_of_records = record_extraction_from_string(
-            xml_file.read(), oai_namespace
-        )
-    return list_of_records
+    return list(iter_record_extraction_from_file(path, oai_namespace))
+
+
+def iter_record_extraction_from_file(
+        source,
+        oai_namespace="http://www.openarchives.org/OAI/2.0/",
+        split=False):
+    """Given a harvested file yield every record incl. headers.
+
+    The file is parsed incrementally and each record is released once it has
+    been serialized, so the memory used does not depend on the size of the
+    file. The records are wrapped like in
+    :func:`record_extraction_from_string`. Gzip and Zstandard compressed
+    files are decompressed on the fly (see :func:`open_harvested_file`).
+
+    :param source: the path of the file harvested or a binary file object
+    :type source: str or file
+
+    :param oai_namespace: optionally provide the OAI-PMH namespace
+    :type oai_namespace: str
+
+    :param split: memory-map uncompressed files and find their records with
+                  :class:`~invenio_oaiharvester.splitter.RecordSplitter`
+                  instead of parsing them
+    :type split: bool
+
+    :return: generator of XML records as string
+    :rtype: generator
+    """
+    if oai_namespace:
+        nsmap = {
+            'OAI-PMH': oai_namespace
+        }
+    else:
+        nsmap = current_app.config.get("OAIHARVESTER_DEFAULT_NAMESPACE_MAP")
+    for record in _iter_file_records(source, oai_namespace, nsmap, split):
+        yield record
+
+
+ExtractedFile = namedtuple('ExtractedFile', 'path records error')
+"""Records extracted from a file, or the error which prevented it."""
+
+
+def record_extraction_from_dir(
+        path,
+        oai_namespace="http://www.openarchives.org/OAI/2.0/",
+        workers=1, ordered=True, pattern='*.xml*', split=False):
+    """Given a directory of harvested files return the records of each file.
+
+    The files are extracted by a pool of ``workers`` processes, and the
+    errors of a file (e.g. invalid XML) are reported without interrupting
+    the extraction of the others. At most ``2 * workers`` files are extracted
+    ahead of the one being consumed.
+
+    :param path: the directory of the files harvested (e.g. by
+                 :func:`write_to_dir`)
+    :type path: str
+
+    :param oai_namespace: optionally provide the OAI-PMH namespace
+    :type oai_namespace: str
+
+    :param workers: the number of processes extracting files in parallel
+    :type workers: int
+
+    :param ordered: return the files in the order of their names instead of
+                    as soon as they are extracted
+    :type ordered: bool
+
+    :param pattern: the pattern of the names of the files to extract
+    :type pattern: str
+
+    :param split: see :func:`iter_record_extraction_from_file`
+    :type split: bool
+
+    :return: generator of :data:`ExtractedFile` tuples of the path of each
+             file, the list of its records and the
+             :class:`~invenio_oaiharvester.errors.InvenioOAIExtractionError`
+             if it could not be extracted (``None`` otherwise)
+    :rtype: generator
+    """
+    if oai_namespace:
+        nsmap = {
+            'OAI-PMH': oai_namespace
+        }
+    else:
+        nsmap = current_app.config.get("OAIHARVESTER_DEFAULT_NAMESPACE_MAP")
+    paths = (
+        os.path.join(path, name) for name in sorted(os.listdir(path))
+        if fnmatch.fnmatch(name, pattern) and
+        os.path.isfile(os.path.join(path, name))
+    )
+    args = (oai_namespace, nsmap, split)
+    if workers <= 1:
+        for file_path in paths:
+            yield _extract_file(file_path, *args)
+        return
+
+    with ProcessPoolExecutor(workers) as executor:
+        pending = deque()
+        for file_path in paths:
+            pending.append(executor.submit(_extract_file, file_path, *args))
+            if len(pending) < 2 * workers:
+                continue
+            if ordered:
+                yield pending.popleft().result()
+            else:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    pending.remove(future)
+                    yield future.result()
+        futures = pending if ordered else as_completed(pending)
+        for future in futures:
+            yield future.result()
+
+
+def _extract_file(path, oai_namespace, nsmap, split):
+    """Extract the records of a file, in a worker process."""
+    try:
+        return ExtractedFile(path, list(
+            _iter_file_records(path, oai_namespace, nsmap, split)
+        ), None)
+    except Exception as e:
+        return ExtractedFile(path, [], InvenioOAIExtractionError(
+            '{0}: {1}'.format(path, e)
+        ))
+
+
+def _iter_file_records(source, oai_namespace, nsmap, split=False):
+    """Extract the records of a file with the given wrapper namespaces."""
+    if hasattr(source, 'read'):
+        return _iter_parsed_records(source, oai_namespace, nsmap)
+    compression = get_compression(source)
+    if compression:
+        return _iter_decompressed_records(source, oai_namespace, nsmap)
+    if split and os.path.getsize(source):
+        return _iter_split_records(source, oai_namespace, nsmap)
+    # libxml2 reads the file itself
+    return _iter_parsed_records(source, oai_namespace, nsmap)
+
+
+def _iter_decompressed_records(path, oai_namespace, nsmap):
+    """Parse the records of a compressed file."""
+    with closing(open_harvested_file(path)) as stream:
+        for record in _iter_parsed_records(stream, oai_namespace, nsmap):
+            yield record
+
+
+def _iter_split_records(path, oai_namespace, nsmap):
+    """Split the records of a memory-mapped file."""
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if hasattr(mmap, 'MADV_SEQUENTIAL'):
+            data.madvise(mmap.MADV_SEQUENTIAL)
+        try:
+            splitter = RecordSplitter(data, oai_namespace, nsmap=nsmap)
+        except InvenioOAIHarvesterError:
+            data.close()
+            for record in _iter_parsed_records(path, oai_namespace, nsmap):
+                yield record
+            return
+        try:
+            for record in splitter.records():
+                yield record
+        finally:
+            splitter.close()
+            data.close()
+
+
+def _iter_parsed_records(source, oai_namespace, nsmap):
+    """Parse the records of a file incrementally."""
+    namespace_prefix = "{{{0}}}".format(oai_namespace) if oai_namespace \
+        else ""
+    record_tag = "{0}record".format(namespace_prefix)
+    header_tags = (
+        "{0}responseDate".format(namespace_prefix),
+        "{0}request".format(namespace_prefix),
+    )
+    headers = []
+    depth = 0
+
+    # Without namespace, the tags filter matches the names in any namespace
+    context = etree.iterparse(
+        source, events=("start", "end"), huge_tree=True,
+        tag=header_tags + (record_tag, )
+    )
+    for event, element in context:
+        if element.tag != record_tag:
+            if event == "end" and not depth and element.tag in header_tags:
+                headers.append(element)
+            continue
+        if event == "start":
+            depth += 1
+            continue
+        depth -= 1
+        if depth:
+            continue
+        wrapper = etree.Element("OAI-PMH", nsmap=nsmap)
+        for header in headers:
+            wrapper.append(copy.deepcopy(header))
+        wrapper.append(element)
+        yield etree.tostring(wrapper)
+        wrapper.clear()
 
 
 def record_extraction_from_string(
@@ -106,6 +358,12 @@ def identifier_extraction_from_string(
         oai_namespace="http://www.openarchives.org/OAI/2.0/"):
     """Given a OAI-PMH XML string return the OAI identifier.
 
+    The identifier is looked up with a regular expression in the first
+    ``IDENTIFIER_SCAN_SIZE`` characters of the document, and the document is
+    only parsed (incrementally, up to the identifier) when the markup around
+    it is ambiguous (e.g. comments, entities or several declarations of its
+    namespace prefix).
+
     :param xml_string: OAI-PMH XML
     :type xml_string: str
 
@@ -115,17 +373,204 @@ def identifier_extraction_from_string(
     :return: OAI identifier
     :rtype: str
     """
-    if oai_namespace:
-        nsmap = {
-            'OAI-PMH': oai_namespace
-        }
+    return _extract_identifier(xml_string, (oai_namespace or '').encode(
+        'utf-8'))
+
+
+def identifier_extraction_from_strings(
+        xml_strings,
+        oai_namespace="http://www.openarchives.org/OAI/2.0/"):
+    """Given OAI-PMH XML strings return their OAI identifiers.
+
+    :param xml_strings: iterable of OAI-PMH XML (e.g. the records returned by
+                        :func:`record_extraction_from_string`)
+    :type xml_strings: iterable
+
+    :param oai_namespace: optionally provide the OAI-PMH namespace
+    :type oai_namespace: str
+
+    :return: generator of the OAI identifiers (``None`` for the documents
+             without identifier)
+    :rtype: generator
+    """
+    namespace = (oai_namespace or '').encode('utf-8')
+    for xml_string in xml_strings:
+        yield _extract_identifier(xml_string, namespace)
+
+
+IDENTIFIER_SCAN_SIZE = 65536
+"""Number of characters searched for the identifier before parsing."""
+
+_IDENTIFIER_TAG = re.compile(br'identifier(?=[\s/>])')
+
+_IDENTIFIER_TEXT = re.compile(
+    br'\s*>([^<&]*)</(?:[\w.-]+:)?identifier\s*>'
+)
+
+_NAME = re.compile(br'[\w.-]+$')
+
+_TAG = re.compile(
+    br'<(/?)[\w.:-]+((?:\s+[\w.:-]+\s*=\s*(?:"[^"]*"|\'[^\']*\'))*)\s*(/?)>'
+)
+
+_ATTRIBUTE = re.compile(br'\s+([\w.:-]+)\s*=\s*(?:"([^"]*)"|\'([^\']*)\')')
+
+_XML_ENCODING = re.compile(br'^\s*<\?xml[^>]*?encoding\s*=\s*["\']([\w.-]+)')
+
+
+def _extract_identifier(xml, namespace):
+    """Return the first OAI identifier of a document.
+
+    :param xml: The document as a (byte) string.
+    :param namespace: The encoded OAI-PMH namespace.
+    """
+    if not isinstance(xml, (bytes, bytearray, memoryview)):
+        head = xml[:IDENTIFIER_SCAN_SIZE].encode('utf-8')
     else:
-        nsmap = current_app.config.get("OAIHARVESTER_DEFAULT_NAMESPACE_MAP")
-    namespace_prefix = "{{{0}}}".format(oai_namespace)
-    root = etree.fromstring(xml_string)
-    node = root.find(".//{0}identifier".format(namespace_prefix), nsmap)
-    if node is not None:
-        return node.text
+        head = bytes(xml[:IDENTIFIER_SCAN_SIZE])
+        encoding = _XML_ENCODING.match(head)
+        if encoding and encoding.group(1).lower() not in (b'utf-8', b'utf8'):
+            head = b''
+
+    for match in _IDENTIFIER_TAG.finditer(head):
+        start = match.start() - 1
+        if head[start:start + 1] == b'<':
+            prefix = b''
+        elif head[start:start + 1] == b':':
+            start = head.rfind(b'<', 0, start)
+            prefix = head[start + 1:match.start() - 1]
+            if not _NAME.match(prefix):
+                continue  # text of an element
+        else:
+            continue
+        if head.find(b'<!', 0, start) != -1:
+            break  # comments, CDATA sections or entity declarations
+
+        # Elements with attributes (or children) are parsed
+        text = _IDENTIFIER_TEXT.match(head, match.end())
+        if text is None:
+            break
+        uri = _namespace_in_scope(head, start, prefix)
+        if uri is None or (prefix and not uri):
+            break
+        if uri != namespace:
+            continue
+        # Line ends are normalized like an XML parser does
+        return text.group(1).replace(b'\r\n', b'\n').replace(
+            b'\r', b'\n').decode('utf-8') or None
+    else:
+        if head and len(xml) <= IDENTIFIER_SCAN_SIZE:
+            return None
+
+    return _parse_identifier(xml, '{{{0}}}identifier'.format(
+        namespace.decode('utf-8')) if namespace else 'identifier')
+
+
+def _namespace_in_scope(head, end, prefix):
+    """Return the namespace of a prefix declared by the ancestors of a tag.
+
+    :param head: The beginning of the document.
+    :param end: The offset of the tag.
+    :param prefix: The namespace prefix (empty for the default namespace).
+    :return: The namespace (empty if it is not declared), or ``None`` if the
+             markup preceding the tag cannot be scanned.
+    """
+    name = b'xmlns:' + prefix if prefix else b'xmlns'
+    last_declaration = head.rfind(name, 0, end)
+    last_end_tag = head.rfind(b'</', 0, end)
+    if last_declaration != -1:
+        # The innermost declaration is in an ancestor if no tag is closed
+        # after it (attribute values cannot contain "<")
+        position = head.rfind(b'<', 0, last_declaration)
+        if last_end_tag < position:
+            tag = _TAG.match(head, position, end)
+            if tag is not None and not tag.group(1) and not tag.group(3):
+                declared = [
+                    attribute.group(2) or attribute.group(3) or b''
+                    for attribute in _ATTRIBUTE.finditer(tag.group(2))
+                    if attribute.group(1) == name
+                ]
+                if declared:
+                    return declared[-1]
+    scopes = []
+    position = head.find(b'<', 0, end)
+    while position != -1:
+        if head.startswith(b'<?', position):
+            position = head.find(b'?>', position, end)
+            if position == -1:
+                return None
+            position = head.find(b'<', position, end)
+            continue
+        tag = _TAG.match(head, position, end)
+        if tag is None:
+            return None
+        if tag.group(1):
+            if not scopes:
+                return None
+            scopes.pop()
+        elif not tag.group(3):
+            attributes = tag.group(2)
+            scopes.append([
+                attribute.group(2) or attribute.group(3) or b''
+                for attribute in _ATTRIBUTE.finditer(attributes)
+                if attribute.group(1) == name
+            ] if name in attributes else None)
+            if tag.end() > last_declaration and (
+                    len(scopes) == 1 or tag.end() > last_end_tag):
+                break  # no declaration follows and no scope is closed
+        position = head.find(b'<', tag.end(), end)
+    for declared in reversed(scopes):
+        if declared:
+            return declared[-1]
+    return b''
+
+
+def _parse_identifier(xml, tag, chunk_size=IDENTIFIER_SCAN_SIZE):
+    """Parse a document up to its first identifier element."""
+    if isinstance(xml, memoryview):
+        xml = xml.tobytes()
+    if len(xml) <= chunk_size:
+        node = etree.fromstring(xml).find('.//' + tag)
+        return node.text if node is not None else None
+
+    parser = etree.XMLPullParser(events=('end', ))
+    for offset in range(0, len(xml), chunk_size):
+        parser.feed(xml[offset:offset + chunk_size])
+        for _, element in parser.read_events():
+            if element.tag == tag and element.getparent() is not None:
+                return element.text
+    parser.close()
+
+
+def parse_response(xml, verb,
+                   oai_namespace="{http://www.openarchives.org/OAI/2.0/}",
+                   class_mapping=None):
+    """Return the items and the resumption token of an OAI-PMH response.
+
+    :param xml: The parsed OAI-PMH response.
+    :param verb: The OAI-PMH verb of the request.
+    :param oai_namespace: The OAI-PMH namespace, as ``{namespace}``.
+    :param class_mapping: dict mapping OAI-PMH verbs to the Sickle classes
+                          representing their items (optional).
+    :return: list of items, resumption token (``None`` if it is the last
+             page).
+    :raises sickle.oaiexceptions.OAIError: If the response contains an error.
+    """
+    error = xml.find('.//' + oai_namespace + 'error')
+    if error is not None:
+        code = error.attrib.get('code', 'UNKNOWN')
+        exception = getattr(oaiexceptions, code[0].upper() + code[1:],
+                            oaiexceptions.OAIError)
+        raise exception(error.text or '')
+
+    mapper = (class_mapping or DEFAULT_CLASS_MAP)[verb]
+    items = [
+        mapper(item)
+        for item in xml.iterfind('.//' + oai_namespace + VERBS_ELEMENTS[verb])
+    ]
+    token = (xml.findtext('.//' + oai_namespace + 'resumptionToken') or
+             '').strip() or None
+    return items, token
 
 
 def get_identifier_names(identifiers):
@@ -137,6 +582,62 @@ def get_identifier_names(identifiers):
     return []
 
 
+DAY_GRANULARITY = 'YYYY-MM-DD'
+"""OAI-PMH granularity of datestamps to the day."""
+
+SECONDS_GRANULARITY = 'YYYY-MM-DDThh:mm:ssZ'
+"""OAI-PMH granularity of datestamps to the second."""
+
+
+def parse_datestamp(datestamp):
+    """Return the (UTC) datetime of an OAI-PMH datestamp.
+
+    :param datestamp: The datestamp, to the day or to the second.
+    """
+    if len(datestamp) <= 10:
+        return datetime.strptime(datestamp, '%Y-%m-%d')
+    return datetime.strptime(datestamp[:19], '%Y-%m-%dT%H:%M:%S')
+
+
+def format_datestamp(date, granularity=DAY_GRANULARITY):
+    """Format a (UTC) datetime as an OAI-PMH datestamp.
+
+    :param date: The datetime.
+    :param granularity: The granularity of the repository.
+    """
+    if granularity == SECONDS_GRANULARITY:
+        return date.strftime('%Y-%m-%dT%H:%M:%SZ')
+    return date.strftime('%Y-%m-%d')
+
+
+def plan_date_windows(from_date, until_date, partitions):
+    """Split a date interval into consecutive, non-overlapping windows.
+
+    Both bounds are inclusive, as for the OAI-PMH ``from`` and ``until``
+    arguments, and only their date part (``YYYY-MM-DD``) is used.
+
+    :param from_date: The lower bound date of the interval.
+    :param until_date: The upper bound date of the interval.
+    :param partitions: The maximum number of windows.
+    :return: list of ``(from, until)`` tuples of dates as ``YYYY-MM-DD``.
+    """
+    start = datetime.strptime(from_date[:10], '%Y-%m-%d')
+    end = datetime.strptime(until_date[:10], '%Y-%m-%d')
+    days = (end - start).days + 1
+    if days <= 0:
+        return []
+    step = -(-days // max(1, partitions))
+
+    windows = []
+    while start <= end:
+        window_end = min(start + timedelta(days=step - 1), end)
+        windows.append(
+            (start.strftime('%Y-%m-%d'), window_end.strftime('%Y-%m-%d'))
+        )
+        start = window_end + timedelta(days=1)
+    return windows
+
+
 def get_oaiharvest_object(name):
     """Query and returns an OAIHarvestConfig object based on its name.
 
@@ -193,6 +694,25 @@ def create_file_name(output_dir):
     return file_name
 
 
+def record_fingerprint(record):
+    """Return the fingerprint of the content of a harvested record.
+
+    It is the SHA-256 of the exclusive canonical form of the record metadata,
+    so that it does not depend on the order of the attributes or on the
+    namespace declarations of the response.
+
+    :param record: The :class:`sickle.models.Record`.
+    :return: The hexadecimal digest.
+    """
+    metadata = record.xml.find('{*}metadata')
+    if metadata is None:
+        content = b'deleted' if record.deleted else b''
+    else:
+        content = etree.tostring(metadata, method='c14n', exclusive=True,
+                                 with_comments=False)
+    return hashlib.sha256(content).hexdigest()
+
+
 def chunks(iterable, size):
     """Yield successive chunks of specific size from iterable."""
     iterable = iter(iterable)
@@ -203,29 +723,30 @@ def chunks(iterable, size):
         yield chunk
 
 
-def write_to_dir(records, output_dir, max_records=1000, encoding='utf-8'):
+def write_to_dir(records, output_dir, max_records=1000, encoding='utf-8',
+                 max_bytes=None, compression=None, run_id=None, index=False):
     """Check if the output directory exists, and creates it if it does not.
 
-    :param records: harvested records.
+    The records are written as they are consumed, see
+    :class:`~invenio_oaiharvester.writer.RecordWriter`.
+
+    :param records: harvested records (any iterable).
     :param output_dir: directory where the output should be sent.
     :param max_records: max number of records to be written in a single file.
+    :param max_bytes: size of the records after which a new file is started.
+    :param compression: ``'gzip'``, ``'zstd'`` or ``None``.
+    :param run_id: identifier of the run in the file names (optional).
+    :param index: whether to index the position of the records, see
+                  :mod:`invenio_oaiharvester.index`.
 
     :return: paths to files created, total number of records
     """
-    if not records:
-        return [], 0
-
-    output_path = check_or_create_dir(output_dir)
-    files_created = []
-    total = 0  # total number of records processed
-
-    for chunk in chunks(records, max_records):
-        files_created.append(create_file_name(output_path))
-        with codecs.open(files_created[-1], 'w+', encoding=encoding) as f:
-            f.write('<ListRecords>')
-            for record in chunk:
-                f.write(record.raw)
-                total += 1
-            f.write('</ListRecords>')
-
-    return files_created, total
+    from .writer import RecordWriter
+
+    with RecordWriter(output_dir, max_records=max_records,
+                      max_bytes=max_bytes, compression=compression,
+                      encoding=encoding, run_id=run_id,
+                      index=index) as writer:
+        for record in records:
+            writer.write(record)
+    return writer.files, writer.total
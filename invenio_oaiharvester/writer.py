@@ -0,0 +1,260 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+"""Write harvested records to files while they are harvested.
+
+:class:`RecordWriter` consumes records one at a time and writes them to
+``<ListRecords>`` files, which are rotated after a number of records or of
+bytes and optionally compressed:
+
+.. code-block:: python
+
+    request, records = list_records(name='arXiv', stream=True)
+    with RecordWriter('arxiv', max_bytes=64 * 1024 * 1024,
+                      compression='gzip') as writer:
+        for record in records:
+            writer.write(record)
+    writer.files  # paths of the files written
+
+Each file is written under a temporary name and renamed once it is
+complete, so the files found in the directory can always be read. The files
+of a run are named after the time the run started, a random run identifier
+and a sequence number, e.g.
+``oaiharvest_20160502T120000_4f5b0c1d2e3f_000001.xml.gz``, which sorts
+them in the order they were written. When the writer is closed, a
+``<prefix>_manifest.json`` file lists the files of the run with their number
+of records, size and SHA-256 checksum. With ``index=True``, the position of
+each record is also stored in the offset index of the directory, see
+:mod:`invenio_oaiharvester.index`.
+"""
+
+from __future__ import absolute_import, print_function
+
+import gzip
+import hashlib
+import json
+import os
+import uuid
+from datetime import datetime
+
+from .errors import InvenioOAIHarvesterError
+from .index import IndexEntry, RecordIndex, record_header
+from .utils import check_or_create_dir
+
+try:
+    import zstandard
+except ImportError:  # pragma: no cover
+    zstandard = None
+
+COMPRESSION_SUFFIXES = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+"""File name suffixes of the compressions."""
+
+
+class _ChecksumFile(object):
+    """File wrapper computing the checksum and size of the written data."""
+
+    def __init__(self, f):
+        """Initialize the wrapper."""
+        self.file = f
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        """Write data to the file."""
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        """Flush the file."""
+        self.file.flush()
+
+
+class RecordWriter(object):
+    """Write records to rotated, optionally compressed files."""
+
+    def __init__(self, output_dir, max_records=1000, max_bytes=None,
+                 compression=None, encoding='utf-8', run_id=None,
+                 index=False):
+        """Initialize the writer.
+
+        :param output_dir: The directory where the files are written.
+        :param max_records: The maximum number of records per file.
+        :param max_bytes: The size of the (uncompressed) records after which
+                          a file is rotated (optional).
+        :param compression: ``'gzip'``, ``'zstd'`` (which requires the
+                            ``zstandard`` package) or ``None``.
+        :param encoding: The encoding of the records.
+        :param run_id: The identifier of the run in the file names (random
+                       if not provided).
+        :param index: Whether to store the position of the records in the
+                      offset index of the directory.
+        """
+        if compression not in COMPRESSION_SUFFIXES:
+            raise InvenioOAIHarvesterError(
+                'Unknown compression {0}.'.format(compression)
+            )
+        if compression == 'zstd' and zstandard is None:
+            raise InvenioOAIHarvesterError(
+                'The zstandard package is required to compress files.'
+            )
+        self.output_dir = output_dir
+        self.max_records = max_records
+        self.max_bytes = max_bytes
+        self.compression = compression
+        self.encoding = encoding
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started = datetime.utcnow().replace(microsecond=0)
+        self.prefix = 'oaiharvest_{0}_{1}'.format(
+            self.started.strftime('%Y%m%dT%H%M%S'), self.run_id
+        )
+        self.index = index
+        self.files = []
+        self.manifest = None
+        self.total = 0
+        self._entries = []
+        self._index = None
+        self._positions = []
+        self._output_path = None
+        self._file = None
+        self._stream = None
+        self._temp_path = None
+        self._records = 0
+        self._bytes = 0
+
+    def write(self, record):
+        """Write a record, rotating the file if it is full.
+
+        :param record: A harvested record, or its XML as a (byte) string.
+        """
+        raw = getattr(record, 'raw', record)
+        if not isinstance(raw, bytes):
+            raw = raw.encode(self.encoding)
+        if self._stream is None:
+            self._open()
+        if self._index is not None:
+            identifier, datestamp = record_header(
+                record if hasattr(record, 'header') else raw, self.encoding
+            )
+            if identifier is not None:
+                self._positions.append((
+                    identifier, len(b'<ListRecords>') + self._bytes,
+                    len(raw), datestamp
+                ))
+        self._stream.write(raw)
+        self._records += 1
+        self._bytes += len(raw)
+        self.total += 1
+        if self._records >= self.max_records or (
+                self.max_bytes and self._bytes >= self.max_bytes):
+            self._finish()
+
+    def close(self):
+        """Finish the file being written and write the manifest."""
+        if self._stream is not None:
+            self._finish()
+        if self._entries and self.manifest is None:
+            self._write_manifest()
+        if self._index is not None:
+            self._index.close()
+            self._index = None
+
+    def _open(self):
+        """Start a new file under a temporary name."""
+        if self._output_path is None:
+            self._output_path = check_or_create_dir(self.output_dir)
+            if self.index:
+                self._index = RecordIndex.open(self._output_path)
+        self._temp_path = os.path.join(self._output_path, '.{0}_{1:06d}.part'
+                                       .format(self.prefix,
+                                               len(self.files) + 1))
+        self._file = _ChecksumFile(open(self._temp_path, 'wb'))
+        if self.compression == 'gzip':
+            self._stream = gzip.GzipFile(filename='', fileobj=self._file,
+                                         mode='wb', compresslevel=6)
+        elif self.compression == 'zstd':
+            self._stream = zstandard.ZstdCompressor().stream_writer(
+                self._file, closefd=False
+            )
+        else:
+            self._stream = self._file
+        self._stream.write(b'<ListRecords>')
+        self._records = 0
+        self._bytes = 0
+
+    def _finish(self):
+        """Complete the current file and give it its final name."""
+        self._stream.write(b'</ListRecords>')
+        if self._stream is not self._file:
+            self._stream.close()
+        self._file.flush()
+        os.fsync(self._file.file.fileno())
+        self._file.file.close()
+        name = '{0}_{1:06d}.xml{2}'.format(
+            self.prefix, len(self.files) + 1,
+            COMPRESSION_SUFFIXES[self.compression]
+        )
+        path = os.path.join(self._output_path, name)
+        os.rename(self._temp_path, path)
+        if self._index is not None:
+            self._index.update(
+                IndexEntry(identifier, name, offset, length, datestamp)
+                for identifier, offset, length, datestamp in self._positions
+            )
+            self._positions = []
+        self.files.append(path)
+        self._entries.append({
+            'name': name,
+            'records': self._records,
+            'size': self._file.size,
+            'sha256': self._file.sha256.hexdigest(),
+        })
+        self._stream = self._file = self._temp_path = None
+
+    def _write_manifest(self):
+        """Write the manifest of the files of the run."""
+        self.manifest = os.path.join(
+            self._output_path, '{0}_manifest.json'.format(self.prefix)
+        )
+        temp_path = os.path.join(
+            self._output_path, '.{0}_manifest.part'.format(self.prefix)
+        )
+        with open(temp_path, 'w') as f:
+            json.dump({
+                'run_id': self.run_id,
+                'started': self.started.isoformat(),
+                'finished': datetime.utcnow().replace(
+                    microsecond=0).isoformat(),
+                'compression': self.compression,
+                'records': self.total,
+                'files': self._entries,
+            }, f, indent=2, sort_keys=True)
+        os.rename(temp_path, self.manifest)
+
+    def __enter__(self):
+        """Enter the runtime context."""
+        return self
+
+    def __exit__(self, *args):
+        """Finish the file being written."""
+        self.close()
@@ -43,9 +43,13 @@ tests_require = [
     'pytest>=2.8.0',
     'responses>=0.8.0',
     'celery>=3.1.25,<4.0',
+    'aiohttp>=3.0.0;python_version>="3.6"',
 ]
 
 extras_require = {
+    'aio': [
+        'aiohttp>=3.0.0;python_version>="3.6"',
+    ],
     'docs': [
         'Sphinx>=1.5.3,<1.6',
     ],
@@ -59,6 +63,9 @@ extras_require = {
         'invenio-db>=1.0.0a9',
     ],
     'tests': tests_require,
+    'zstd': [
+        'zstandard>=0.15.0',
+    ],
 }
 
 extras_require['all'] = []
@@ -75,6 +82,7 @@ install_requires = [
     'Flask>=0.12',
     'flask-celeryext>=0.2.2',
     'blinker>=1.4',
+    'futures>=3.1.1;python_version=="2.7"',
     'sickle>=0.6.1',
 ]
 
@@ -28,6 +28,7 @@ from __future__ import absolute_import, print_function
 
 import os
 import shutil
+import sys
 import tempfile
 
 import pytest
@@ -39,6 +40,9 @@ from invenio_db import InvenioDB, db
 from invenio_oaiharvester import InvenioOAIHarvester
 from invenio_oaiharvester.models import OAIHarvestConfig
 
+# The asyncio engine uses a syntax which requires Python 3.6 or later.
+collect_ignore = ['test_aio.py'] if sys.version_info < (3, 6) else []
+
 
 @pytest.fixture()
 def app(request):
@@ -50,6 +54,7 @@ def app(request):
         CELERY_CACHE_BACKEND="memory",
         CELERY_EAGER_PROPAGATES_EXCEPTIONS=True,
         CELERY_RESULT_BACKEND="cache",
+        OAIHARVESTER_WORKDIR=instance_path,
         SECRET_KEY="CHANGE_ME",
         SECURITY_PASSWORD_SALT="CHANGE_ME_ALSO",
         SQLALCHEMY_DATABASE_URI=os.environ.get(
@@ -145,3 +150,12 @@ def sample_list_xml_cs():
         "data/sample_arxiv_response_listrecords_cs.xml"
     )).read()
     return raw_cs_xml
+
+
+@pytest.fixture
+def sample_identify_xml():
+    raw_xml = open(os.path.join(
+        os.path.dirname(__file__),
+        "data/sample_identify_response.xml"
+    )).read()
+    return raw_xml
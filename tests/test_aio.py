@@ -0,0 +1,146 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2014, 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the asyncio harvesting engine."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+
+aiohttp = pytest.importorskip('aiohttp')
+web = pytest.importorskip('aiohttp.web')
+test_utils = pytest.importorskip('aiohttp.test_utils')
+
+aio = pytest.importorskip('invenio_oaiharvester.aio')
+
+
+def _run(app, coroutine_function, responses):
+    """Run a coroutine against a local OAI-PMH server.
+
+    The responses are served by query string, in turn if several are given.
+    """
+    import asyncio
+
+    async def handler(request):
+        for key, response in responses.items():
+            if key in request.query_string:
+                if isinstance(response, list):
+                    response = response.pop(0) if len(response) > 1 \
+                        else response[0]
+                status, body = response
+                return web.Response(status=status, body=body,
+                                    content_type='text/xml')
+        return web.Response(status=404)
+
+    async def main():
+        app = web.Application()
+        app.router.add_get('/oai2', handler)
+        server = test_utils.TestServer(app)
+        await server.start_server()
+        try:
+            return await coroutine_function(str(server.make_url('/oai2')))
+        finally:
+            await server.close()
+
+    loop = asyncio.new_event_loop()
+    try:
+        with app.app_context():
+            return loop.run_until_complete(main())
+    finally:
+        loop.close()
+
+
+def test_list_records(app, sample_list_xml, sample_list_xml_cs):
+    """Check harvesting of records from multiple setspecs."""
+    records = _run(
+        app,
+        lambda url: aio.list_records(url, metadata_prefix='arXiv',
+                                     setspecs='cs physics'),
+        {'set=cs': (200, sample_list_xml_cs),
+         'set=physics': (200, sample_list_xml)}
+    )
+    # 46 cs + 150 physics - 6 dupes == 190
+    assert len(records) == 190
+    assert records[0].header.identifier.startswith('oai:arXiv.org:')
+
+
+def test_list_records_errors(app, sample_list_xml, sample_empty_set):
+    """Check that set errors are raised and empty sets ignored."""
+    records = _run(
+        app,
+        lambda url: aio.list_records(url, setspecs='physics:hep-lat'),
+        {'set=physics': (200, sample_empty_set)}
+    )
+    assert records == []
+
+    with pytest.raises(aiohttp.ClientResponseError):
+        _run(
+            app,
+            lambda url: aio.list_records(url, setspecs='cs physics'),
+            {'set=cs': (500, ''), 'set=physics': (200, sample_list_xml)}
+        )
+
+
+def test_get_records(app, sample_record_xml):
+    """Check harvesting of specific records."""
+    records = _run(
+        app,
+        lambda url: aio.get_records(['oai:arXiv.org:1507.03011'] * 3, url,
+                                    metadata_prefix='arXiv'),
+        {'verb=GetRecord': (200, sample_record_xml)}
+    )
+    assert len(records) == 3
+    assert records[0].header.identifier == 'oai:arXiv.org:1507.03011'
+
+
+def test_limits(app, sample_record_xml):
+    """Check that the requests are governed and retried like the API's."""
+    from invenio_oaiharvester.client import create_client
+
+    app.config.update(
+        OAIHARVESTER_RATE_LIMIT=1000,
+        OAIHARVESTER_MAX_IN_FLIGHT_PER_HOST=2,
+        OAIHARVESTER_RETRY_BACKOFF=0.01,
+    )
+    clients = []
+
+    def get_records(url):
+        clients.append(create_client(url))
+        return aio.get_records(['oai:arXiv.org:1507.03011'] * 3, url,
+                               metadata_prefix='arXiv', client=clients[0])
+
+    records = _run(
+        app, get_records,
+        {'verb=GetRecord': [(503, ''), (200, sample_record_xml)]}
+    )
+    assert len(records) == 3
+    stats = clients[0].stats
+    assert clients[0].governor is not None
+    assert stats['requests'] == 4
+    assert stats['retries'] == 1
+    assert stats['governor_wait'] > 0
+
+    app.config['OAIHARVESTER_RETRY_MAX_ATTEMPTS'] = 2
+    with pytest.raises(aiohttp.ClientResponseError):
+        _run(
+            app,
+            lambda url: aio.get_records(['oai:arXiv.org:1507.03011'], url),
+            {'verb=GetRecord': [(503, ''), (503, ''), (200, '')]}
+        )
@@ -0,0 +1,136 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the endpoint description cache of OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import re
+
+import pytest
+import responses
+from mock import patch
+
+from invenio_oaiharvester.api import get_identify, list_metadata_formats, \
+    list_sets
+from invenio_oaiharvester.cache import MemoryDescriptionCache, \
+    SQLiteDescriptionCache
+
+LIST_SETS = (
+    '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"><ListSets>'
+    '<set><setSpec>{0}</setSpec><setName>{0}</setName></set>{1}'
+    '</ListSets></OAI-PMH>'
+)
+
+LIST_METADATA_FORMATS = (
+    '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+    '<ListMetadataFormats><metadataFormat>'
+    '<metadataPrefix>oai_dc</metadataPrefix>'
+    '<schema>http://www.openarchives.org/OAI/2.0/oai_dc.xsd</schema>'
+    '<metadataNamespace>http://www.openarchives.org/OAI/2.0/oai_dc/'
+    '</metadataNamespace></metadataFormat></ListMetadataFormats></OAI-PMH>'
+)
+
+
+@pytest.mark.parametrize('factory', [
+    MemoryDescriptionCache,
+    lambda **kwargs: SQLiteDescriptionCache(path=':memory:', **kwargs),
+])
+def test_description_cache(factory):
+    """Test the expiration and eviction of the caches."""
+    cache = factory(size=2, ttl=60)
+    cache.set('a', [b'1'])
+    cache.set('b', [b'2'])
+    assert cache.get('a') == [b'1']
+    cache.set('c', [b'3'])
+    assert len(cache) == 2
+    assert cache.get('b') is None
+    assert cache.get('a') == [b'1']
+    cache.delete('a')
+    assert cache.get('a') is None
+
+    cache = factory(size=2, ttl=-1)
+    cache.set('a', [b'1'])
+    assert cache.get('a') is None
+
+
+def test_sqlite_description_cache_persistent(tmpdir):
+    """Test that the SQLite cache is kept across instances."""
+    path = str(tmpdir.join('cache.sqlite3'))
+    SQLiteDescriptionCache(path=path).set('a', [b'1'])
+    assert SQLiteDescriptionCache(path=path).get('a') == [b'1']
+
+
+@responses.activate
+def test_get_identify(app, sample_identify_xml):
+    """Test that Identify responses are cached."""
+    responses.add(
+        responses.GET,
+        'http://export.arxiv.org/oai2',
+        body=sample_identify_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        for _ in range(2):
+            identify = get_identify(url='http://export.arxiv.org/oai2')
+            assert identify.earliestDatestamp == '2015-01-15'
+            assert identify.granularity == 'YYYY-MM-DD'
+        assert len(responses.calls) == 1
+
+        get_identify(url='http://export.arxiv.org/oai2', refresh=True)
+        assert len(responses.calls) == 2
+
+
+@responses.activate
+def test_list_sets(app, sample_config):
+    """Test that every page of ListSets responses is cached."""
+    def callback(request):
+        if 'resumptionToken' in request.url:
+            return (200, {}, LIST_SETS.format('physics', ''))
+        return (200, {}, LIST_SETS.format(
+            'cs', '<resumptionToken>token1</resumptionToken>'
+        ))
+
+    responses.add_callback(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=ListSets.*'),
+        callback=callback,
+        content_type='text/xml'
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=ListMetadata.*'),
+        body=LIST_METADATA_FORMATS,
+        content_type='text/xml'
+    )
+    app.config['OAIHARVESTER_DESCRIPTION_CACHE_TTL'] = 60
+    with app.app_context(), \
+            patch('invenio_oaiharvester.cache.time') as clock:
+        clock.time.return_value = 1000.0
+        for _ in range(2):
+            sets = list_sets(name=sample_config)
+            assert [s.setSpec for s in sets] == ['cs', 'physics']
+            formats = list_metadata_formats(url='http://export.arxiv.org/oai2')
+            assert [f.metadataPrefix for f in formats] == ['oai_dc']
+        assert len(responses.calls) == 3
+
+        clock.time.return_value += 61
+        list_sets(name=sample_config)
+        assert len(responses.calls) == 5
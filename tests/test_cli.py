@@ -21,12 +21,14 @@
 
 from __future__ import absolute_import, print_function
 
+import os
 import re
 
 import responses
 from click.testing import CliRunner
 
-from invenio_oaiharvester.cli import harvest
+from invenio_oaiharvester.cli import extract, harvest, lookup
+from invenio_oaiharvester.signals import oaiharvest_finished
 
 
 @responses.activate
@@ -103,6 +105,26 @@ def test_cli_harvest_list(script_info, sample_empty_set):
     )
 
     runner = CliRunner()
+    sent = []
+    with oaiharvest_finished.connected_to(
+            lambda request, **kwargs: sent.append(kwargs)):
+        for options in ([], ['--stream']):
+            result = runner.invoke(
+                harvest,
+                ['-u', 'http://export.arxiv.org/oai2',
+                 '-m', 'arXiv',
+                 '-s', 'physics',
+                 '-f', '2015-01-17',
+                 '-t', '2015-01-17',
+                 '-e', 'utf-8'] + options,
+                obj=script_info
+            )
+            assert result.exit_code == 0
+            # Nothing was harvested
+            assert 'Number of records harvested' not in result.output
+    assert sent == []
+
+    # Queue it
     result = runner.invoke(
         harvest,
         ['-u', 'http://export.arxiv.org/oai2',
@@ -110,20 +132,136 @@ def test_cli_harvest_list(script_info, sample_empty_set):
          '-s', 'physics',
          '-f', '2015-01-17',
          '-t', '2015-01-17',
-         '-e', 'utf-8'],
+         '--enqueue'],
         obj=script_info
     )
     assert result.exit_code == 0
 
-    # Queue it
+
+@responses.activate
+def test_cli_harvest_list_stream(script_info, sample_list_xml, tmpdir):
+    """Test harvesting in streaming mode from the CLI."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+
+    runner = CliRunner()
     result = runner.invoke(
         harvest,
         ['-u', 'http://export.arxiv.org/oai2',
          '-m', 'arXiv',
          '-s', 'physics',
-         '-f', '2015-01-17',
-         '-t', '2015-01-17',
-         '--enqueue'],
+         '-f', '2015-01-15',
+         '-t', '2015-01-20',
+         '-d', tmpdir.strpath,
+         '--stream'],
         obj=script_info
     )
     assert result.exit_code == 0
+    assert 'Number of records harvested 150' in result.output
+
+
+@responses.activate
+def test_cli_harvest_compressed_files(script_info, sample_list_xml, tmpdir):
+    """Test harvesting to rotated, compressed files from the CLI."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    script_info.load_app().config['OAIHARVESTER_STREAM_CHUNK_SIZE'] = 40
+
+    runner = CliRunner()
+    result = runner.invoke(
+        harvest,
+        ['-u', 'http://export.arxiv.org/oai2',
+         '-m', 'arXiv',
+         '-s', 'physics',
+         '-f', '2015-01-15',
+         '-t', '2015-01-20',
+         '-d', tmpdir.strpath,
+         '--stream',
+         '--max-records', '100',
+         '--compression', 'gzip',
+         '--run-id', 'physics'],
+        obj=script_info
+    )
+    assert result.exit_code == 0
+    assert 'Harvested 2 files' in result.output
+    assert 'Number of records harvested 150' in result.output
+    files = tmpdir.listdir(lambda path: path.ext == '.gz')
+    assert len(files) == 2
+    assert all('_physics_' in path.basename for path in files)
+
+
+@responses.activate
+def test_cli_lookup(script_info, sample_list_xml, tmpdir):
+    """Test looking up an indexed record from the CLI."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+
+    runner = CliRunner()
+    result = runner.invoke(
+        harvest,
+        ['-u', 'http://export.arxiv.org/oai2',
+         '-m', 'arXiv',
+         '-s', 'physics',
+         '-f', '2015-01-15',
+         '-t', '2015-01-20',
+         '-d', tmpdir.strpath,
+         '--index'],
+        obj=script_info
+    )
+    assert result.exit_code == 0
+
+    identifier = 'oai:arXiv.org:0912.3200'
+    result = runner.invoke(lookup, [tmpdir.strpath, identifier],
+                           obj=script_info)
+    assert result.exit_code == 0
+    assert result.output.startswith('<record')
+    assert '<identifier>{0}</identifier>'.format(identifier) in result.output
+
+    result = runner.invoke(lookup, [tmpdir.strpath, identifier,
+                                    '--position'], obj=script_info)
+    assert result.exit_code == 0
+    assert result.output.startswith('oaiharvest_')
+
+    result = runner.invoke(lookup, [tmpdir.strpath, 'oai:arXiv.org:0'],
+                           obj=script_info)
+    assert result.exit_code == 1
+
+    result = runner.invoke(lookup, [tmpdir.join('empty').mkdir().strpath,
+                                    identifier], obj=script_info)
+    assert result.exit_code == 1
+
+
+def test_cli_extract(script_info, tmpdir):
+    """Test extracting the records of a directory from the CLI."""
+    path = os.path.join(os.path.dirname(__file__),
+                        'data/sample_arxiv_response_listrecords_cs.xml')
+    for index in range(3):
+        tmpdir.join('{0}.xml'.format(index)).write_binary(
+            open(path, 'rb').read()
+        )
+    tmpdir.join('3.xml').write('<ListRecords>')
+
+    runner = CliRunner()
+    result = runner.invoke(extract, [tmpdir.strpath, '-w', '2'],
+                           obj=script_info)
+    assert result.exit_code == 0
+    assert result.output.count('<OAI-PMH ') == 3 * 46
+    assert 'Number of records extracted 138' in result.output
+    assert 'Could not extract' in result.output
+
+    result = runner.invoke(extract, [tmpdir.strpath, '-q', '--unordered'],
+                           obj=script_info)
+    assert result.exit_code == 0
+    assert '<OAI-PMH' not in result.output
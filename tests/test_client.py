@@ -0,0 +1,184 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2014, 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the HTTP client used by OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import gzip
+import io
+import time
+import zlib
+from email.utils import formatdate
+
+import pytest
+import responses
+from requests.exceptions import HTTPError
+
+from invenio_oaiharvester import get_records, list_records
+from invenio_oaiharvester.client import OAIHarvesterClient, create_client, \
+    get_pool_stats, get_session, parse_retry_after
+
+
+def _gzip(data):
+    buf = io.BytesIO()
+    with gzip.GzipFile(fileobj=buf, mode='wb') as f:
+        f.write(data)
+    return buf.getvalue()
+
+
+def test_get_session(app):
+    """Test that sessions are shared per host."""
+    with app.app_context():
+        before = get_pool_stats()
+        session = get_session('http://export.arxiv.org/oai2')
+        assert get_session('http://EXPORT.arxiv.org/other') is session
+        assert get_session('http://inspirehep.net/oai2d') is not session
+
+        stats = get_pool_stats()
+        assert stats['session_hits'] - before['session_hits'] >= 1
+        assert stats['session_misses'] - before['session_misses'] <= 2
+        adapter = session.get_adapter('https://export.arxiv.org')
+        assert adapter._pool_maxsize == \
+            app.config['OAIHARVESTER_HTTP_POOL_SIZE']
+
+
+@responses.activate
+def test_client_uses_pooled_session(app, sample_record_xml):
+    """Test that the API issues requests through the pooled session."""
+    responses.add(
+        responses.GET,
+        'http://export.arxiv.org/oai2',
+        body=sample_record_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        request, records = get_records(['oai:arXiv.org:1507.03011'],
+                                       url='http://export.arxiv.org/oai2')
+        assert isinstance(request, OAIHarvesterClient)
+        assert request.session is get_session('http://export.arxiv.org/oai2')
+        assert len(records) == 1
+
+
+@responses.activate
+def test_gzip_response(app, sample_list_xml):
+    """Test that gzip compressed responses are negotiated and decoded."""
+    raw = sample_list_xml.encode('utf-8')
+    responses.add(
+        responses.GET,
+        'http://export.arxiv.org/oai2',
+        body=_gzip(raw),
+        content_type='text/xml',
+        headers={'Content-Encoding': 'gzip'}
+    )
+    with app.app_context():
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv')
+        assert len(records) == 150
+        assert responses.calls[0].request.headers['Accept-Encoding'] == \
+            'gzip, deflate'
+
+        stats = request.stats.to_dict()
+        assert stats['requests'] == 1
+        assert stats['compressed_responses'] == 1
+        assert stats['bytes_decoded'] == len(raw)
+        assert stats['bytes_received'] < len(raw)
+        assert stats['decompression_time'] >= 0
+
+
+@responses.activate
+def test_deflate_response(app, sample_record_xml):
+    """Test zlib wrapped and raw deflate responses."""
+    raw = sample_record_xml.encode('utf-8')
+    compressor = zlib.compressobj(9, zlib.DEFLATED, -zlib.MAX_WBITS)
+    for body in (zlib.compress(raw),
+                 compressor.compress(raw) + compressor.flush()):
+        responses.add(
+            responses.GET,
+            'http://export.arxiv.org/oai2',
+            body=body,
+            content_type='text/xml',
+            headers={'Content-Encoding': 'deflate'}
+        )
+    with app.app_context():
+        for _ in range(2):
+            request, records = get_records(['oai:arXiv.org:1507.03011'],
+                                           url='http://export.arxiv.org/oai2')
+            assert len(records) == 1
+            assert request.stats['bytes_decoded'] == len(raw)
+
+
+@responses.activate
+def test_identify_compression(app, sample_identify_xml):
+    """Test that the compression schemes of Identify are honoured."""
+    responses.add(
+        responses.GET,
+        'http://export.arxiv.org/oai2',
+        body=sample_identify_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        request = create_client('http://export.arxiv.org/oai2')
+        assert request.compression == ['gzip', 'deflate']
+        request.Identify()
+        assert request.compression == ['gzip']
+        assert request.stats['compressed_responses'] == 0
+        assert request.stats['bytes_received'] == \
+            request.stats['bytes_decoded']
+
+
+def test_parse_retry_after():
+    """Test the parsing of Retry-After headers."""
+    assert parse_retry_after('120') == 120
+    assert parse_retry_after(None) is None
+    assert parse_retry_after('soon') is None
+    assert parse_retry_after(formatdate(time.time() - 60)) == 0
+    assert 50 < parse_retry_after(formatdate(time.time() + 60)) <= 60
+
+
+@responses.activate
+def test_retry_after(app, sample_record_xml):
+    """Test that throttled requests are retried and then given up."""
+    for _ in range(2):
+        responses.add(
+            responses.GET,
+            'http://export.arxiv.org/oai2',
+            status=503,
+            headers={'Retry-After': '0'}
+        )
+    responses.add(
+        responses.GET,
+        'http://export.arxiv.org/oai2',
+        body=sample_record_xml,
+        content_type='text/xml'
+    )
+    app.config['OAIHARVESTER_RETRY_MAX_ATTEMPTS'] = 2
+    with app.app_context():
+        request = create_client('http://export.arxiv.org/oai2')
+        with pytest.raises(HTTPError):
+            request.GetRecord(identifier='oai:arXiv.org:1507.03011')
+        assert request.stats['retries'] == 1
+        assert request.stats['failures'] == 1
+        assert request.stats['sleep_time'] == 0
+
+        request = create_client('http://export.arxiv.org/oai2')
+        assert request.GetRecord(identifier='oai:arXiv.org:1507.03011')
+        assert request.stats['retries'] == 0
+        assert len(responses.calls) == 3
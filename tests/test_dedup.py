@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2014, 2015, 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the identifier stores used by OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import os
+import re
+
+import pytest
+import responses
+
+from invenio_oaiharvester import list_records
+from invenio_oaiharvester.dedup import BloomIdentifierStore, \
+    MemoryIdentifierStore, SQLiteIdentifierStore, create_dedup_store
+
+
+@pytest.mark.parametrize('factory', [
+    MemoryIdentifierStore,
+    SQLiteIdentifierStore,
+    lambda: BloomIdentifierStore(capacity=100, batch_size=3),
+    lambda: BloomIdentifierStore(capacity=1, error_rate=0.5),
+])
+def test_identifier_stores(app, factory):
+    """Test that stores detect already seen identifiers."""
+    with app.app_context():
+        with factory() as store:
+            identifiers = ['oai:example.org:{0}'.format(i) for i in range(50)]
+            assert all(store.add(i) for i in identifiers)
+            assert not any(store.add(i) for i in identifiers)
+            assert store.add(u'oai:example.org:Stéphane')
+            assert not store.add(u'oai:example.org:Stéphane')
+            assert len(store) == 51
+
+
+def test_sqlite_store_temporary_file(app):
+    """Test that the temporary database is removed on close."""
+    with app.app_context():
+        store = SQLiteIdentifierStore()
+        assert os.path.exists(store.path)
+        store.add('oai:example.org:1')
+        assert 'oai:example.org:1' in store
+        store.close()
+        store.close()
+        assert not os.path.exists(store.path)
+
+
+def test_create_dedup_store(app):
+    """Test the creation of the configured store."""
+    with app.app_context():
+        assert isinstance(create_dedup_store(), MemoryIdentifierStore)
+        app.config['OAIHARVESTER_DEDUP_STORE'] = \
+            'invenio_oaiharvester.dedup:BloomIdentifierStore'
+        store = create_dedup_store()
+        assert isinstance(store, BloomIdentifierStore)
+        store.close()
+
+
+@responses.activate
+def test_list_records_with_store(app, sample_list_xml, sample_list_xml_cs):
+    """Check harvesting of records from multiple setspecs with a store."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=cs.*'),
+        body=sample_list_xml_cs,
+        content_type='text/xml'
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        store = SQLiteIdentifierStore()
+        _, records = list_records(
+            metadata_prefix='arXiv',
+            from_date='2015-01-15',
+            until_date='2015-01-20',
+            url='http://export.arxiv.org/oai2',
+            setspecs='cs physics',
+            dedup_store=store,
+        )
+        assert len(records) == 190
+        assert len(store) == 190
+        store.close()
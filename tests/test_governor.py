@@ -0,0 +1,151 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the request governor of OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+
+import pytest
+import responses
+from mock import patch
+
+from invenio_oaiharvester import get_records
+from invenio_oaiharvester.governor import EndpointGovernor, get_governor
+from invenio_oaiharvester.models import OAIHarvestConfig
+
+
+class FakeClock(object):
+    """Clock whose time only moves when sleeping."""
+
+    def __init__(self):
+        """Initialize the clock."""
+        self.now = 1000.0
+        self.sleeps = []
+
+    def time(self):
+        """Return the current time."""
+        return self.now
+
+    def sleep(self, delay):
+        """Move the time forward."""
+        self.sleeps.append(delay)
+        self.now += delay
+
+
+@pytest.fixture()
+def clock():
+    """Patch the clock of the governors."""
+    clock = FakeClock()
+    with patch('invenio_oaiharvester.governor.time', clock), \
+            patch('invenio_oaiharvester.governor.default_timer', clock.time):
+        yield clock
+
+
+def test_rate_limit(tmpdir, clock):
+    """Test that tokens are shared by the governors of a host."""
+    url = 'http://export.arxiv.org/oai2'
+    first = EndpointGovernor(url, str(tmpdir), rate=10, burst=2)
+    second = EndpointGovernor(url, str(tmpdir), rate=10, burst=2)
+    other = EndpointGovernor('http://inspirehep.net/oai2d', str(tmpdir),
+                             rate=10)
+
+    assert first.reserve() == 0
+    assert second.reserve() == 0
+    assert first.reserve() == pytest.approx(0.1)
+    assert second.reserve() == pytest.approx(0.2)
+    assert other.reserve() == 0
+    assert EndpointGovernor(url, str(tmpdir)).reserve() == 0
+
+    # Tokens are refilled with time
+    clock.now += 0.25
+    assert first.reserve() == pytest.approx(0.05)
+    clock.now += 10
+    assert first.reserve() == 0
+
+
+def test_max_in_flight(tmpdir):
+    """Test that concurrent requests to a host are limited."""
+    url = 'http://export.arxiv.org/oai2'
+    in_flight = []
+    peak = []
+    lock = threading.Lock()
+
+    def request():
+        governor = EndpointGovernor(url, str(tmpdir), max_in_flight=2)
+        with governor.slot() as waited:
+            assert waited >= 0
+            with lock:
+                in_flight.append(1)
+                peak.append(len(in_flight))
+            time.sleep(0.05)
+            with lock:
+                in_flight.pop()
+
+    threads = [threading.Thread(target=request) for _ in range(6)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    assert len(peak) == 6
+    assert max(peak) == 2
+
+
+def test_get_governor(app):
+    """Test the limits of the configurations."""
+    with app.app_context():
+        assert get_governor('http://export.arxiv.org/oai2') is None
+
+    app.config['OAIHARVESTER_RATE_LIMIT'] = 5
+    app.config['OAIHARVESTER_MAX_IN_FLIGHT_PER_HOST'] = 4
+    with app.app_context():
+        governor = get_governor('http://export.arxiv.org/oai2')
+        assert governor.rate == 5
+        assert governor.max_in_flight == 4
+
+        config = OAIHarvestConfig(baseurl='http://export.arxiv.org/oai2',
+                                  rate_limit=0.5, max_in_flight=1)
+        governor = get_governor('http://export.arxiv.org/oai2', config)
+        assert governor.rate == 0.5
+        assert governor.max_in_flight == 1
+
+
+@responses.activate
+def test_governor_wait(app, sample_record_xml, clock):
+    """Test that the time spent waiting on the governor is measured."""
+    responses.add(
+        responses.GET,
+        'http://export.arxiv.org/oai2',
+        body=sample_record_xml,
+        content_type='text/xml'
+    )
+    app.config['OAIHARVESTER_RATE_LIMIT'] = 20
+    with app.app_context():
+        request, records = get_records(
+            ['oai:arXiv.org:1507.03011', 'oai:arXiv.org:1507.03012',
+             'oai:arXiv.org:1507.03013'],
+            url='http://export.arxiv.org/oai2'
+        )
+        assert len(records) == 3
+        assert request.stats['requests'] == 3
+        assert clock.sleeps == [pytest.approx(0.05)] * 2
+        assert request.stats['governor_wait'] == pytest.approx(0.1)
@@ -17,12 +17,14 @@
 # along with Invenio; if not, write to the Free Software Foundation, Inc.,
 # 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
 
+import datetime
 import os
 import re
 import time
 
 import pytest
 import responses
+from lxml import etree
 
 from invenio_oaiharvester import get_records, list_records
 from invenio_oaiharvester.errors import WrongDateCombination
@@ -78,10 +80,24 @@ def test_model_based_utf8_harvesting(app, sample_config,
         assert record.raw.find(u'Stéphane') >= 0
 
 
+def _add_identify_response(identify_xml, granularity=None):
+    """Serve ``identify_xml`` to Identify requests."""
+    if granularity:
+        identify_xml = identify_xml.replace('YYYY-MM-DD<', granularity + '<')
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=Identify.*'),
+        body=identify_xml,
+        content_type='text/xml'
+    )
+
+
 @responses.activate
-def test_model_based_harvesting_list(app, sample_config, sample_list_xml):
+def test_model_based_harvesting_list(app, sample_config, sample_list_xml,
+                                     sample_identify_xml):
     """Test harvesting using model."""
     from invenio_oaiharvester.utils import get_oaiharvest_object
+    _add_identify_response(sample_identify_xml)
     responses.add(
         responses.GET,
         re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
@@ -98,6 +114,31 @@ def test_model_based_harvesting_list(app, sample_config, sample_list_xml):
         assert last_updated < get_oaiharvest_object(sample_config).lastrun
 
 
+@responses.activate
+def test_model_based_harvesting_stream(app, sample_config, sample_list_xml,
+                                       sample_identify_xml):
+    """Test that lastrun is only updated when the stream is exhausted."""
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+    _add_identify_response(sample_identify_xml)
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        last_updated = get_oaiharvest_object(sample_config).lastrun
+        _, records = list_records(name=sample_config, stream=True)
+        assert not isinstance(records, list)
+
+        first = next(records)
+        assert first.header.identifier
+        assert get_oaiharvest_object(sample_config).lastrun == last_updated
+
+        assert len(list(records)) == 149
+        assert last_updated < get_oaiharvest_object(sample_config).lastrun
+
+
 def test_raise_missing_info(app):
     """Check that the proper exception is raised if name or url is missing."""
     from invenio_oaiharvester.errors import NameOrUrlMissing
@@ -212,3 +253,711 @@ def test_get_from_identifiers_with_prefix(app, sample_record_xml):
                 namespaces={"arXiv": "http://arxiv.org/OAI/arXiv/"}
             )[0].text
             assert identifier_in_request == "1507.03011"
+
+
+@responses.activate
+def test_list_records_concurrency(app, sample_list_xml, sample_list_xml_cs):
+    """Check harvesting of records from multiple setspecs in parallel."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=cs.*'),
+        body=sample_list_xml_cs,
+        content_type='text/xml'
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        _, records = list_records(
+            metadata_prefix='arXiv',
+            from_date='2015-01-15',
+            until_date='2015-01-20',
+            url='http://export.arxiv.org/oai2',
+            setspecs='cs physics',
+            concurrency=2
+        )
+        assert len(records) == 190
+        assert len(set(r.header.identifier for r in records)) == 190
+
+
+@responses.activate
+def test_list_records_concurrency_failure(app, sample_list_xml,
+                                          sample_identify_xml):
+    """Check that lastrun is not updated if one of the sets fails."""
+    from invenio_db import db
+    from requests.exceptions import HTTPError
+
+    from invenio_oaiharvester.models import OAIHarvestConfig
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    _add_identify_response(sample_identify_xml)
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=cs.*'),
+        status=500
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        source = OAIHarvestConfig(
+            name='arXiv-all',
+            baseurl='http://export.arxiv.org/oai2',
+            metadataprefix='arXiv',
+            setspecs='cs physics',
+        )
+        source.save()
+        db.session.commit()
+        last_updated = get_oaiharvest_object('arXiv-all').lastrun
+
+        with pytest.raises(HTTPError):
+            list_records(name='arXiv-all', concurrency=2)
+        assert get_oaiharvest_object('arXiv-all').lastrun == last_updated
+
+
+def test_iter_parallel_stop():
+    """Check that the queued jobs are not run once the consumer stopped."""
+    import threading
+    from concurrent.futures import ThreadPoolExecutor
+
+    from mock import patch
+
+    from invenio_oaiharvester.concurrency import iter_parallel
+
+    executors = []
+    resume = threading.Event()
+    started = []
+
+    class Executor(ThreadPoolExecutor):
+        def __init__(self, *args, **kwargs):
+            super(Executor, self).__init__(*args, **kwargs)
+            executors.append(self)
+
+    def first():
+        started.append(1)
+        yield 1
+        resume.wait()
+        yield 2
+
+    def second():
+        started.append(2)
+        yield 3
+
+    with patch('invenio_oaiharvester.concurrency.ThreadPoolExecutor',
+               Executor):
+        items = iter_parallel([first, second], 1)
+        assert next(items) == 1
+        items.close()
+    resume.set()
+    executors[0].shutdown(wait=True)
+    assert started == [1]
+
+
+@responses.activate
+def test_list_records_partitions(app, sample_identify_xml, sample_list_xml,
+                                 sample_empty_set):
+    """Check harvesting of records split in date windows."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=Identify.*'),
+        body=sample_identify_xml,
+        content_type='text/xml'
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*from=2015-01-15.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*from=2015-01-1[79].*'),
+        body=sample_empty_set,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        _, records = list_records(
+            metadata_prefix='arXiv',
+            until_date='2015-01-20',
+            url='http://export.arxiv.org/oai2',
+            setspecs='physics',
+            concurrency=3,
+            partitions=3
+        )
+        assert len(records) == 150
+
+    requested = [call.request.url for call in responses.calls]
+    assert len(requested) == 4
+    for window in ('from=2015-01-15&until=2015-01-16',
+                   'from=2015-01-17&until=2015-01-18',
+                   'from=2015-01-19&until=2015-01-20'):
+        assert any(window in url for url in requested)
+
+
+@responses.activate
+def test_list_records_identify_compression(app, sample_config,
+                                           sample_list_xml,
+                                           sample_identify_xml):
+    """Check that the compression schemes of Identify are negotiated."""
+    _add_identify_response(sample_identify_xml)
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=ListRecords.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        request, records = list_records(name=sample_config)
+        assert len(records) == 150
+        assert request.compression == ['gzip']
+
+    assert responses.calls[-1].request.headers['Accept-Encoding'] == 'gzip'
+
+
+@responses.activate
+def test_list_records_lastrun_failing_identify(app, sample_config,
+                                               sample_list_xml):
+    """Check that lastrun is sent to the day if Identify fails."""
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=Identify.*'),
+        status=500
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=ListRecords.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    app.config['OAIHARVESTER_RETRY_MAX_ATTEMPTS'] = 1
+    with app.app_context():
+        _, records = list_records(name=sample_config)
+        assert len(records) == 150
+
+    url = responses.calls[-1].request.url
+    assert re.search(r'from=\d{4}-\d{2}-\d{2}(&|$)', url)
+
+
+@responses.activate
+def test_list_records_partitions_granularity(app, sample_config,
+                                             sample_identify_xml,
+                                             sample_empty_set):
+    """Check that every window bound has the granularity of the lastrun."""
+    from invenio_db import db
+
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    _add_identify_response(sample_identify_xml, 'YYYY-MM-DDThh:mm:ssZ')
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=ListRecords.*'),
+        body=sample_empty_set,
+        content_type='text/xml'
+    )
+    with app.app_context():
+        source = get_oaiharvest_object(sample_config)
+        source.lastrun = datetime.datetime(2015, 1, 15, 10, 0, 0)
+        source.save()
+        db.session.commit()
+        _, records = list_records(name=sample_config,
+                                  until_date='2015-01-20', partitions=3)
+        assert records == []
+
+    requested = [call.request.url.replace('%3A', ':')
+                 for call in responses.calls]
+    for window in ('from=2015-01-15T10:00:00Z&until=2015-01-16T23:59:59Z',
+                   'from=2015-01-17T00:00:00Z&until=2015-01-18T23:59:59Z',
+                   'from=2015-01-19T00:00:00Z&until=2015-01-20T23:59:59Z'):
+        assert any(window in url for url in requested)
+
+
+def _add_paged_responses(first_page, second_page, fail_token=None,
+                         expired_token=None):
+    """Serve ``first_page`` with a resumption token to ``second_page``."""
+    first_page = first_page.replace(
+        '</ListRecords>',
+        '<resumptionToken cursor="0">token1</resumptionToken></ListRecords>'
+    )
+    bad_token = (
+        '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+        '<error code="badResumptionToken">Expired</error></OAI-PMH>'
+    )
+
+    def callback(request):
+        if 'resumptionToken=token1' not in request.url:
+            if 'from=2015-01-16' in request.url:
+                return (200, {}, second_page)
+            return (200, {}, first_page)
+        if fail_token:
+            fail_token.pop()
+            return (503, {}, '')
+        if expired_token:
+            return (200, {}, bad_token)
+        return (200, {}, second_page)
+
+    responses.add_callback(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*'),
+        callback=callback,
+        content_type='text/xml'
+    )
+
+
+@responses.activate
+def test_list_records_resume(app, sample_config, sample_list_xml,
+                             sample_list_xml_cs):
+    """Check that an interrupted harvest can be resumed."""
+    from requests.exceptions import HTTPError
+
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs,
+                         fail_token=[True])
+    app.config['OAIHARVESTER_RETRY_MAX_ATTEMPTS'] = 1
+    with app.app_context():
+        last_updated = get_oaiharvest_object(sample_config).lastrun
+        _, records = list_records(name=sample_config, stream=True)
+        with pytest.raises(HTTPError):
+            for _ in records:
+                pass
+
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        assert checkpoint.resumption_token == 'token1'
+        assert checkpoint.records_seen == 150
+        assert checkpoint.last_datestamp == '2015-01-16'
+        assert checkpoint.setspec == 'physics'
+        assert not checkpoint.finished
+        assert get_oaiharvest_object(sample_config).lastrun == last_updated
+
+        _, records = list_records(name=sample_config, resume=True)
+        assert len(records) == 46
+        assert 'resumptionToken=token1' in responses.calls[-1].request.url
+        assert OAIHarvestCheckpoint.query.count() == 0
+        assert last_updated < get_oaiharvest_object(sample_config).lastrun
+
+
+@responses.activate
+def test_list_records_resume_undelivered_batch(app, sample_config,
+                                               sample_list_xml,
+                                               sample_list_xml_cs):
+    """Check that pages are only checkpointed once they are delivered."""
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs)
+    with app.app_context():
+        _, records = list_records(name=sample_config, stream=True)
+        batches = records.batches(100)
+        assert len(next(batches)) == 100
+        # The second batch ends the first page but is never delivered
+        assert len(next(batches)) == 90
+        batches.close()
+
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        assert checkpoint.resumption_token is None
+        assert checkpoint.records_seen == 0
+
+        _, records = list_records(name=sample_config, resume=True,
+                                  stream=True)
+        batches = records.batches(100)
+        assert len(next(batches)) == 100
+        assert len(next(batches)) == 90
+        # The first page was delivered with the first two batches
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        assert checkpoint.resumption_token is None
+        assert checkpoint.records_seen == 0
+        assert list(batches) == []
+        assert OAIHarvestCheckpoint.query.count() == 0
+
+
+@responses.activate
+def test_list_records_resume_expired_token(app, sample_config,
+                                           sample_list_xml,
+                                           sample_list_xml_cs):
+    """Check that an expired token restarts from the last datestamp."""
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs,
+                         expired_token=True)
+    with app.app_context():
+        _, records = list_records(name=sample_config, stream=True)
+        for _ in range(150):
+            next(records)
+        records.close()
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        assert checkpoint.records_seen == 0
+
+        # Without resuming, the harvest starts again from scratch
+        _, records = list_records(name=sample_config, stream=True)
+        for _ in range(151):
+            next(records)
+        records.close()
+        first, checkpoint = OAIHarvestCheckpoint.query.order_by(
+            OAIHarvestCheckpoint.id).all()
+        assert checkpoint.run_id != first.run_id
+        assert checkpoint.records_seen == 150
+
+        # The latest harvest is resumed
+        _, records = list_records(name=sample_config, resume=True)
+        assert len(records) == 46
+        assert 'from=2015-01-16' in responses.calls[-1].request.url
+        assert OAIHarvestCheckpoint.query.one().id == first.id
+
+
+@responses.activate
+def test_list_records_overlapping(app, sample_config, sample_list_xml,
+                                  sample_list_xml_cs):
+    """Check that overlapping harvests keep their own checkpoints."""
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs)
+    with app.app_context():
+        _, running = list_records(name=sample_config, stream=True)
+        for _ in range(151):
+            next(running)
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        assert checkpoint.records_seen == 150
+
+        # Another harvest of the configuration starts and finishes
+        _, records = list_records(name=sample_config)
+        assert len(records) == 190
+        assert OAIHarvestCheckpoint.query.one().id == checkpoint.id
+
+        assert len(list(running)) == 39
+        assert OAIHarvestCheckpoint.query.count() == 0
+
+
+@responses.activate
+def test_list_records_abandoned_checkpoints(app, sample_config,
+                                            sample_list_xml,
+                                            sample_list_xml_cs):
+    """Check that abandoned checkpoints are removed."""
+    from invenio_db import db
+
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs)
+    app.config['OAIHARVESTER_CHECKPOINT_TIMEOUT'] = 3600
+    with app.app_context():
+        _, records = list_records(name=sample_config, stream=True)
+        for _ in range(151):
+            next(records)
+        records.close()
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        run_id = checkpoint.run_id
+        checkpoint.updated = datetime.datetime.utcnow() - \
+            datetime.timedelta(hours=2)
+        db.session.commit()
+
+        _, records = list_records(name=sample_config, stream=True)
+        next(records)
+        assert OAIHarvestCheckpoint.query.one().run_id != run_id
+        records.close()
+
+
+@responses.activate
+def test_list_records_prefetch(app, sample_config, sample_list_xml,
+                               sample_list_xml_cs):
+    """Check that pages can be fetched ahead of the consumed page."""
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs)
+    with app.app_context():
+        last_updated = get_oaiharvest_object(sample_config).lastrun
+        _, records = list_records(name=sample_config, stream=True,
+                                  prefetch=1)
+        first = next(records)
+        assert first.header.identifier == 'oai:arXiv.org:0912.3200'
+        harvested = [first] + list(records)
+        assert len(harvested) == 190
+        assert len(responses.calls) == 3
+        assert OAIHarvestCheckpoint.query.count() == 0
+        assert last_updated < get_oaiharvest_object(sample_config).lastrun
+
+
+@responses.activate
+def test_list_records_retry(app, sample_config, sample_list_xml,
+                            sample_list_xml_cs):
+    """Check that throttled pages are retried without restarting."""
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs,
+                         fail_token=[True, True])
+    app.config['OAIHARVESTER_RETRY_BACKOFF'] = 0
+    with app.app_context():
+        last_updated = get_oaiharvest_object(sample_config).lastrun
+        request, records = list_records(name=sample_config)
+        assert len(records) == 190
+        assert len(responses.calls) == 5
+        assert 'resumptionToken=token1' in responses.calls[-1].request.url
+        assert request.stats['retries'] == 2
+        assert request.stats['failures'] == 0
+        assert last_updated < get_oaiharvest_object(sample_config).lastrun
+
+
+oai = '{http://www.openarchives.org/OAI/2.0/}'
+
+
+def _add_header_first_responses(list_xml):
+    """Serve ListRecords, ListIdentifiers and GetRecord from ``list_xml``.
+
+    :return: dict of the served record elements by identifier.
+    """
+    tree = etree.fromstring(list_xml.encode('utf-8'))
+    records = dict(
+        (r.findtext(oai + 'header/' + oai + 'identifier'), r)
+        for r in tree.iter(oai + 'record')
+    )
+
+    def response(verb, elements):
+        return (200, {}, (
+            '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+            '<{0}>{1}</{0}></OAI-PMH>'
+        ).format(verb, ''.join(
+            etree.tostring(e).decode('utf-8') for e in elements
+        )))
+
+    def callback(request):
+        if 'verb=GetRecord' in request.url:
+            identifier = re.search(r'identifier=([^&]+)', request.url)
+            identifier = identifier.group(1).replace('%3A', ':')
+            if identifier not in records:
+                return (200, {}, (
+                    '<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/">'
+                    '<error code="idDoesNotExist">No record</error>'
+                    '</OAI-PMH>'
+                ))
+            return response('GetRecord', [records[identifier]])
+        if 'verb=ListIdentifiers' in request.url:
+            return response('ListIdentifiers', [
+                r.find(oai + 'header') for r in records.values()
+            ])
+        return response('ListRecords', records.values())
+
+    responses.add_callback(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*'),
+        callback=callback,
+        content_type='text/xml'
+    )
+    return records
+
+
+def _touch(records, identifiers, datestamp):
+    """Change the datestamp of served records."""
+    for identifier in identifiers:
+        records[identifier].find(
+            oai + 'header/' + oai + 'datestamp'
+        ).text = datestamp
+
+
+@responses.activate
+def test_list_records_headers_first(app, sample_list_xml):
+    """Check that only new or changed records are fetched."""
+    from invenio_oaiharvester.models import OAIHarvestRecord
+
+    served = _add_header_first_responses(sample_list_xml)
+    changed = ['oai:arXiv.org:1003.4388', 'oai:arXiv.org:1006.4508']
+    with app.app_context():
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv',
+                                        headers_first=True)
+        assert len(records) == 150
+        assert 'verb=ListRecords' in responses.calls[0].request.url
+        assert OAIHarvestRecord.query.count() == 150
+
+        _touch(served, changed, '2015-01-17')
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv',
+                                        headers_first=True, concurrency=2)
+        assert sorted(r.header.identifier for r in records) == changed
+        assert len(responses.calls) == 4
+        assert 'verb=ListIdentifiers' in responses.calls[1].request.url
+        assert request.stats['unchanged'] == 148
+        assert OAIHarvestRecord.get_datestamps(
+            'http://export.arxiv.org/oai2', 'arXiv', changed
+        ) == dict((identifier, '2015-01-17') for identifier in changed)
+
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv',
+                                        headers_first=True)
+        assert records == []
+        assert len(responses.calls) == 5
+
+
+@responses.activate
+def test_list_records_headers_first_undelivered(app, sample_list_xml):
+    """Check that datestamps are only indexed once records are delivered."""
+    from invenio_oaiharvester.models import OAIHarvestRecord
+
+    served = _add_header_first_responses(sample_list_xml)
+    changed = ['oai:arXiv.org:1003.4388', 'oai:arXiv.org:1006.4508']
+    with app.app_context():
+        list_records(url='http://export.arxiv.org/oai2',
+                     metadata_prefix='arXiv', headers_first=True)
+
+        _touch(served, changed, '2015-01-17')
+        _, records = list_records(url='http://export.arxiv.org/oai2',
+                                  metadata_prefix='arXiv',
+                                  headers_first=True, stream=True)
+        batches = records.batches()
+        assert len(next(batches)) == 2
+        # The receivers failed
+        batches.close()
+        assert OAIHarvestRecord.get_datestamps(
+            'http://export.arxiv.org/oai2', 'arXiv', changed
+        ) == dict((identifier, '2015-01-16') for identifier in changed)
+
+        _, records = list_records(url='http://export.arxiv.org/oai2',
+                                  metadata_prefix='arXiv',
+                                  headers_first=True)
+        assert sorted(r.header.identifier for r in records) == changed
+
+
+@responses.activate
+def test_list_records_headers_first_resume(app, sample_config,
+                                           sample_list_xml,
+                                           sample_list_xml_cs):
+    """Check that an interrupted first harvest is not resumed with headers."""
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint, \
+        OAIHarvestRecord
+
+    _add_paged_responses(sample_list_xml, sample_list_xml_cs)
+    with app.app_context():
+        _, records = list_records(name=sample_config, headers_first=True,
+                                  stream=True)
+        for _ in range(151):
+            next(records)
+        records.close()
+        checkpoint = OAIHarvestCheckpoint.query.one()
+        assert checkpoint.verb == 'ListRecords'
+        assert checkpoint.resumption_token == 'token1'
+        assert OAIHarvestRecord.query.count() == 150
+
+        _, records = list_records(name=sample_config, headers_first=True,
+                                  resume=True, stream=True)
+        next(records)
+        records.close()
+        assert 'verb=ListRecords&resumptionToken=token1' in \
+            responses.calls[-1].request.url
+
+        # The first harvest is still unfinished
+        _, records = list_records(name=sample_config, headers_first=True,
+                                  stream=True)
+        next(records)
+        records.close()
+        assert 'verb=ListRecords' in responses.calls[-1].request.url
+        assert OAIHarvestCheckpoint.query.filter_by(
+            verb='ListIdentifiers').count() == 0
+
+
+@responses.activate
+def test_list_records_skip_unchanged(app, sample_list_xml):
+    """Check that records whose content did not change are skipped."""
+    served = _add_header_first_responses(sample_list_xml)
+    with app.app_context():
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv',
+                                        skip_unchanged=True)
+        assert len(records) == 150
+        assert request.stats['suppressed'] == 0
+
+        _touch(served, served, '2015-01-17')
+        served['oai:arXiv.org:1003.4388'].find(
+            './/{http://arxiv.org/OAI/arXiv/}title'
+        ).text = 'Changed'
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv',
+                                        skip_unchanged=True)
+        assert [r.header.identifier for r in records] == \
+            ['oai:arXiv.org:1003.4388']
+        assert request.stats['suppressed'] == 149
+
+
+@responses.activate
+def test_list_records_skip_unchanged_undelivered(app, sample_list_xml):
+    """Check that records are only fingerprinted once they are delivered."""
+    _add_header_first_responses(sample_list_xml)
+    with app.app_context():
+        _, records = list_records(url='http://export.arxiv.org/oai2',
+                                  metadata_prefix='arXiv',
+                                  skip_unchanged=True, stream=True)
+        batches = records.batches()
+        assert len(next(batches)) == 150
+        # The receivers failed
+        batches.close()
+
+        request, records = list_records(url='http://export.arxiv.org/oai2',
+                                        metadata_prefix='arXiv',
+                                        skip_unchanged=True)
+        assert len(records) == 150
+        assert request.stats['suppressed'] == 0
+
+
+@responses.activate
+def test_list_records_lastrun_granularity(app, sample_config, sample_list_xml,
+                                          sample_identify_xml):
+    """Check that lastrun is the latest datestamp, to the second."""
+    from invenio_db import db
+
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    _add_identify_response(sample_identify_xml, 'YYYY-MM-DDThh:mm:ssZ')
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=ListRecords.*'),
+        body=sample_list_xml.replace(
+            '<datestamp>2015-01-16</datestamp>',
+            '<datestamp>2015-01-16T10:20:30Z</datestamp>', 1
+        ),
+        content_type='text/xml'
+    )
+    with app.app_context():
+        source = get_oaiharvest_object(sample_config)
+        source.lastrun = datetime.datetime(2015, 1, 15, 8, 0, 5)
+        source.save()
+        db.session.commit()
+
+        _, records = list_records(name=sample_config)
+        assert len(records) == 150
+        assert 'from=2015-01-15T08%3A00%3A05Z' in \
+            responses.calls[-1].request.url
+        assert get_oaiharvest_object(sample_config).lastrun == \
+            datetime.datetime(2015, 1, 16, 10, 20, 30)
+
+
+@responses.activate
+def test_get_records_concurrency(app, sample_list_xml):
+    """Check that records are fetched in parallel, in order."""
+    from sickle.oaiexceptions import IdDoesNotExist
+
+    served = _add_header_first_responses(sample_list_xml)
+    identifiers = sorted(served)[:40]
+    with app.app_context():
+        request, records = get_records(identifiers, 'arXiv',
+                                       url='http://export.arxiv.org/oai2',
+                                       concurrency=4)
+        assert [r.header.identifier for r in records] == identifiers
+
+        with pytest.raises(IdDoesNotExist):
+            get_records(identifiers[:2] + ['oai:arXiv.org:missing'], 'arXiv',
+                        url='http://export.arxiv.org/oai2', concurrency=4)
+
+        request, records = get_records(
+            ['oai:arXiv.org:missing'] + identifiers, 'arXiv',
+            url='http://export.arxiv.org/oai2', concurrency=4, stream=True,
+            raise_on_error=False
+        )
+        assert not isinstance(records, list)
+        assert [r.header.identifier for r in records] == identifiers
+        assert list(request.errors) == ['oai:arXiv.org:missing']
+        assert isinstance(request.errors['oai:arXiv.org:missing'],
+                          IdDoesNotExist)
+        assert request.stats['errors'] == 1
@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the HTTP response cache of OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import responses
+
+from invenio_oaiharvester import get_records
+from invenio_oaiharvester.httpcache import ResponseCache, cache_key, \
+    get_response_cache
+
+
+def test_cache_key():
+    """Test that the key does not depend on the order of the arguments."""
+    url = 'http://export.arxiv.org/oai2'
+    assert cache_key(url, {'verb': 'Identify', 'a': 1}) == \
+        cache_key(url, {'a': 1, 'verb': 'Identify'})
+    assert cache_key(url, {'verb': 'Identify'}) != \
+        cache_key(url + '/', {'verb': 'Identify'})
+
+
+def test_eviction(tmpdir):
+    """Test that the least recently used responses are evicted."""
+    cache = ResponseCache(str(tmpdir), max_size=25)
+    cache.put('a', b'a' * 10)
+    cache.put('b', b'b' * 10)
+    cache.put('c', b'a' * 10)  # same content as 'a'
+    entry = cache.get('a')
+    assert cache.read('a', entry) == b'a' * 10
+
+    cache.put('d', b'd' * 10)
+    assert cache.get('b') is None
+    assert cache.get('a') is not None
+    assert cache.get('c') is not None
+    assert cache.get('d') is not None
+    assert cache.get_stats()['hits'] == 1
+
+
+@responses.activate
+def test_revalidation(app, sample_record_xml, tmpdir):
+    """Test that cached responses are revalidated with their ETag."""
+    url = 'http://export.arxiv.org/oai2'
+    responses.add(responses.GET, url, body=sample_record_xml,
+                  content_type='text/xml', headers={'ETag': '"v1"'})
+    responses.add(responses.GET, url, status=304)
+    app.config.update(OAIHARVESTER_HTTP_CACHE=True,
+                      OAIHARVESTER_WORKDIR=str(tmpdir))
+    with app.app_context():
+        request, first = get_records(['oai:arXiv.org:1507.03011'], url=url)
+        request, second = get_records(['oai:arXiv.org:1507.03011'], url=url)
+        assert len(first) == len(second) == 1
+        assert first[0].raw == second[0].raw
+        assert 'If-None-Match' not in responses.calls[0].request.headers
+        assert responses.calls[1].request.headers['If-None-Match'] == '"v1"'
+        assert request.stats['cache_revalidations'] == 1
+
+        stats = get_response_cache().get_stats()
+        assert stats['misses'] == 1
+        assert stats['revalidations'] == 1
+        assert stats['hit_ratio'] == 0.5
+
+
+@responses.activate
+def test_max_age(app, sample_record_xml, tmpdir):
+    """Test that fresh responses are served without any request."""
+    url = 'http://export.arxiv.org/oai2'
+    responses.add(responses.GET, url, body=sample_record_xml,
+                  content_type='text/xml')
+    app.config.update(OAIHARVESTER_HTTP_CACHE=True,
+                      OAIHARVESTER_HTTP_CACHE_MAX_AGE=3600,
+                      OAIHARVESTER_WORKDIR=str(tmpdir))
+    with app.app_context():
+        for _ in range(3):
+            request, records = get_records(['oai:arXiv.org:1507.03011'],
+                                           url=url)
+            assert len(records) == 1
+        assert len(responses.calls) == 1
+        assert request.stats['cache_hits'] == 1
+        assert request.stats.to_dict().get('requests', 0) == 0
@@ -0,0 +1,83 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the offset index of OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import os
+
+import pytest
+
+from invenio_oaiharvester.index import INDEX_FILE_NAME, RecordIndex, \
+    record_header
+from invenio_oaiharvester.utils import write_to_dir
+
+RECORD = (
+    u'<record xmlns="http://www.openarchives.org/OAI/2.0/"><header>'
+    u'<identifier>oai:example.org:{0}</identifier>'
+    u'<datestamp>2016-05-0{1}</datestamp></header>'
+    u'<metadata>{2}</metadata></record>'
+)
+
+
+@pytest.mark.parametrize('compression', [None, 'gzip', 'zstd'])
+def test_index(app, tmpdir, compression):
+    """Test that the records are read back from the indexed files."""
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    records = [RECORD.format(i, i % 9 + 1, u'é' * i) for i in range(10)]
+    with app.app_context():
+        files, total = write_to_dir(records, tmpdir.strpath, max_records=4,
+                                    compression=compression, index=True)
+    assert os.path.exists(tmpdir.join(INDEX_FILE_NAME).strpath)
+
+    with RecordIndex.open(tmpdir.strpath) as index:
+        assert len(index) == 10
+        entry = index.lookup('oai:example.org:5')
+        assert entry.file == os.path.basename(files[1])
+        assert entry.datestamp == '2016-05-06'
+        for i, record in enumerate(records):
+            assert index.read('oai:example.org:{0}'.format(i)) == \
+                record.encode('utf-8')
+        assert index.lookup('oai:example.org:10') is None
+        assert index.read('oai:example.org:10') is None
+
+
+def test_index_replaces_records(app, tmpdir):
+    """Test that the latest harvest of a record is indexed."""
+    with app.app_context():
+        write_to_dir([RECORD.format(0, 1, 'first')], tmpdir.strpath,
+                     index=True)
+        files, total = write_to_dir([RECORD.format(0, 2, 'second')],
+                                    tmpdir.strpath, index=True)
+    with RecordIndex.open(tmpdir.strpath) as index:
+        assert len(index) == 1
+        assert index.lookup('oai:example.org:0').file == \
+            os.path.basename(files[0])
+        assert b'second' in index.read('oai:example.org:0')
+
+
+def test_record_header():
+    """Test the headers of records given as strings."""
+    assert record_header(RECORD.format(1, 2, '')) == \
+        ('oai:example.org:1', '2016-05-02')
+    assert record_header(b'<record><header><identifier>a</identifier>'
+                         b'</header></record>') == (None, None)
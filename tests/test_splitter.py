@@ -0,0 +1,98 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the record splitter of OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import glob
+import mmap
+import os
+
+import pytest
+from lxml import etree
+
+from invenio_oaiharvester.errors import InvenioOAIHarvesterError
+from invenio_oaiharvester.splitter import RecordSplitter, split_records
+from invenio_oaiharvester.utils import record_extraction_from_string
+
+
+def _equivalent(first, second):
+    """Check that two parsed elements have the same content."""
+    return (first.tag == second.tag and first.attrib == second.attrib and
+            first.text == second.text and first.tail == second.tail and
+            len(first) == len(second) and
+            all(_equivalent(a, b) for a, b in zip(first, second)))
+
+
+def test_split_records(app):
+    """Test that the records are equivalent to the serialized ones."""
+    paths = glob.glob(os.path.join(os.path.dirname(__file__), 'data/*.xml'))
+    with app.app_context():
+        for path in paths:
+            with open(path, 'rb') as f:
+                data = f.read()
+            for namespace in ('http://www.openarchives.org/OAI/2.0/', ''):
+                expected = record_extraction_from_string(data, namespace)
+                records = list(split_records(data, namespace))
+                assert len(records) == len(expected)
+                for record, serialized in zip(records, expected):
+                    assert _equivalent(etree.fromstring(record),
+                                       etree.fromstring(serialized))
+
+
+def test_offsets(app):
+    """Test the boundaries of the records in a mapped file."""
+    path = os.path.join(os.path.dirname(__file__),
+                        'data/sample_inspire_response_listrecords.xml')
+    with open(path, 'rb') as f:
+        data = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        splitter = RecordSplitter(data)
+        slices = list(splitter)
+        assert len(slices) == 2
+        for view, (start, end) in zip(slices, splitter.offsets()):
+            assert isinstance(view, memoryview)
+            assert view.tobytes() == data[start:end]
+            assert view.tobytes().startswith(b'<record>')
+            assert not view.tobytes().strip().endswith(b'</marc:record>')
+        del view, slices, splitter
+        data.close()
+
+
+def test_split_records_markup():
+    """Test that comments, CDATA sections and nested records are skipped."""
+    data = b'''<?xml version="1.0" encoding="UTF-8"?>
+<OAI-PMH xmlns="http://www.openarchives.org/OAI/2.0/"
+         xmlns:oai="http://www.openarchives.org/OAI/2.0/">
+<ListRecords><!-- <record> -->
+<oai:record xmlns:x="urn:x"><header><identifier>a</identifier></header>
+<metadata><x:record><x:record/></x:record><![CDATA[</record>]]></metadata>
+</oai:record><record><header><identifier>b</identifier></header></record>
+</ListRecords></OAI-PMH>'''
+    records = [etree.fromstring(r) for r in split_records(data)]
+    assert [r.findtext('.//{*}identifier') for r in records] == ['a', 'b']
+    assert records[0].find('.//{*}metadata')[0].tail == '</record>'
+    assert len(records[0].findall('.//{urn:x}record')) == 2
+
+
+def test_split_records_encoding():
+    """Test that only UTF-8 documents can be split."""
+    with pytest.raises(InvenioOAIHarvesterError):
+        RecordSplitter(b'<?xml version="1.0" encoding="ISO-8859-1"?><a/>')
@@ -83,3 +83,77 @@ def test_list_records_from_dates(app, sample_list_xml):
             )
     finally:
         oaiharvest_finished.disconnect(bar)
+
+
+@responses.activate
+def test_list_records_from_dates_stream(app, sample_list_xml):
+    """Check that signals are sent per chunk when streaming."""
+    sizes = []
+
+    def baz(request, records, name):
+        sizes.append(len(records))
+
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    oaiharvest_finished.connect(baz)
+    try:
+        with app.app_context():
+            app.config['OAIHARVESTER_STREAM_CHUNK_SIZE'] = 100
+            list_records_from_dates(
+                metadata_prefix='arXiv',
+                from_date='2015-01-15',
+                until_date='2015-01-20',
+                url='http://export.arxiv.org/oai2',
+                name=None,
+                setspecs='physics',
+                stream=True
+            )
+        assert sizes == [100, 50]
+    finally:
+        oaiharvest_finished.disconnect(baz)
+
+
+@responses.activate
+def test_list_records_from_dates_failing_receiver(app, sample_config,
+                                                  sample_list_xml,
+                                                  sample_identify_xml):
+    """Check that the harvest is not committed if a receiver fails."""
+    from invenio_oaiharvester.models import OAIHarvestCheckpoint
+    from invenio_oaiharvester.utils import get_oaiharvest_object
+
+    sizes = []
+
+    def fail(request, records, name):
+        sizes.append(len(records))
+        if len(sizes) == 2:
+            raise ValueError('Receiver failed')
+
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*verb=Identify.*'),
+        body=sample_identify_xml,
+        content_type='text/xml'
+    )
+    responses.add(
+        responses.GET,
+        re.compile(r'http?://export.arxiv.org/oai2.*set=physics.*'),
+        body=sample_list_xml,
+        content_type='text/xml'
+    )
+    oaiharvest_finished.connect(fail)
+    try:
+        with app.app_context():
+            app.config['OAIHARVESTER_STREAM_CHUNK_SIZE'] = 100
+            last_updated = get_oaiharvest_object(sample_config).lastrun
+            with pytest.raises(ValueError):
+                list_records_from_dates(name=sample_config, stream=True)
+            assert sizes == [100, 50]
+            assert get_oaiharvest_object(sample_config).lastrun == \
+                last_updated
+            assert OAIHarvestCheckpoint.query.count() == 1
+    finally:
+        oaiharvest_finished.disconnect(fail)
@@ -19,13 +19,22 @@
 
 """Test for utilities used by OAI harvester."""
 
+import gzip
 import os
 
-from mock import MagicMock, PropertyMock
+import pytest
+from lxml import etree
+from mock import MagicMock, PropertyMock, patch
+from sickle.models import Record
 
+from invenio_oaiharvester.splitter import split_records
 from invenio_oaiharvester.utils import check_or_create_dir, create_file_name, \
     get_identifier_names, identifier_extraction_from_string, \
-    record_extraction_from_file, record_extraction_from_string, write_to_dir
+    identifier_extraction_from_strings, \
+    iter_record_extraction_from_file, open_harvested_file, plan_date_windows, \
+    record_extraction_from_dir, record_extraction_from_file, \
+    record_extraction_from_string, \
+    record_fingerprint, write_to_dir
 
 
 def test_identifier_extraction(app):
@@ -52,6 +61,92 @@ def test_identifier_extraction_with_namespace(app):
         assert result == "identifier1"
 
 
+def test_identifier_extraction_fallback(app):
+    """Test the documents whose identifier is not found by the fast path."""
+    ns = 'xmlns="http://www.openarchives.org/OAI/2.0/"'
+    samples = [
+        ("<a {0}><!-- <identifier>x</identifier> -->"
+         "<identifier>y</identifier></a>".format(ns), "y"),
+        ("<a {0}><identifier>a&amp;b</identifier></a>".format(ns), "a&b"),
+        ("<a {0}><identifier/><identifier>z</identifier></a>".format(ns),
+         None),
+        ("<a {0}><b xmlns='urn:x'><identifier>w</identifier></b>"
+         "<identifier>r</identifier></a>".format(ns), "r"),
+        ("<a xmlns:o='http://www.openarchives.org/OAI/2.0/'>"
+         "<identifier>n</identifier><o:identifier>o</o:identifier></a>", "o"),
+        ("<a {0}>{1}<identifier>far</identifier></a>".format(
+            ns, "<x>padding</x>" * 10000), "far"),
+        ("<a {0}><x/></a>".format(ns), None),
+        ("<a {0}><identifier a='x>y'>ID</identifier></a>".format(ns), "ID"),
+        ("<a><b {0}/><identifier>s</identifier></a>".format(ns), None),
+        ("<a><b {0}></b><c t='xmlns=\"x\"'/><identifier>s</identifier>"
+         "</a>".format(ns), None),
+        ("<?xml version='1.0'?><a><b {0}><identifier>t</identifier></b>"
+         "</a>".format(ns), "t"),
+        ("<a {0}><b t='xmlns=\"x\"'><identifier>q</identifier></b>"
+         "</a>".format(ns), "q"),
+        ("<a xmlns='urn:x'><b {0}><identifier>u</identifier></b>"
+         "</a>".format(ns), "u"),
+        ("<a {0}><b xmlns='urn:x'><identifier>v</identifier></b>"
+         "</a>".format(ns), None),
+    ]
+    with app.app_context():
+        for xml_sample, identifier in samples:
+            assert identifier_extraction_from_string(xml_sample) == \
+                identifier
+            assert identifier_extraction_from_string(
+                xml_sample.encode("utf-8")) == identifier
+            # Same result as a full parse
+            node = etree.fromstring(xml_sample).find(
+                ".//{http://www.openarchives.org/OAI/2.0/}identifier"
+            )
+            assert (node.text if node is not None else None) == identifier
+
+
+def test_identifier_extraction_fast_path(app):
+    """Test that the identifiers of harvested records are not parsed."""
+    data_dir = os.path.join(os.path.dirname(__file__), "data")
+    with open(os.path.join(
+            data_dir, "sample_arxiv_response_listrecords_physics.xml"),
+            "rb") as f:
+        raw_xml = f.read()
+    split = list(split_records(raw_xml))
+    sickle = [
+        Record(element).raw for element in etree.fromstring(raw_xml).iterfind(
+            ".//{http://www.openarchives.org/OAI/2.0/}record")
+    ]
+    with app.app_context():
+        expected = list(identifier_extraction_from_strings(
+            record_extraction_from_string(raw_xml)))
+        with patch("invenio_oaiharvester.utils._parse_identifier") as parse:
+            assert list(identifier_extraction_from_strings(split)) == \
+                expected
+            assert list(identifier_extraction_from_strings(sickle)) == \
+                expected
+            assert not parse.called
+        assert None not in expected
+
+        xml_sample = ("<a xmlns='http://www.openarchives.org/OAI/2.0/'>"
+                      "<identifier>a\r\nb\rc</identifier></a>")
+        assert identifier_extraction_from_string(xml_sample) == "a\nb\nc"
+        assert etree.fromstring(xml_sample)[0].text == "a\nb\nc"
+
+
+def test_identifier_extraction_from_strings(app):
+    """Test extracting the identifiers of several records."""
+    with app.app_context():
+        raw_xml = open(os.path.join(
+            os.path.dirname(__file__),
+            "data/sample_inspire_response_listrecords.xml"
+        ), "rb").read()
+        records = record_extraction_from_string(raw_xml)
+        assert list(identifier_extraction_from_strings(records)) == [
+            "oai:inspirehep.net:972855", "oai:inspirehep.net:974318"
+        ]
+        assert list(identifier_extraction_from_strings(
+            records, oai_namespace="")) == [None, None]
+
+
 def test_records_extraction_without_namespace(app):
     """Test extracting records from OAI XML without a namespace."""
     with app.app_context():
@@ -93,6 +188,105 @@ def test_records_extraction_from_file(app):
         assert len(record_extraction_from_file(path_tmp)) == 1
 
 
+def test_iter_records_extraction_from_file(app):
+    """Test extracting records incrementally from paths and file objects."""
+    with app.app_context():
+        for name, namespace in (
+                ("sample_inspire_response_listrecords.xml",
+                 "http://www.openarchives.org/OAI/2.0/"),
+                ("sample_arxiv_response_no_namespace.xml", "")):
+            path = os.path.join(os.path.dirname(__file__), "data", name)
+            with open(path, "rb") as f:
+                expected = record_extraction_from_string(f.read(), namespace)
+            records = iter_record_extraction_from_file(path, namespace)
+            assert not isinstance(records, list)
+            assert list(records) == expected
+            with open(path, "rb") as f:
+                assert list(
+                    iter_record_extraction_from_file(f, namespace)
+                ) == expected
+
+
+def test_records_extraction_from_compressed_file(app, tmpdir):
+    """Test extracting records from compressed and memory-mapped files."""
+    path = os.path.join(os.path.dirname(__file__),
+                        "data/sample_inspire_response_listrecords.xml")
+    with open(path, "rb") as f:
+        raw_xml = f.read()
+    gzip_path = str(tmpdir.join("records.xml.gz"))
+    with gzip.open(gzip_path, "wb") as f:
+        f.write(raw_xml)
+
+    with app.app_context():
+        expected = record_extraction_from_string(raw_xml)
+        assert record_extraction_from_file(gzip_path) == expected
+        with open_harvested_file(gzip_path) as f:
+            assert f.read() == raw_xml
+
+        records = list(iter_record_extraction_from_file(path, split=True))
+        assert len(records) == len(expected)
+        assert [etree.fromstring(r).findtext(".//{*}identifier")
+                for r in records] == [
+            etree.fromstring(r).findtext(".//{*}identifier")
+            for r in expected
+        ]
+
+
+def test_records_extraction_from_zstd_file(app, tmpdir):
+    """Test extracting records from a Zstandard compressed file."""
+    zstandard = pytest.importorskip("zstandard")
+    path = os.path.join(os.path.dirname(__file__),
+                        "data/sample_inspire_response_listrecords.xml")
+    with open(path, "rb") as f:
+        raw_xml = f.read()
+    zstd_path = str(tmpdir.join("records.xml.zst"))
+    with open(zstd_path, "wb") as f:
+        f.write(zstandard.ZstdCompressor().compress(raw_xml))
+
+    with app.app_context():
+        assert record_extraction_from_file(zstd_path) == \
+            record_extraction_from_string(raw_xml)
+
+
+def test_records_extraction_from_dir(app, tmpdir):
+    """Test extracting the records of a directory in parallel."""
+    data = os.path.join(os.path.dirname(__file__), "data")
+    names = ["sample_arxiv_response_listrecords_cs.xml",
+             "sample_arxiv_response_listrecords_physics.xml",
+             "sample_inspire_response_listrecords.xml"]
+    for index, name in enumerate(names * 2):
+        tmpdir.join("{0}_{1}.xml".format(index, name)).write_binary(
+            open(os.path.join(data, name), "rb").read()
+        )
+    tmpdir.join("3_invalid.xml").write("<ListRecords>")
+    tmpdir.join("manifest.json").write("{}")
+
+    with app.app_context():
+        extracted = list(record_extraction_from_dir(tmpdir.strpath))
+        assert [os.path.basename(e.path) for e in extracted] == sorted(
+            os.path.basename(e.path) for e in extracted
+        )
+        assert len(extracted) == 7
+        errors = [e for e in extracted if e.error is not None]
+        assert len(errors) == 1
+        assert errors[0].path.endswith("3_invalid.xml")
+        assert errors[0].records == []
+        assert "3_invalid.xml" in str(errors[0].error)
+        assert sum(len(e.records) for e in extracted) == 2 * (46 + 150 + 2)
+
+        parallel = list(record_extraction_from_dir(tmpdir.strpath, workers=2))
+        assert [(e.path, e.records) for e in parallel] == \
+            [(e.path, e.records) for e in extracted]
+
+        unordered = list(record_extraction_from_dir(
+            tmpdir.strpath, workers=2, ordered=False, split=True
+        ))
+        assert sorted(e.path for e in unordered) == [
+            e.path for e in extracted
+        ]
+        assert sum(len(e.records) for e in unordered) == 2 * (46 + 150 + 2)
+
+
 def test_identifier_filter():
     """oaiharvest - testing identifier filter."""
     sample = "oai:mysite.com:1234"
@@ -110,6 +304,50 @@ def test_identifier_filter():
     assert get_identifier_names(None) == []
 
 
+def test_plan_date_windows():
+    """oaiharvest - testing date windows."""
+    assert plan_date_windows('2015-01-01', '2015-01-10', 3) == [
+        ('2015-01-01', '2015-01-04'),
+        ('2015-01-05', '2015-01-08'),
+        ('2015-01-09', '2015-01-10'),
+    ]
+    assert plan_date_windows('2015-01-01', '2015-01-02', 5) == [
+        ('2015-01-01', '2015-01-01'),
+        ('2015-01-02', '2015-01-02'),
+    ]
+    assert plan_date_windows('2015-01-01T10:00:00Z', '2015-01-01', 2) == [
+        ('2015-01-01', '2015-01-01'),
+    ]
+    assert plan_date_windows('2015-01-02', '2015-01-01', 2) == []
+
+
+def test_record_fingerprint():
+    """Test that fingerprints only depend on the record metadata."""
+    def record(datestamp, metadata, status=''):
+        return Record(etree.fromstring(
+            '<record xmlns="http://www.openarchives.org/OAI/2.0/" '
+            'xmlns:dc="http://purl.org/dc/elements/1.1/">'
+            '<header{0}><identifier>oai:x:1</identifier>'
+            '<datestamp>{1}</datestamp></header>{2}</record>'.format(
+                status, datestamp, metadata
+            )
+        ))
+
+    first = record('2015-01-16', '<metadata><dc:title a="1" b="2">A'
+                                 '</dc:title></metadata>')
+    second = record('2015-01-17', '<metadata><dc:title xmlns:dc='
+                                  '"http://purl.org/dc/elements/1.1/" '
+                                  'b="2" a="1">A</dc:title></metadata>')
+    assert record_fingerprint(first) == record_fingerprint(second)
+    assert len(record_fingerprint(first)) == 64
+
+    changed = record('2015-01-16', '<metadata><dc:title>B</dc:title>'
+                                   '</metadata>')
+    deleted = record('2015-01-16', '', ' status="deleted"')
+    assert record_fingerprint(changed) != record_fingerprint(first)
+    assert record_fingerprint(deleted) != record_fingerprint(first)
+
+
 def test_check_or_create_dir(app, tmpdir):
     """oaiharvest - testing dir creation."""
     with app.app_context():
@@ -0,0 +1,138 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2016 CERN.
+#
+# Invenio is free software; you can redistribute it and/or
+# modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be useful, but
+# WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the Free Software Foundation, Inc.,
+# 59 Temple Place, Suite 330, Boston, MA 02111-1307, USA.
+
+
+"""Test for the record writer of OAI harvester."""
+
+from __future__ import absolute_import, print_function
+
+import hashlib
+import json
+import os
+
+import pytest
+
+from invenio_oaiharvester.errors import InvenioOAIHarvesterError
+from invenio_oaiharvester.utils import open_harvested_file, \
+    record_extraction_from_file, write_to_dir
+from invenio_oaiharvester.writer import RecordWriter
+
+RECORD = (
+    '<record xmlns="http://www.openarchives.org/OAI/2.0/"><header>'
+    '<identifier>oai:example.org:{0}</identifier></header></record>'
+)
+
+
+def test_rotation(app, tmpdir):
+    """Test that files are rotated by records and bytes."""
+    with app.app_context():
+        with RecordWriter(tmpdir.strpath, max_records=4) as writer:
+            for index in range(10):
+                writer.write(RECORD.format(index))
+                # Only complete files have their final name
+                assert sorted(
+                    name for name in os.listdir(tmpdir.strpath)
+                    if not name.endswith('.part')
+                ) == sorted(os.path.basename(f) for f in writer.files)
+        assert len(writer.files) == 3
+        assert writer.total == 10
+        assert all(f.endswith('.xml') for f in writer.files)
+        assert [len(record_extraction_from_file(f))
+                for f in writer.files] == [4, 4, 2]
+
+        size = len(RECORD.format(0))
+        files, total = write_to_dir(
+            (RECORD.format(i) for i in range(10)),
+            tmpdir.join('bytes').strpath, max_bytes=3 * size
+        )
+        assert total == 10
+        assert [len(record_extraction_from_file(f)) for f in files] == \
+            [3, 3, 3, 1]
+
+        assert write_to_dir(iter([]), tmpdir.join('empty').strpath) == \
+            ([], 0)
+
+
+@pytest.mark.parametrize('compression,suffix', [
+    ('gzip', '.xml.gz'),
+    ('zstd', '.xml.zst'),
+])
+def test_compression(app, tmpdir, compression, suffix):
+    """Test that the files are compressed."""
+    if compression == 'zstd':
+        pytest.importorskip('zstandard')
+    with app.app_context():
+        files, total = write_to_dir(
+            [RECORD.format(i) for i in range(5)], tmpdir.strpath,
+            max_records=3, compression=compression
+        )
+        assert total == 5
+        assert all(f.endswith(suffix) for f in files)
+        with open_harvested_file(files[0]) as f:
+            content = f.read()
+        assert content.startswith(b'<ListRecords>')
+        assert content.endswith(b'</ListRecords>')
+        assert [len(record_extraction_from_file(f)) for f in files] == [3, 2]
+
+
+def test_file_names_and_manifest(app, tmpdir):
+    """Test the names of the files of a run and its manifest."""
+    with app.app_context():
+        with RecordWriter(tmpdir.strpath, max_records=2,
+                          run_id='run1') as writer:
+            for index in range(5):
+                writer.write(RECORD.format(index))
+        names = [os.path.basename(f) for f in writer.files]
+        assert names == sorted(names)
+        assert all(name.startswith(writer.prefix) for name in names)
+        assert [name[-len('000001.xml'):] for name in names] == \
+            ['000001.xml', '000002.xml', '000003.xml']
+        assert writer.prefix.endswith('_run1')
+        assert sorted(os.listdir(tmpdir.strpath)) == sorted(
+            names + [os.path.basename(writer.manifest)]
+        )
+
+        with open(writer.manifest) as f:
+            manifest = json.load(f)
+        assert manifest['run_id'] == 'run1'
+        assert manifest['records'] == 5
+        assert [entry['name'] for entry in manifest['files']] == names
+        assert [entry['records'] for entry in manifest['files']] == [2, 2, 1]
+        for path, entry in zip(writer.files, manifest['files']):
+            with open(path, 'rb') as f:
+                content = f.read()
+            assert entry['size'] == len(content)
+            assert entry['sha256'] == hashlib.sha256(content).hexdigest()
+
+        # Runs never overwrite each other
+        files, total = write_to_dir(
+            [RECORD.format(0)], tmpdir.strpath, max_records=2
+        )
+        assert not set(files) & set(writer.files)
+
+        # No manifest without files
+        empty = RecordWriter(tmpdir.join('empty').strpath)
+        empty.close()
+        assert empty.manifest is None
+
+
+def test_unknown_compression(app, tmpdir):
+    """Test that unknown compressions are refused."""
+    with pytest.raises(InvenioOAIHarvesterError):
+        RecordWriter(tmpdir.strpath, compression='lzma')